@@ -1,6 +1,9 @@
 # backend/auth.py - VERSIÓN CORREGIDA CON DIAGNÓSTICO
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, NamedTuple
+from collections import OrderedDict
+import threading
+import time
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -19,12 +22,17 @@ load_dotenv()
 SECRET_KEY = os.getenv('SECRET_KEY', 'fallback-secret-key')
 ALGORITHM = os.getenv('ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 30))
+# Caché de autenticación (por proceso): claims JWT y snapshot de usuario
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', 5000))
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv('AUTH_USER_CACHE_TTL_SECONDS', 60))
+# Coste bcrypt: si cambia, los hashes antiguos se regeneran en el siguiente login correcto
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
 
 # SOLUCIÓN: Usar bcrypt con configuración compatible
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
-    bcrypt__rounds=12,
+    bcrypt__rounds=BCRYPT_ROUNDS,
     bcrypt__ident="2b"
 )
 
@@ -49,6 +57,103 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+class UserSnapshot(NamedTuple):
+    """Datos mínimos del usuario autenticado (sin sesión ORM asociada)."""
+    id: str
+    email: str
+    full_name: Optional[str]
+    is_active: bool
+
+# ===== CACHÉ DE AUTENTICACIÓN =====
+
+class AuthCache:
+    """
+    Cachés LRU acotadas para get_current_user:
+    - claims JWT decodificados, indexados por la firma del token (hasta su 'exp');
+    - snapshot del usuario por email, con TTL corto e invalidación explícita.
+
+    Es por proceso: invalidate_user solo limpia la caché del worker que lo llama.
+    En los demás workers de gunicorn un usuario desactivado sigue autenticando
+    como mucho AUTH_USER_CACHE_TTL_SECONDS (los logins nuevos ya se rechazan).
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_MAX_ENTRIES, user_ttl: float = AUTH_USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.user_ttl = user_ttl
+        self._tokens: "OrderedDict[str, tuple]" = OrderedDict()
+        self._users: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+
+    def _put(self, store: OrderedDict, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+
+    def get_token(self, token: str) -> Optional["TokenData"]:
+        signature = token.rsplit(".", 1)[-1]
+        with self._lock:
+            entry = self._tokens.get(signature)
+            if entry is not None:
+                cached_token, token_data, exp = entry
+                if cached_token == token and exp > time.time():
+                    self._tokens.move_to_end(signature)
+                    self.token_hits += 1
+                    return token_data
+                del self._tokens[signature]
+            self.token_misses += 1
+            return None
+
+    def put_token(self, token: str, token_data: "TokenData", exp: float):
+        with self._lock:
+            self._put(self._tokens, token.rsplit(".", 1)[-1], (token, token_data, exp))
+
+    def get_user(self, email: str) -> Optional[UserSnapshot]:
+        with self._lock:
+            entry = self._users.get(email)
+            if entry is not None:
+                snapshot, expires_at = entry
+                if expires_at > time.time():
+                    self._users.move_to_end(email)
+                    self.user_hits += 1
+                    return snapshot
+                del self._users[email]
+            self.user_misses += 1
+            return None
+
+    def put_user(self, snapshot: UserSnapshot):
+        with self._lock:
+            self._put(self._users, snapshot.email, (snapshot, time.time() + self.user_ttl))
+
+    def invalidate_user(self, email: str):
+        with self._lock:
+            self._users.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+    def stats(self) -> dict:
+        token_total = self.token_hits + self.token_misses
+        user_total = self.user_hits + self.user_misses
+        return {
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "token_hit_ratio": round(self.token_hits / token_total, 4) if token_total else 0.0,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "user_hit_ratio": round(self.user_hits / user_total, 4) if user_total else 0.0,
+            "token_entries": len(self._tokens),
+            "user_entries": len(self._users),
+        }
+
+auth_cache = AuthCache()
+
 # ===== FUNCIONES DE UTILIDAD CORREGIDAS =====
 
 def verify_password(plain_password, hashed_password):
@@ -98,7 +203,7 @@ def get_password_hash(password):
             password = password[:72]
         
         # Usar bcrypt directamente
-        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12))
+        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
         return hashed.decode('utf-8')
     except Exception as e:
         logger.error(f"Error hasheando contraseña: {e}")
@@ -106,6 +211,17 @@ def get_password_hash(password):
         import hashlib
         return f"sha256:{hashlib.sha256(password.encode()).hexdigest()}"
 
+def needs_rehash(hashed_password: str) -> bool:
+    """True si el hash no es bcrypt o usa un coste distinto de BCRYPT_ROUNDS."""
+    # Formato: $2b$12$<salt+hash>
+    parts = (hashed_password or "").split("$")
+    if len(parts) < 4 or not parts[1].startswith("2"):
+        return True
+    try:
+        return int(parts[2]) != BCRYPT_ROUNDS
+    except ValueError:
+        return True
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -117,51 +233,92 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def decode_token(token: str):
+    cached = auth_cache.get_token(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             return None
-        return TokenData(email=email)
+        token_data = TokenData(email=email)
+        if payload.get("exp"):
+            auth_cache.put_token(token, token_data, float(payload["exp"]))
+        return token_data
     except JWTError:
         return None
 
-def authenticate_user(db: Session, email: str, password: str):
-    """Autenticar usuario - VERSIÓN CON DIAGNÓSTICO COMPLETO"""
+def _decode_or_401(token: str) -> TokenData:
+    token_data = decode_token(token)
+    if not token_data:
+        raise HTTPException(
+            status_code=401,
+            detail="No se pudieron validar las credenciales",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_data
+
+def _user_snapshot_query(email: str):
+    from sqlalchemy import select
     from backend.models import User
+    return select(User.id, User.email, User.full_name, User.is_active).where(User.email == email)
+
+def _remember_snapshot(row) -> UserSnapshot:
+    if not row:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    snapshot = UserSnapshot(id=row.id, email=row.email, full_name=row.full_name, is_active=bool(row.is_active))
+    auth_cache.put_user(snapshot)
+    return snapshot
+
+def _require_active(snapshot: UserSnapshot) -> UserSnapshot:
+    if not snapshot.is_active:
+        raise HTTPException(status_code=401, detail="Usuario inactivo")
+    return snapshot
+
+def resolve_current_user(token: str, db: Session) -> UserSnapshot:
+    """
+    Valida el token y devuelve el snapshot del usuario (usado por get_current_user de las APIs).
+    Solo consulta la base de datos si el usuario no está en caché.
+    """
+    token_data = _decode_or_401(token)
+    snapshot = auth_cache.get_user(token_data.email)
+    if snapshot is None:
+        snapshot = _remember_snapshot(db.execute(_user_snapshot_query(token_data.email)).first())
+    return _require_active(snapshot)
+
+async def aresolve_current_user(token: str, db) -> UserSnapshot:
+    """Igual que resolve_current_user pero con AsyncSession (endpoints async de onco_api)."""
+    token_data = _decode_or_401(token)
+    snapshot = auth_cache.get_user(token_data.email)
+    if snapshot is None:
+        snapshot = _remember_snapshot((await db.execute(_user_snapshot_query(token_data.email))).first())
+    return _require_active(snapshot)
+
+def find_user_for_login(db: Session, email: str):
+    """Buscar el usuario de un intento de login (sin verificar contraseña)"""
+    from backend.models import User, normalize_email
     
     logger.info(f"🔍 authenticate_user llamado con email: '{email}'")
     
-    # DIAGNÓSTICO: ¿Qué está llegando?
-    if email is None or email == "":
+    if email is None or email.strip() == "":
         logger.error("❌ Email es None o vacío!")
-        # Ver todos los usuarios en DB para debugging
-        all_users = db.query(User.email).all()
-        logger.info(f"   Usuarios en DB: {[u[0] for u in all_users]}")
-        return False
-    
-    # Buscar usuario - MÚLTIPLES MÉTODOS
-    user = None
-    
-    # Método 1: Búsqueda exacta
-    user = db.query(User).filter(User.email == email).first()
+        return None
     
-    if not user:
-        logger.warning(f"⚠️  No encontrado con búsqueda exacta. Probando case-insensitive...")
-        # Método 2: Case-insensitive
-        all_users = db.query(User).all()
-        for u in all_users:
-            if u.email.lower() == email.lower():
-                user = u
-                logger.info(f"   ✅ Encontrado por case-insensitive: {u.email}")
-                break
+    # Búsqueda case-insensitive con una sola consulta sobre el índice único de email_lower
+    user = db.query(User).filter(User.email_lower == normalize_email(email)).first()
     
     if not user:
         logger.error(f"❌ Usuario no encontrado en DB para email: '{email}'")
-        logger.info(f"   Total usuarios en DB: {db.query(User).count()}")
-        return False
+        return None
     
     logger.info(f"✅ Usuario encontrado: {user.email}")
+    return user
+
+def authenticate_user(db: Session, email: str, password: str):
+    """Autenticar usuario - VERSIÓN CON DIAGNÓSTICO COMPLETO"""
+    user = find_user_for_login(db, email)
+    if not user:
+        return False
     
     # Verificar contraseña
     if not verify_password(password, user.hashed_password):
@@ -172,20 +329,50 @@ def authenticate_user(db: Session, email: str, password: str):
     logger.info(f"🎉 Autenticación EXITOSA para {user.email}")
     return user
 
-def create_user(db: Session, email: str, password: str, full_name: str = None):
+async def aauthenticate_user(db: Session, email: str, password: str):
+    """
+    Versión async de authenticate_user para los endpoints: bcrypt se ejecuta en
+    el pool de password_service y no bloquea el event loop. Si el hash usa un
+    coste distinto de BCRYPT_ROUNDS, se regenera de forma transparente.
+    """
+    from fastapi.concurrency import run_in_threadpool
+    from backend.services.password_service import password_service
+
+    user = await run_in_threadpool(find_user_for_login, db, email)
+    if not user:
+        return False
+
+    if not await password_service.verify(password, user.hashed_password):
+        logger.error(f"❌ Contraseña incorrecta para {user.email}")
+        return False
+
+    if needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await password_service.hash(password)
+            await run_in_threadpool(db.commit)
+            password_service.rehashed += 1
+            logger.info(f"🔁 Hash de contraseña actualizado a {BCRYPT_ROUNDS} rondas para {user.email}")
+        except Exception as e:
+            await run_in_threadpool(db.rollback)
+            logger.warning(f"⚠️ No se pudo regenerar el hash de {user.email}: {e}")
+
+    logger.info(f"🎉 Autenticación EXITOSA para {user.email}")
+    return user
+
+def create_user(db: Session, email: str, password: str, full_name: str = None, hashed_password: str = None):
     """Crear un nuevo usuario - VERSIÓN MEJORADA"""
-    from backend.models import User
+    from backend.models import User, normalize_email
     import uuid
 
-    # Verificar que el usuario no exista (case-insensitive)
-    existing_user = db.query(User).filter(User.email.ilike(email)).first()
+    # Verificar que el usuario no exista (case-insensitive, por índice)
+    existing_user = db.query(User).filter(User.email_lower == normalize_email(email)).first()
     if existing_user:
         raise HTTPException(
             status_code=400, 
             detail=f"Email '{email}' ya registrado (como '{existing_user.email}')"
         )
 
-    hashed_password = get_password_hash(password)
+    hashed_password = hashed_password or get_password_hash(password)
     new_user = User(
         id=str(uuid.uuid4()),
         email=email,
@@ -201,6 +388,22 @@ def create_user(db: Session, email: str, password: str, full_name: str = None):
     logger.info(f"✅ Usuario creado: {email}")
     return new_user
 
+def deactivate_user(db: Session, email: str):
+    """
+    Desactiva un usuario e invalida su snapshot en la caché de autenticación de
+    este proceso (en los demás workers caduca en AUTH_USER_CACHE_TTL_SECONDS).
+    """
+    from backend.models import User, normalize_email
+
+    user = db.query(User).filter(User.email_lower == normalize_email(email)).first()
+    if not user:
+        return None
+    user.is_active = False
+    db.commit()
+    auth_cache.invalidate_user(user.email)
+    logger.info(f"🚫 Usuario desactivado: {user.email}")
+    return user
+
 # ===== FUNCIONES AUXILIARES =====
 def check_password_strength(password):
     """Verificar fortaleza de contraseña"""
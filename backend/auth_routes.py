@@ -4,6 +4,7 @@ Incluye: registro, login, perfil de usuario
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr
 from datetime import timedelta
@@ -12,13 +13,17 @@ import logging
 
 from backend.database import get_db
 from backend.auth import (
-    authenticate_user,
+    aauthenticate_user,
     create_user,
     create_access_token,
+    deactivate_user,
+    oauth2_scheme,
+    resolve_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     decode_token
 )
 from backend.models import User
+from backend.services.password_service import password_service, PasswordPoolSaturated
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +52,14 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+def _saturated_error() -> HTTPException:
+    logger.warning("⚠️ Pool de contraseñas saturado: login/registro rechazado")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Demasiados intentos de autenticación simultáneos, reintente en unos segundos",
+        headers={"Retry-After": "2"},
+    )
+
 @auth_router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     """
@@ -64,13 +77,18 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         )
     
     try:
-        user = create_user(
-            db=db,
-            email=user_data.email,
-            password=user_data.password,
-            full_name=user_data.full_name
+        hashed_password = await password_service.hash(user_data.password)
+        user = await run_in_threadpool(
+            create_user,
+            db,
+            user_data.email,
+            user_data.password,
+            user_data.full_name,
+            hashed_password
         )
         return user
+    except PasswordPoolSaturated:
+        raise _saturated_error()
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -91,7 +109,10 @@ async def login(request: Request, db: Session = Depends(get_db)):
     username = form.get("username")
     password = form.get("password")
 
-    user = authenticate_user(db, username, password)
+    try:
+        user = await aauthenticate_user(db, username, password)
+    except PasswordPoolSaturated:
+        raise _saturated_error()
     
     if not user:
         raise HTTPException(
@@ -159,6 +180,24 @@ async def get_current_user_info(request: Request, db: Session = Depends(get_db))
             detail=str(e)
         )
 
+@auth_router.delete("/me", response_model=UserResponse)
+async def deactivate_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """
+    Dar de baja la cuenta del usuario actual
+
+    El usuario queda inactivo (no se borran sus datos) y su token deja de
+    valer en este worker al instante; en el resto, al caducar la caché de
+    autenticación (AUTH_USER_CACHE_TTL_SECONDS).
+    """
+    snapshot = await run_in_threadpool(resolve_current_user, token, db)
+    user = await run_in_threadpool(deactivate_user, db, snapshot.email)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuario no encontrado"
+        )
+    return user
+
 @auth_router.get("/verify")
 async def verify_token(request: Request, db: Session = Depends(get_db)):
     """
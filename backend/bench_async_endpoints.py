@@ -0,0 +1,161 @@
+"""
+Benchmark: endpoints síncronos (threadpool) vs async (AsyncSession + ainvoke).
+
+Levanta onco_api en proceso contra una BD temporal, sustituye el LLM por uno
+falso con latencia fija y lanza N peticiones concurrentes contra /api/chat y
+/history en sus dos versiones. Las versiones síncronas son copias de la
+implementación anterior registradas en /legacy/*.
+
+Uso:
+    python backend/bench_async_endpoints.py [concurrencia]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# BD temporal y servicios en segundo plano desactivados antes de importar la app
+_tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["ALERT_SCANNER_ENABLED"] = "0"
+os.environ.pop("GEMINI_API_KEY", None)
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import anyio
+import httpx
+from fastapi import Depends
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from backend import onco_api
+from backend.database import get_db
+from backend.models import SessionLog, Patient
+from backend.services.langchain_manager import langchain_agent
+
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "0.3"))
+CONCURRENCY = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+
+def _fake_llm(messages):
+    time.sleep(LLM_LATENCY)
+    return AIMessage(content="respuesta simulada")
+
+
+async def _afake_llm(messages):
+    await asyncio.sleep(LLM_LATENCY)
+    return AIMessage(content="respuesta simulada")
+
+
+# --- Implementación síncrona anterior (referencia) ---
+
+def legacy_chat(request: onco_api.ChatRequest, db: Session = Depends(get_db),
+                current_user=Depends(onco_api.get_current_user)):
+    patient_context = ""
+    if request.patient_id:
+        patient = db.query(Patient).filter(Patient.did == request.patient_id).first()
+        if patient:
+            patient_context = f"Paciente: {patient.full_name} (ID: {patient.did})."
+    return langchain_agent.chat_agent(request.query, patient_context)
+
+
+def legacy_history(limit: int = 50, db: Session = Depends(get_db),
+                   current_user=Depends(onco_api.get_current_user)):
+    rows = db.query(
+        SessionLog.id, SessionLog.patient_id, SessionLog.created_at,
+        func.substr(SessionLog.raw_text, 1, onco_api.HISTORY_PREVIEW_CHARS).label("preview"),
+        SessionLog.emotion_analysis, SessionLog.risk_flag, SessionLog.triage_tier,
+        SessionLog.soap_report.isnot(None).label("has_soap_report")
+    ).order_by(SessionLog.created_at.desc(), SessionLog.id.desc()).limit(limit + 1).all()
+    return {"items": [
+        {"id": r.id, "patient_id": r.patient_id, "timestamp": r.created_at.isoformat(), "raw_text": r.preview,
+         "emotion_analysis": r.emotion_analysis, "risk_flag": r.risk_flag, "triage_tier": r.triage_tier,
+         "has_soap_report": bool(r.has_soap_report)} for r in rows[:limit]
+    ]}
+
+
+def seed(n_sessions: int = 500):
+    import uuid
+    import datetime
+    db = onco_api.SessionLocal()
+    try:
+        now = datetime.datetime.utcnow()
+        db.add_all([
+            SessionLog(id=str(uuid.uuid4()), patient_id="p-bench", raw_text="texto " * 50,
+                       emotion_analysis={"pain": 0.3}, risk_flag=False,
+                       created_at=now - datetime.timedelta(minutes=i))
+            for i in range(n_sessions)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_load(client, method, url, headers, json=None):
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    peak_slots = 0
+    done = asyncio.Event()
+
+    async def sample():
+        # Slots ocupados del threadpool de Starlette (por defecto 40)
+        nonlocal peak_slots
+        while not done.is_set():
+            peak_slots = max(peak_slots, limiter.borrowed_tokens)
+            await asyncio.sleep(0.005)
+
+    async def one():
+        t0 = time.perf_counter()
+        r = await client.request(method, url, headers=headers, json=json)
+        assert r.status_code == 200, (url, r.status_code, r.text)
+        return time.perf_counter() - t0
+
+    sampler = asyncio.create_task(sample())
+    t0 = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*[one() for _ in range(CONCURRENCY)]))
+    wall = time.perf_counter() - t0
+    done.set()
+    await sampler
+    return {
+        "wall": wall,
+        "rps": CONCURRENCY / wall,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "slots": peak_slots,
+    }
+
+
+async def main():
+    print(f"\n⚡ BENCHMARK SYNC vs ASYNC ({CONCURRENCY} peticiones concurrentes, LLM {LLM_LATENCY * 1000:.0f} ms)\n")
+
+    langchain_agent.llm = RunnableLambda(_fake_llm, afunc=_afake_llm)
+    app = onco_api.app
+    app.add_api_route("/legacy/chat", legacy_chat, methods=["POST"])
+    app.add_api_route("/legacy/history", legacy_history, methods=["GET"])
+    seed()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        r = await client.post("/auth/login", data={"username": "test@psych.com", "password": "Psycho2025!"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        cases = [
+            ("/api/chat", "POST", "/legacy/chat", "/api/chat", {"query": "dosis de morfina", "patient_id": None}),
+            ("/history", "GET", "/legacy/history", "/history", None),
+        ]
+        for name, method, legacy_url, async_url, body in cases:
+            legacy = await run_load(client, method, legacy_url, headers, body)
+            current = await run_load(client, method, async_url, headers, body)
+            print(f"--- {name} ---")
+            for label, m in (("sync (threadpool)", legacy), ("async", current)):
+                print(f"{label:18} {m['wall']:7.2f} s  {m['rps']:8.1f} req/s  "
+                      f"p50 {m['p50'] * 1000:7.1f} ms  p95 {m['p95'] * 1000:7.1f} ms  threadpool pico {m['slots']}/{int(anyio.to_thread.current_default_thread_limiter().total_tokens)}")
+            print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import random
+import itertools
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.services.bm25_index import BM25Index, tokenize
+
+N_CHUNKS = int(os.getenv("BENCH_CHUNKS", "100000"))
+VOCABULARY = 30000
+WORDS_PER_CHUNK = 150
+N_QUERIES = 300
+DRUGS = ["fentanilo transmucoso", "morfina oral", "ondansetron", "dexametasona", "pregabalina", "metadona"]
+
+
+def python_search(docs, query, k=10, k1=1.2, b=0.75):
+    """Referencia sin índice: BM25 recorriendo todos los fragmentos en Python."""
+    import math
+    terms = set(tokenize(query))
+    avgdl = sum(len(d) for d in docs) / len(docs)
+    df = {t: sum(1 for d in docs if t in d) for t in terms}
+    scores = []
+    for i, d in enumerate(docs):
+        s = 0.0
+        for t in terms:
+            tf = d.count(t)
+            if tf:
+                idf = math.log1p((len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+                s += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(d) / avgdl))
+        scores.append((s, i))
+    return sorted(scores, reverse=True)[:k]
+
+
+def main():
+    print(f"\n🔤 BENCHMARK ÍNDICE BM25 ({N_CHUNKS} fragmentos, {WORDS_PER_CHUNK} palabras/fragmento)\n")
+    rng = random.Random(42)
+    # Vocabulario con distribución de Zipf (como el texto real) y fármacos en el 1% de fragmentos
+    words = [f"termino{i}" for i in range(VOCABULARY)]
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(VOCABULARY)))
+
+    t0 = time.perf_counter()
+    texts = []
+    for i in range(N_CHUNKS):
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_CHUNK))
+        if rng.random() < 0.01:
+            text += f" {rng.choice(DRUGS)} {rng.choice([50, 100, 200, 400])} mcg"
+        texts.append(text)
+    print(f"Corpus sintético generado en {time.perf_counter() - t0:.1f}s")
+
+    path = os.path.join(tempfile.mkdtemp(), "bm25_bench.npz")
+    index = BM25Index(path)
+    t0 = time.perf_counter()
+    for i, text in enumerate(texts):
+        index.add(f"doc{i}", text)
+    t_tokenize = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.commit()
+    t_commit = time.perf_counter() - t0
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"Indexado: tokenizar {t_tokenize:.1f}s, commit {t_commit:.2f}s, {index.stats()}, {size_mb:.1f} MB en disco")
+
+    # Actualización incremental típica (un PDF de 200 fragmentos reemplazado)
+    index.remove([f"doc{i}" for i in range(200)])
+    for i in range(200):
+        index.add(f"doc{i}-v2", texts[i])
+    t0 = time.perf_counter()
+    index.commit()
+    print(f"Commit incremental (200 bajas + 200 altas): {time.perf_counter() - t0:.2f}s")
+
+    t0 = time.perf_counter()
+    BM25Index(path)
+    print(f"Carga desde disco: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    queries = [f"{rng.choice(DRUGS)} {' '.join(rng.choices(words[:2000], k=rng.randint(1, 3)))}"
+               for _ in range(N_QUERIES)]
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.search(q, k=20)
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print(f"\nBúsqueda vectorizada (top-20, {N_QUERIES} consultas): "
+          f"p50 {pct(0.5):.2f} ms | p95 {pct(0.95):.2f} ms | max {latencies[-1] * 1000:.2f} ms")
+
+    docs = [tokenize(t) for t in texts[:10000]]
+    t0 = time.perf_counter()
+    python_search(docs, queries[0])
+    t_python = (time.perf_counter() - t0) * N_CHUNKS / len(docs)
+    print(f"Referencia en Python puro (extrapolado a {N_CHUNKS}): {t_python * 1000:.0f} ms por consulta")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import random
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.models import User, normalize_email
+
+N_USERS = int(os.getenv("BENCH_USERS", "100000"))
+N_LOOKUPS = 200
+
+
+def legacy_lookup(db, email):
+    """Implementación original: búsqueda exacta y, si falla, escaneo de toda la tabla en Python."""
+    user = db.query(User).filter(User.email == email).first()
+    if not user:
+        for u in db.query(User).all():
+            if u.email.lower() == email.lower():
+                return u
+    return user
+
+
+def indexed_lookup(db, email):
+    return db.query(User).filter(User.email_lower == normalize_email(email)).first()
+
+
+def main():
+    print(f"\n🔎 BENCHMARK DE LOGIN POR EMAIL ({N_USERS} usuarios)\n")
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_users.db")
+    engine = create_engine(f"sqlite:///{path}")
+    User.__table__.create(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    emails = [f"User{i}@Clinic{i % 50}.com" for i in range(N_USERS)]
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": str(i), "email": e, "email_lower": normalize_email(e), "hashed_password": "x", "is_active": True}
+            for i, e in enumerate(emails)
+        ])
+
+    rng = random.Random(42)
+    # El caso lento del código original: el usuario escribe el email con otras mayúsculas
+    queries = [rng.choice(emails).lower() for _ in range(N_LOOKUPS)]
+
+    db = Session()
+    try:
+        n_legacy = 5
+        t0 = time.perf_counter()
+        for q in queries[:n_legacy]:
+            assert legacy_lookup(db, q) is not None
+        t_legacy = (time.perf_counter() - t0) / n_legacy
+        db.expunge_all()
+
+        t0 = time.perf_counter()
+        for q in queries:
+            assert indexed_lookup(db, q) is not None
+        t_indexed = (time.perf_counter() - t0) / len(queries)
+    finally:
+        db.close()
+        engine.dispose()
+        os.remove(path)
+
+    print(f"Escaneo completo (original): {t_legacy * 1000:10.2f} ms/login")
+    print(f"Índice email_lower:          {t_indexed * 1000:10.3f} ms/login  (x{t_legacy / t_indexed:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.services.oncology_evolution_service import oncology_evolution_service
+
+SYMPTOMS = list(oncology_evolution_service.TRACKED_SYMPTOMS)
+
+
+def loop_trends(timeline):
+    """Implementación original: un np.polyfit por síntoma dentro de un bucle Python."""
+    trends = {}
+    if len(timeline) < 2:
+        return {k: 0.0 for k in SYMPTOMS}
+    start_time = timeline[0]["timestamp"]
+    x = np.array([(t["timestamp"] - start_time) / 86400.0 for t in timeline])
+    for key in SYMPTOMS:
+        y = np.array([t["symptoms"][key] for t in timeline])
+        if np.all(y == 0):
+            trends[key] = 0.0
+            continue
+        try:
+            slope, _ = np.polyfit(x, y, 1)
+            trends[key] = slope
+        except Exception:
+            trends[key] = 0.0
+    return trends
+
+
+def make_cohort(n_patients, sessions_per_patient, seed=42):
+    rng = np.random.default_rng(seed)
+    n = n_patients * sessions_per_patient
+    patient_ids = np.repeat(np.array([f"p{i}" for i in range(n_patients)]), sessions_per_patient)
+    # Una sesión cada ~2 días con algo de ruido
+    offsets = np.tile(np.arange(sessions_per_patient) * 2 * 86400.0, n_patients) + rng.uniform(0, 3600, n)
+    timestamps = 1.7e9 + offsets
+    values = np.clip(rng.normal(0.4, 0.2, (n, len(SYMPTOMS))), 0, 1)
+    return patient_ids, timestamps, values
+
+
+def to_timelines(patient_ids, timestamps, values):
+    timelines = {}
+    for pid, ts, row in zip(patient_ids, timestamps, values):
+        timelines.setdefault(pid, []).append({
+            "timestamp": ts,
+            "date": "",
+            "symptoms": dict(zip(SYMPTOMS, row.tolist()))
+        })
+    return timelines
+
+
+def main():
+    print("\n📈 BENCHMARK DE TENDENCIAS ESAS (bucle polyfit vs vectorizado)\n")
+
+    for n_patients, sessions in [(100, 20), (1000, 20), (5000, 30)]:
+        patient_ids, timestamps, values = make_cohort(n_patients, sessions)
+        timelines = to_timelines(patient_ids, timestamps, values)
+
+        t0 = time.perf_counter()
+        reference = {pid: loop_trends(tl) for pid, tl in timelines.items()}
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        vectorized = {pid: oncology_evolution_service._calculate_trends(tl) for pid, tl in timelines.items()}
+        t_vec = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        cohort = oncology_evolution_service.cohort_trends(patient_ids, timestamps, values)
+        t_cohort = time.perf_counter() - t0
+
+        for pid, ref in reference.items():
+            for key in SYMPTOMS:
+                assert np.isclose(ref[key], vectorized[pid][key], atol=1e-9), (pid, key)
+                assert np.isclose(ref[key], cohort[pid]["trends"][key], atol=1e-9), (pid, key)
+
+        print(f"--- {n_patients} pacientes x {sessions} sesiones ---")
+        print(f"Bucle polyfit:          {t_loop * 1000:9.1f} ms")
+        print(f"Vectorizado/paciente:   {t_vec * 1000:9.1f} ms  (x{t_loop / t_vec:.1f})")
+        print(f"Cohorte (una pasada):   {t_cohort * 1000:9.1f} ms  (x{t_loop / t_cohort:.1f}, incluye alertas)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark de latencia de cola del router LLM contra servidores de chat falsos.
+
+Levanta dos fake_llm_server locales con cola larga (5% de respuestas a 3 s) y
+compara p50/p95/p99 de un único backend frente al router con hedging. Después
+comprueba la pausa por cuota con un backend que siempre devuelve 429 y el orden
+de los carriles de prioridad con un backend limitado a 60 RPM.
+
+Uso:
+    python backend/bench_llm_router.py [peticiones]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+os.environ.setdefault("LLM_HEDGE_MIN_SAMPLES", "10")
+os.environ.setdefault("QUOTA_LIMITS", "http://127.0.0.1:18768=60:0")
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from backend.fake_llm_server import serve
+from backend.services.llm_router import LLMRouter
+from backend.services.quota_scheduler import quota_scheduler
+
+logging.getLogger("backend.services.llm_router").setLevel(logging.ERROR)
+logging.getLogger("backend.services.quota_scheduler").setLevel(logging.ERROR)
+
+N_REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+CONCURRENCY = 20
+MESSAGES = [SystemMessage(content="Eres un Oncólogo experto."), HumanMessage(content="Dolor EVA 7")]
+
+
+def start_server(port, **kwargs):
+    server = serve(port, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_router(*urls):
+    return LLMRouter([LLMRouter.make_backend(url, max_retries=0, temperature=0.7) for url in urls])
+
+
+async def run(router, n=N_REQUESTS):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                await router.ainvoke(MESSAGES)
+                latencies.append(time.perf_counter() - t0)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*[one() for _ in range(n)])
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": latencies[-1] * 1000, "errors": errors}
+
+
+async def main():
+    print(f"\n🔀 BENCHMARK ROUTER LLM ({N_REQUESTS} peticiones, concurrencia {CONCURRENCY})\n")
+    tail = dict(latency=200, jitter=30, tail_prob=0.05, tail_latency=3000)
+    servers = [start_server(18765, seed=1, **tail), start_server(18766, seed=2, **tail)]
+    a, b = "http://127.0.0.1:18765", "http://127.0.0.1:18766"
+
+    for label, router in (("1 backend, sin hedging", make_router(a)),
+                          ("2 backends + hedging p95", make_router(a, b))):
+        r = await run(router)
+        print(f"{label:26} p50 {r['p50']:7.0f} ms  p95 {r['p95']:7.0f} ms  p99 {r['p99']:7.0f} ms  "
+              f"max {r['max']:7.0f} ms  errores {r['errors']}")
+        for name, s in router.stats()["backends"].items():
+            print(f"   {name}: llamadas {s['calls']}, hedges {s['hedges_sent']}, ganadas {s['wins']}")
+
+    print("\n--- Pausa por cuota (backend primario siempre 429) ---")
+    servers.append(start_server(18767, latency=50, error_rate=1.0))
+    router = make_router("http://127.0.0.1:18767", a)
+    r = await run(router, n=100)
+    primary = router.stats()["backends"]["http://127.0.0.1:18767"]
+    print(f"p50 {r['p50']:.0f} ms  errores {r['errors']}  primario: 429 {primary['throttled']}, "
+          f"llamadas {primary['calls']} de 100 (el resto va al secundario mientras dura la pausa)")
+
+    print("\n--- Carriles de prioridad (backend limitado a 60 RPM, cubo vacío) ---")
+    servers.append(start_server(18768, latency=20, jitter=1))
+    router = make_router("http://127.0.0.1:18768")
+    quota_scheduler._quota("http://127.0.0.1:18768").rpm.drain()
+    order = []
+
+    async def lane_call(agent):
+        with quota_scheduler.lane(agent):
+            await router.ainvoke(MESSAGES)
+        order.append(agent)
+
+    soap = [asyncio.create_task(lane_call("soap")) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    await asyncio.gather(*soap, lane_call("risk"))
+    stats = quota_scheduler.stats()
+    print(f"orden de servicio: {order}  espera p95 urgente {stats['wait_ms_p95']['urgent']:.0f} ms, "
+          f"batch {stats['wait_ms_p95']['batch']:.0f} ms")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
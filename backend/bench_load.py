@@ -0,0 +1,164 @@
+"""
+Prueba de carga extremo a extremo de onco_api sin consumir cuota de Gemini.
+
+Cada escenario reproduce el flujo de un clínico:
+    login -> alta de paciente -> /session/analyze -> informe SOAP -> evolución
+y se lanzan en bucle abierto a un ritmo objetivo (escenarios/s), de modo que
+si la API se satura las peticiones se acumulan en lugar de frenar al cliente.
+Al final se informa p50/p95/p99, throughput y errores por endpoint.
+
+Sin --url se levanta onco_api en este mismo proceso (uvicorn en un hilo) con
+BD temporal, LLM falso en proceso (fake://, ver fake_llm_server.py) y
+embeddings falsos para ChromaDB. El cliente comparte GIL con el servidor: para
+cifras de producción, apuntar --url a una instancia gunicorn arrancada con
+LLM_BACKENDS=fake://... y RAG_EMBEDDINGS=fake.
+
+Uso:
+    python backend/bench_load.py --rps 5 --duration 30
+    python backend/bench_load.py --url http://127.0.0.1:8000 --rps 20 --duration 60
+    python backend/bench_load.py --llm "fake://?latency=800&distribution=lognormal&error_rate=0.02"
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+DEFAULT_LLM = "fake://?latency=300&jitter=80&distribution=lognormal&tail_prob=0.02&tail_latency=3000&seed=1"
+USER = {"email": "loadtest@oncologia-demo.com", "password": "LoadTest2025!", "full_name": "Load Test"}
+SESSION_TEXT = "Hoy tengo dolor lumbar moderado, algo de náuseas por la mañana y me canso al caminar."
+
+
+def start_local_api(llm_spec: str) -> str:
+    """Arranca onco_api en un hilo con BD temporal y LLM/embeddings falsos. Devuelve la URL base."""
+    tmpdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'load.db')}"
+    os.environ["LLM_BACKENDS"] = llm_spec
+    os.environ["RAG_EMBEDDINGS"] = "fake"
+    os.environ["ALERT_SCANNER_ENABLED"] = "0"
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tmpdir, "llm_cache.db"))
+    os.environ.setdefault("MEMORY_DB_PATH", os.path.join(tmpdir, "memory.db"))
+
+    import uvicorn
+    from backend.onco_api import app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, name: str, coro):
+        started = time.perf_counter()
+        try:
+            response = await coro
+        except httpx.HTTPError as e:
+            self.errors[name][type(e).__name__] += 1
+            raise
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name][str(response.status_code)] += 1
+            response.raise_for_status()
+        return response
+
+    def report(self, elapsed: float) -> None:
+        print(f"\n{'endpoint':22} {'n':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  errores")
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            pct = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+            errors = ", ".join(f"{code}: {n}" for code, n in self.errors[name].items()) or "-"
+            print(f"{name:22} {len(values):6d} {len(values) / elapsed:7.2f} {pct(0.50):8.0f} {pct(0.95):8.0f} "
+                  f"{pct(0.99):8.0f} {values[-1] * 1000:8.0f}  {errors}")
+
+
+async def scenario(client: httpx.AsyncClient, rec: Recorder) -> None:
+    try:
+        await _scenario_steps(client, rec)
+    except httpx.HTTPError:
+        pass  # ya contabilizado por Recorder; el escenario se abandona en el paso fallido
+
+
+async def _scenario_steps(client: httpx.AsyncClient, rec: Recorder) -> None:
+    r = await rec.call("login", client.post("/auth/login", data={"username": USER["email"], "password": USER["password"]}))
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    # Texto único por escenario: la caché LLM no debe servir las respuestas
+    did = f"LOAD-{uuid.uuid4().hex[:12]}"
+    await rec.call("create_patient", client.post("/patients", json={"full_name": "Paciente Carga", "did": did}, headers=headers))
+    r = await rec.call("session_analyze", client.post("/session/analyze", json={"patient_id": did, "text": f"{SESSION_TEXT} Registro {did}."}, headers=headers))
+    session_id = r.json()["session_id"]
+    await rec.call("generate_soap", client.post(f"/api/reports/generate_soap/{session_id}", headers=headers))
+    await rec.call("patient_evolution", client.get(f"/patient/{did}/evolution", headers=headers))
+
+
+async def run(base_url: str, rps: float, duration: float, max_in_flight: int) -> None:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        r = await client.post("/auth/register", json=USER)
+        if r.status_code not in (201, 400):
+            raise SystemExit(f"No se pudo registrar el usuario de carga: {r.status_code} {r.text[:200]}")
+
+        in_flight = set()
+        started, skipped = 0, 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < duration:
+            # Bucle abierto: un escenario cada 1/rps segundos, haya terminado o no el anterior
+            if len(in_flight) >= max_in_flight:
+                skipped += 1
+            else:
+                task = asyncio.create_task(scenario(client, rec))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                started += 1
+            await asyncio.sleep(max(0.0, t0 + (started + skipped) / rps - time.perf_counter()))
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        elapsed = time.perf_counter() - t0
+        failed = sum(sum(codes.values()) for codes in rec.errors.values())
+
+    completed = len(rec.latencies.get("patient_evolution", []))
+    print(f"\nEscenarios: {started} lanzados, {completed} completos, {skipped} descartados por "
+          f"--max-in-flight, {failed} peticiones con error, en {elapsed:.1f}s "
+          f"({completed / elapsed:.2f} escenarios/s, objetivo {rps:.2f})")
+    rec.report(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga extremo a extremo de onco_api")
+    parser.add_argument("--url", help="API ya arrancada (por defecto se levanta una en proceso)")
+    parser.add_argument("--rps", type=float, default=5, help="Escenarios por segundo")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos lanzando escenarios")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="Escenarios simultáneos como máximo")
+    parser.add_argument("--llm", default=DEFAULT_LLM, help="Backend LLM falso para la API en proceso")
+    args = parser.parse_args()
+
+    base_url = args.url or start_local_api(args.llm)
+    print(f"\n🚦 PRUEBA DE CARGA contra {base_url}: {args.rps} escenarios/s durante {args.duration:.0f}s")
+    if not args.url:
+        print(f"   LLM: {args.llm}")
+    asyncio.run(run(base_url, args.rps, args.duration, args.max_in_flight))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark de almacenes vectoriales del RAG: FlatVectorStore (mmap float16)
+frente a ChromaDB (HNSW), en memoria y latencia de búsqueda.
+
+Cada medición se hace en un proceso nuevo (como un worker de gunicorn que
+arranca). RSS se separa en páginas de fichero compartidas (el mmap, servido
+por la caché de páginas del sistema y común a todos los workers) y memoria
+privada, que es lo que cuesta cada worker adicional. "flat32" es el mismo
+almacén en float32: el doble de disco/caché, sin conversión en la búsqueda.
+
+Uso:
+    python backend/bench_vector_store.py
+    python backend/bench_vector_store.py --sizes 10000,100000 --queries 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import psutil
+
+DIM = 384
+BATCH = 5000
+
+
+def vectors(rng, n: int) -> np.ndarray:
+    x = rng.normal(size=(n, DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def open_store(kind: str, path: str):
+    if kind in ("flat", "flat32"):
+        from backend.services.vector_store import FlatVectorStore
+        return FlatVectorStore(path, dtype="float32" if kind == "flat32" else "float16")
+    import chromadb
+    return chromadb.PersistentClient(path=path).get_or_create_collection("bench")
+
+
+def build(kind: str, path: str, n: int, doc_chars: int) -> float:
+    rng = np.random.default_rng(0)
+    store = open_store(kind, path)
+    filler = "x" * max(0, doc_chars - 12)
+    started = time.perf_counter()
+    for start in range(0, n, BATCH):
+        stop = min(start + BATCH, n)
+        ids = [f"doc{i}" for i in range(start, stop)]
+        store.upsert(ids=ids, documents=[f"{i} {filler}" for i in ids], embeddings=vectors(rng, stop - start).tolist(),
+                     metadatas=[{"source": f"guia{i % 50}.pdf"} for i in range(start, stop)])
+    return time.perf_counter() - started
+
+
+def probe(kind: str, path: str, n_queries: int) -> dict:
+    """Se ejecuta en un subproceso limpio: memoria al abrir y tras consultar, y latencias."""
+    process = psutil.Process()
+    base = process.memory_full_info()
+    store = open_store(kind, path)
+    opened = process.memory_full_info()
+
+    rng = np.random.default_rng(1)
+    queries = vectors(rng, n_queries)
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        store.query(query_embeddings=[q.tolist()], n_results=5)
+        latencies.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for start in range(0, n_queries, 8):
+        store.query(query_embeddings=queries[start:start + 8].tolist(), n_results=5)
+    batched = (time.perf_counter() - t0) / n_queries
+    after = process.memory_full_info()
+
+    latencies.sort()
+    mb = lambda v: round(v / 1e6, 1)
+    private = lambda m: m.rss - m.shared
+    return {
+        "open_rss_mb": mb(opened.rss - base.rss), "open_private_mb": mb(private(opened) - private(base)),
+        "query_rss_mb": mb(after.rss - base.rss), "query_shared_mb": mb(after.shared - base.shared),
+        "query_private_mb": mb(private(after) - private(base)),
+        "p50_ms": latencies[len(latencies) // 2] * 1000, "p95_ms": latencies[int(0.95 * len(latencies))] * 1000,
+        "batched_ms": batched * 1000,
+    }
+
+
+def disk_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria y latencia: FlatVectorStore vs ChromaDB")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--doc-chars", type=int, default=200, help="Tamaño de cada documento guardado")
+    parser.add_argument("--probe", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(*args.probe, args.queries)))
+        return
+
+    kinds = ["flat", "flat32"]
+    try:
+        import chromadb  # noqa: F401
+        kinds.append("chroma")
+    except ImportError:
+        print("ℹ️  chromadb no instalado: solo se mide FlatVectorStore")
+
+    print(f"\n🧮 BENCHMARK ALMACÉN VECTORIAL (dim {DIM}, top-5, {args.queries} consultas)\n")
+    print(f"{'almacén':8} {'N':>9} {'carga s':>8} {'disco MB':>9} {'RSS MB':>8} {'compart.':>9} {'privada':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'lote8 ms/c':>10}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        for kind in kinds:
+            path = tempfile.mkdtemp(prefix=f"bench_{kind}_")
+            build_s = build(kind, path, n, args.doc_chars)
+            out = subprocess.run(
+                [sys.executable, __file__, "--probe", kind, path, "--queries", str(args.queries)],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(out)
+            print(f"{kind:8} {n:9d} {build_s:8.1f} {disk_mb(path):9.1f} {r['query_rss_mb']:8.1f} "
+                  f"{r['query_shared_mb']:9.1f} {r['query_private_mb']:8.1f} "
+                  f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['batched_ms']:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
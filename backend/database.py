@@ -1,17 +1,198 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+except ImportError as e:
+    # Falta greenlet (sqlalchemy[asyncio]): solo se desactiva la ruta async
+    create_async_engine = async_sessionmaker = AsyncSession = None
+    _async_import_error = e
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from collections import deque
+import threading
+import logging
+import time
 
 import os
 from dotenv import load_dotenv
 load_dotenv()
+logger = logging.getLogger(__name__)
 SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./psico.db')
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Pool de conexiones (común a SQLite y Postgres)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# Perfil SQLite: WAL permite lectores concurrentes con un escritor (2 workers + colas)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))
+
+
+class PoolMetrics:
+    """Contadores de checkout y tiempos de espera del pool de conexiones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self._waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self, pool) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+        p = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 3) if waits else 0.0
+        stats = {
+            "pool_class": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "wait_ms_p50": p(0.50),
+            "wait_ms_p95": p(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 3) if waits else 0.0,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": DB_MAX_OVERFLOW,
+            })
+        return stats
+
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+class _TimedCheckoutMixin:
+    """Mide cuánto espera cada checkout por una conexión libre."""
+    metrics = pool_metrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return conn
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    metrics = pool_metrics
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def build_engine_kwargs(url: str, poolclass=InstrumentedQueuePool) -> dict:
+    """Argumentos de create_engine según el backend (SQLite o Postgres) con la misma configuración."""
+    if _is_sqlite(url):
+        kwargs = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            # BD en memoria: una sola conexión, el pool por defecto de SQLAlchemy es el correcto
+            return kwargs
+    else:
+        kwargs = {"pool_pre_ping": True, "pool_recycle": DB_POOL_RECYCLE}
+
+    kwargs.update({
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    })
+    return kwargs
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        # cache_size negativo = KiB
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+def _register_connect_listener(sync_engine, url: str, metrics: PoolMetrics):
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+        if _is_sqlite(url):
+            _apply_sqlite_pragmas(dbapi_connection, connection_record)
+
+
+def configure_engine(url: str):
+    """Crea el engine con el perfil de producción y registra pragmas/métricas."""
+    new_engine = create_engine(url, **build_engine_kwargs(url))
+    _register_connect_listener(new_engine, url, pool_metrics)
+    return new_engine
+
+
+def to_async_url(url: str) -> str:
+    """sqlite:// -> sqlite+aiosqlite://, postgresql:// -> postgresql+asyncpg://"""
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+", 1)[0]
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "postgres": "asyncpg"}.get(base)
+    if driver is None:
+        return url
+    return f"{'postgresql' if base == 'postgres' else base}+{driver}{sep}{rest}"
+
+
+def configure_async_engine(url: str):
+    """Engine async con el mismo perfil (pragmas, pool) que el síncrono. None si falta el driver."""
+    async_url = os.getenv('ASYNC_DATABASE_URL') or to_async_url(url)
+    if create_async_engine is None:
+        logger.warning(f"⚠️ SQLAlchemy asyncio no disponible ({_async_import_error}). Endpoints async usarán 503.")
+        return None
+    kwargs = build_engine_kwargs(async_url, poolclass=InstrumentedAsyncQueuePool)
+    if _is_sqlite(async_url):
+        # aiosqlite ejecuta cada conexión en su propio hilo: check_same_thread no aplica
+        kwargs["connect_args"].pop("check_same_thread", None)
+    try:
+        new_engine = create_async_engine(async_url, **kwargs)
+    except ImportError as e:
+        logger.warning(f"⚠️ Driver async no disponible ({e}). Endpoints async usarán 503.")
+        return None
+    _register_connect_listener(new_engine.sync_engine, async_url, async_pool_metrics)
+    return new_engine
+
+
+engine = configure_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = configure_async_engine(SQLALCHEMY_DATABASE_URL)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if async_engine is not None else None
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -20,3 +201,17 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=503, detail="Acceso async a la base de datos no disponible")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_pool_stats() -> dict:
+    """Métricas del pool de conexiones (checkouts, esperas, ocupación)."""
+    stats = {"sync": pool_metrics.stats(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = async_pool_metrics.stats(async_engine.pool)
+    return stats
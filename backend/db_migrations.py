@@ -0,0 +1,136 @@
+"""
+Migraciones ligeras e idempotentes para bases de datos existentes.
+
+Base.metadata.create_all() solo crea tablas nuevas: no añade columnas ni
+índices a tablas que ya existen. Este módulo aplica esos cambios sobre
+bases de datos antiguas (p.ej. psico.db en producción) y puede ejecutarse
+tantas veces como se quiera.
+
+Uso:
+    python -m backend.db_migrations
+    python -m backend.db_migrations --backfill-symptoms
+"""
+import os
+import sys
+import logging
+
+from sqlalchemy import inspect, text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+logger = logging.getLogger(__name__)
+
+# Índices declarados en los modelos que deben existir también en bases antiguas
+INDEXES = [
+    ("ix_session_logs_created_at_id", "session_logs", "created_at, id"),
+    ("ix_session_logs_patient_created_at", "session_logs", "patient_id, created_at"),
+]
+
+# Columnas añadidas a posteriori: (tabla, columna, DDL)
+COLUMNS = [
+    ("session_logs", "triage_tier", "VARCHAR"),
+    ("users", "email_lower", "VARCHAR"),
+]
+
+
+def _add_missing_columns(conn, inspector):
+    for table, column, ddl in COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            logger.info(f"🛠️ Columna añadida: {table}.{column}")
+
+
+def _create_missing_indexes(conn, inspector):
+    for name, table, columns in INDEXES:
+        if not inspector.has_table(table):
+            continue
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def backfill_email_lower(conn, batch_size: int = 1000) -> int:
+    """Rellena users.email_lower (con la misma normalización que el modelo) y crea su índice único."""
+    from backend.models import normalize_email
+
+    migrated = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, email FROM users WHERE email_lower IS NULL LIMIT :n"), {"n": batch_size}
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE users SET email_lower = :email_lower WHERE id = :id"),
+            [{"id": r.id, "email_lower": normalize_email(r.email)} for r in rows]
+        )
+        migrated += len(rows)
+
+    duplicates = conn.execute(text(
+        "SELECT email_lower FROM users GROUP BY email_lower HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        # No se puede garantizar unicidad: índice normal hasta que se resuelvan a mano
+        logger.error(f"❌ Emails duplicados sin distinguir mayúsculas: {[d[0] for d in duplicates]}")
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (email_lower)"))
+    else:
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email_lower ON users (email_lower)"))
+
+    if migrated:
+        logger.info(f"🛠️ users.email_lower rellenado para {migrated} usuarios")
+    return migrated
+
+
+def run_migrations(engine) -> None:
+    """Aplica columnas e índices pendientes. Idempotente."""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        _add_missing_columns(conn, inspector)
+        _create_missing_indexes(conn, inspector)
+        if inspector.has_table("users"):
+            backfill_email_lower(conn)
+
+
+def backfill_symptom_scores(db, batch_size: int = 500) -> int:
+    """
+    Rellena symptom_scores para las sesiones que aún no tienen serie materializada.
+    Devuelve el número de sesiones migradas.
+    """
+    from sqlalchemy import exists
+    from backend.models import SessionLog, SymptomScore
+    from backend.services.oncology_evolution_service import oncology_evolution_service
+
+    pending = db.query(
+        SessionLog.id, SessionLog.patient_id, SessionLog.created_at, SessionLog.emotion_analysis
+    ).filter(
+        ~exists().where(SymptomScore.session_id == SessionLog.id)
+    ).order_by(SessionLog.created_at)
+
+    migrated = 0
+    while True:
+        batch = pending.limit(batch_size).all()
+        if not batch:
+            return migrated
+        for log in batch:
+            db.add_all(oncology_evolution_service.build_symptom_scores(log))
+        db.commit()
+        migrated += len(batch)
+        logger.info(f"   ... {migrated} sesiones migradas")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from backend.database import engine, SessionLocal
+    from backend.models import Base
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    print("✅ Migraciones aplicadas.")
+
+    if "--backfill-symptoms" in sys.argv:
+        db = SessionLocal()
+        try:
+            count = backfill_symptom_scores(db)
+            print(f"✅ Serie ESAS materializada para {count} sesiones.")
+        finally:
+            db.close()
@@ -0,0 +1,28 @@
+# Script para desactivar un usuario (baja administrativa)
+#   python -m backend.deactivate_user usuario@ejemplo.com
+import sys
+
+from backend.database import SessionLocal
+from backend.auth import deactivate_user, AUTH_USER_CACHE_TTL_SECONDS
+
+if len(sys.argv) != 2:
+    print("Uso: python -m backend.deactivate_user <email>")
+    sys.exit(1)
+
+db = SessionLocal()
+
+try:
+    user = deactivate_user(db, sys.argv[1])
+    if user:
+        print(f"✅ Usuario desactivado: {user.email}")
+        # Este script no comparte la caché de autenticación de la API
+        print(f"   La API lo rechazará en un máximo de {AUTH_USER_CACHE_TTL_SECONDS:g} s "
+              f"(AUTH_USER_CACHE_TTL_SECONDS)")
+    else:
+        print(f"❌ Usuario no encontrado: {sys.argv[1]}")
+        sys.exit(1)
+except Exception as e:
+    print(f"❌ Error: {e}")
+    sys.exit(1)
+finally:
+    db.close()
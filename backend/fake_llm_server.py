@@ -0,0 +1,198 @@
+"""
+LLM falso y determinista para pruebas de carga (sin consumir cuota de Gemini).
+
+Dos formas de uso con el mismo perfil de latencia/errores y las mismas
+respuestas enlatadas (JSON válido para triaje y ESAS, textos SOAP,
+psicoeducación y chat):
+
+- En proceso: FakeChatModel, seleccionable desde el router con
+  LLM_BACKENDS=fake://?latency=300&tail_prob=0.05&error_rate=0.01&seed=1
+- Por HTTP: POST /chat {"messages": [...]} -> {"content": "...", "usage": {...}}
+
+Distribuciones de latencia: "gauss" (mediana + jitter) o "lognormal" (cola
+derecha natural), más una cola opcional (tail_prob a tail_latency ms).
+
+Uso:
+    python backend/fake_llm_server.py --port 8765 --latency 300 --tail-prob 0.05 --tail-latency 3000
+    LLM_BACKENDS=http://127.0.0.1:8765,http://127.0.0.1:8766 python -m uvicorn backend.onco_api:app
+"""
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import threading
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+CANNED_SOAP = (
+    "S: Refiere dolor lumbar EVA 5/10 y cansancio por las tardes.\n"
+    "O: Métricas emocionales estables. Sin signos de alarma.\n"
+    "A: Dolor oncológico parcialmente controlado.\n"
+    "P: Mantener analgesia pautada y reevaluar en 72h. (respuesta simulada)"
+)
+CANNED_PSYCHO = (
+    "Hola:\n\nToma la medicación a las horas indicadas y anota cuándo aparece el dolor.\n"
+    "Si el dolor supera 7/10, llama al equipo. (respuesta simulada)"
+)
+
+
+def fake_content(system: str) -> str:
+    """Respuesta enlatada según el agente que la pide (detectado por su prompt de sistema)."""
+    if "Triaje" in system:
+        return json.dumps({"risk_level": "low", "risk_found": False, "explanation": "Sin urgencias (respuesta simulada)."})
+    if "ESAS" in system:
+        return json.dumps({"pain": 0.4, "anxiety": 0.2, "fatigue": 0.5, "nausea": 0.1, "depression": 0.1, "insomnia": 0.3})
+    if "S.O.A.P" in system:
+        return CANNED_SOAP
+    if "Educación al Paciente" in system:
+        return CANNED_PSYCHO
+    return "Respuesta simulada del servidor LLM falso."
+
+
+@dataclass
+class FakeLLMProfile:
+    """
+    Perfil de latencia (ms) y tasa de errores 429 (con Retry-After en segundos,
+    en el mismo formato que Gemini). Con la misma semilla, misma secuencia.
+    """
+    latency: float = 300
+    jitter: float = 50
+    distribution: str = "gauss"
+    tail_prob: float = 0.0
+    tail_latency: float = 3000
+    error_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, spec: str) -> "FakeLLMProfile":
+        """fake://?latency=300&distribution=lognormal&error_rate=0.01 -> perfil."""
+        types = {f.name: f.type for f in fields(cls)}
+        params = {k: v for k, v in parse_qsl(urlparse(spec).query) if k in types}
+        return cls(**{k: types[k](v) for k, v in params.items()})
+
+    def sample(self) -> Tuple[float, bool]:
+        """(segundos de latencia, ¿responder con 429?)"""
+        with self._lock:
+            if self._rng.random() < self.tail_prob:
+                delay = self.tail_latency
+            elif self.distribution == "lognormal":
+                sigma = math.log1p(self.jitter / self.latency) if self.latency else 0.0
+                delay = self._rng.lognormvariate(math.log(max(self.latency, 1e-3)), sigma)
+            else:
+                delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+            failed = self._rng.random() < self.error_rate
+        return delay / 1000.0, failed
+
+    @property
+    def quota_error(self) -> str:
+        return f"429 quota exceeded (simulado). Please retry in {self.retry_after:g}s."
+
+
+def _usage(prompt_chars: int, content: str) -> dict:
+    usage = {"input_tokens": prompt_chars // 4, "output_tokens": len(content) // 4}
+    usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+    return usage
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model en proceso con el perfil de FakeLLMProfile (async sin hilos: asyncio.sleep)."""
+    profile: FakeLLMProfile
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, messages: List[BaseMessage], failed: bool) -> ChatResult:
+        if failed:
+            raise RuntimeError(self.profile.quota_error)
+        system = messages[0].content if messages and messages[0].type == "system" else ""
+        content = fake_content(system)
+        usage = _usage(sum(len(str(m.content)) for m in messages), content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, failed = self.profile.sample()
+        time.sleep(delay)
+        return self._respond(messages, failed)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, failed = self.profile.sample()
+        await asyncio.sleep(delay)
+        return self._respond(messages, failed)
+
+
+def make_handler(profile: FakeLLMProfile):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/chat":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            messages = body.get("messages", [])
+
+            delay, failed = profile.sample()
+            time.sleep(delay)
+
+            if failed:
+                payload, status = {"error": profile.quota_error}, 429
+            else:
+                system = messages[0].get("data", {}).get("content", "") if messages else ""
+                content = fake_content(system)
+                prompt_chars = sum(len(m.get("data", {}).get("content", "")) for m in messages)
+                payload, status = {"content": content, "usage": _usage(prompt_chars, content)}, 200
+
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if status == 429:
+                self.send_header("Retry-After", f"{profile.retry_after:g}")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8765, latency: float = 300, jitter: float = 50, tail_prob: float = 0.0,
+          tail_latency: float = 3000, error_rate: float = 0.0, seed: int = 0,
+          distribution: str = "gauss") -> ThreadingHTTPServer:
+    """Crea el servidor (no bloquea). Llamar a serve_forever() en un hilo."""
+    profile = FakeLLMProfile(latency=latency, jitter=jitter, distribution=distribution, tail_prob=tail_prob,
+                             tail_latency=tail_latency, error_rate=error_rate, seed=seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(profile))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor LLM falso para pruebas de carga")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=300, help="Latencia mediana (ms)")
+    parser.add_argument("--jitter", type=float, default=50, help="Desviación típica (ms)")
+    parser.add_argument("--distribution", choices=["gauss", "lognormal"], default="gauss")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Probabilidad de respuesta lenta")
+    parser.add_argument("--tail-latency", type=float, default=3000, help="Latencia de la cola (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de 429")
+    parser.add_argument("--seed", type=int, default=0)
+    a = parser.parse_args()
+
+    server = serve(a.port, a.latency, a.jitter, a.tail_prob, a.tail_latency, a.error_rate, a.seed, a.distribution)
+    print(f"🧪 Servidor LLM falso en http://127.0.0.1:{a.port} (latencia {a.latency:.0f} ms {a.distribution}, "
+          f"cola {a.tail_prob:.0%} a {a.tail_latency:.0f} ms, errores {a.error_rate:.0%})")
+    server.serve_forever()
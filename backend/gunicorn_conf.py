@@ -0,0 +1,37 @@
+"""
+Configuración de gunicorn para la API.
+
+Uso (ver Dockerfile):
+    gunicorn -c backend/gunicorn_conf.py backend.onco_api:app
+
+El número de workers sale de WEB_CONCURRENCY (gunicorn lo lee por defecto).
+Con PROMETHEUS_MULTIPROC_DIR definido en el entorno (antes de arrancar: los
+workers lo leen al importar prometheus_client), el directorio se vacía al
+arrancar el máster y cada worker que muere se marca con mark_process_dead,
+para que /metrics no siga sumando sus gauges.
+"""
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def on_starting(server):
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+    # Ficheros de una ejecución anterior: sus contadores se sumarían a los nuevos
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
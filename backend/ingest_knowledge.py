@@ -1,13 +1,20 @@
 
 import os
 import sys
+import argparse
 
 # Ajustar path para importar módulos del backend
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend.services.rag_service import rag_service
-
 def main():
+    # Import dentro de main: los procesos de extracción arrancan con spawn y reimportan
+    # este script; no deben construir cada uno un RagService (modelo y colecciones)
+    from backend.services.rag_service import rag_service
+
+    parser = argparse.ArgumentParser(description="Ingesta incremental de la base de conocimiento clínica")
+    parser.add_argument("--full", action="store_true", help="Reindexar todos los PDFs ignorando el manifiesto")
+    args = parser.parse_args()
+
     print("🧠 OncologIA Knowledge Ingestion")
     print("================================")
     print(f"Directorio de conocimiento: {rag_service.knowledge_path}")
@@ -19,8 +26,8 @@ def main():
         print("ℹ️  Por favor, coloca tus PDFs (Guías Clínicas) en esa carpeta y vuelve a ejecutar este script.")
         return
 
-    print("🔄 Iniciando proceso de ingesta...")
-    result = rag_service.ingest_documents()
+    print(f"🔄 Iniciando proceso de ingesta {'completa' if args.full else 'incremental'}...")
+    result = rag_service.ingest_documents(force=args.full)
     
     if "error" in result:
         print(f"❌ Error: {result['error']}")
@@ -28,8 +35,17 @@ def main():
         print(f"ℹ️  {result['message']}")
     else:
         print("✅ Ingesta completada con éxito!")
-        print(f"   - Archivos procesados: {result.get('files_processed', 0)}")
-        print(f"   - Fragmentos (chunks) generados: {result.get('chunks_added', 0)}")
+        files = result.get("files", {})
+        print(f"   - Archivos nuevos: {files.get('added', 0)}, modificados: {files.get('updated', 0)}, "
+              f"sin cambios: {files.get('unchanged', 0)}, eliminados: {files.get('removed', 0)}, "
+              f"con error: {files.get('failed', 0)}")
+        print(f"   - Fragmentos (chunks) vectorizados: {result.get('chunks_added', 0)}, "
+              f"borrados: {result.get('chunks_deleted', 0)}")
+        print(f"   - Páginas: {result.get('pages', 0)} con {result.get('workers', 1)} proceso(s) de extracción "
+              f"({result.get('pages_per_s', 0):.1f} páginas/s, {result.get('chunks_per_s', 0):.1f} fragmentos/s)")
+        print(f"   - Tiempo total: {result.get('total_ms', 0):.0f} ms")
+        for phase, ms in result.get("timings_ms", {}).items():
+            print(f"       {phase:10} {ms:9.1f} ms")
         print("\nEl Asistente Clínico ahora tiene acceso a esta información.")
 
 if __name__ == "__main__":
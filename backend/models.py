@@ -1,20 +1,31 @@
-from sqlalchemy import Column, String, Float, DateTime, JSON, Boolean, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Float, Integer, DateTime, JSON, Boolean, ForeignKey, Text, Index, UniqueConstraint
+from sqlalchemy.orm import relationship, validates
 from backend.database import Base
 import datetime
 import uuid
 
+def normalize_email(email):
+    """Forma canónica del email usada en users.email_lower."""
+    return email.strip().lower() if email else email
+
 class User(Base):
     """Modelo de Usuario para autenticación"""
     __tablename__ = "users"
 
     id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
     email = Column(String, unique=True, index=True, nullable=False)
+    # Email normalizado (trim + minúsculas) para login case-insensitive con índice
+    email_lower = Column(String, unique=True, index=True)
     hashed_password = Column(String, nullable=False)
     full_name = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    @validates("email")
+    def _sync_email_lower(self, key, value):
+        self.email_lower = normalize_email(value)
+        return value
+
 class Patient(Base):
     """Modelo para Pacientes"""
     __tablename__ = "patients"
@@ -45,6 +56,9 @@ class SessionLog(Base):
     
     # Bandera de riesgo (True si se detectan palabras clave como "suicidio")
     risk_flag = Column(Boolean, default=False, index=True)
+
+    # Nivel de triaje que decidió el riesgo: 'lexicon', 'ml' o 'llm'
+    triage_tier = Column(String, nullable=True)
     
     # Informe clínico generado (Formato SOAP)
     soap_report = Column(Text, nullable=True)
@@ -54,6 +68,62 @@ class SessionLog(Base):
     # Relación con Patient
     patient = relationship("Patient")
 
+    # Índices para paginación keyset del historial (created_at, id)
+    __table_args__ = (
+        Index("ix_session_logs_created_at_id", "created_at", "id"),
+        Index("ix_session_logs_patient_created_at", "patient_id", "created_at"),
+    )
+
+class SymptomScore(Base):
+    """
+    Serie temporal ESAS normalizada: una fila por sesión y síntoma.
+    Se escribe en la misma transacción que el SessionLog, de modo que la
+    evolución, tendencias y alertas son rangos indexados por paciente/fecha
+    que nunca leen columnas de texto.
+    """
+    __tablename__ = "symptom_scores"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("session_logs.id"), nullable=False, index=True)
+    patient_id = Column(String, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    symptom = Column(String, nullable=False)
+    value = Column(Float, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("session_id", "symptom", name="uq_symptom_scores_session_symptom"),
+        Index("ix_symptom_scores_patient_ts", "patient_id", "timestamp", "symptom"),
+    )
+
+class Alert(Base):
+    """
+    Alertas clínicas precalculadas por el escáner de cohorte en segundo plano.
+    Una alerta activa por (paciente, tipo, síntoma); al dejar de cumplirse se marca resuelta.
+    """
+    __tablename__ = "alerts"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    patient_id = Column(String, nullable=False, index=True)
+    alert_type = Column(String, nullable=False)  # 'critical_level' | 'worsening_trend'
+    severity = Column(String, nullable=False)
+    symptom = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    trend_slope = Column(Float, nullable=True)
+    session_date = Column(DateTime, nullable=True)
+    is_active = Column(Boolean, default=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    resolved_at = Column(DateTime, nullable=True)
+
+class AlertScanState(Base):
+    """Marca de agua del escáner de alertas (último SymptomScore.id procesado) y lock entre workers."""
+    __tablename__ = "alert_scan_state"
+
+    id = Column(Integer, primary_key=True)
+    last_score_id = Column(Integer, default=0, nullable=False)
+    locked_until = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+
 class AnalysisFeedback(Base):
     """
     Modelo para Active Learning.
@@ -4,10 +4,13 @@ import sys
 import logging
 import datetime
 import uuid
-from typing import Dict, Optional
+import base64
+import asyncio
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import and_, or_, func, select, exists
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
@@ -15,12 +18,23 @@ from pydantic import BaseModel
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Database & Models
-from backend.database import SessionLocal, engine, get_db
-from backend.models import Base, User, Patient, SessionLog, AnalysisFeedback
-from backend.auth import get_password_hash, oauth2_scheme, decode_token
+from backend.database import SessionLocal, engine, get_db, get_async_db, AsyncSession, get_pool_stats
+from backend.models import Base, User, Patient, SessionLog, AnalysisFeedback, SymptomScore, Alert
+from backend.db_migrations import run_migrations
+from backend.auth import get_password_hash, oauth2_scheme, resolve_current_user, aresolve_current_user, auth_cache
 from backend.auth_routes import auth_router
 from backend.services.langchain_manager import langchain_agent
 from backend.services.rag_service import rag_service
+from backend.services.llm_cache import llm_cache
+from backend.services.embedding_cache import embedding_cache
+from backend.services.llm_router import llm_router
+from backend.services.single_flight import llm_single_flight
+from backend.services.quota_scheduler import quota_scheduler, is_quota_error
+from backend.services.agent_metrics import agent_metrics
+from backend.services.password_service import password_service
+from backend.services.triage_service import triage_service
+from backend.services.oncology_evolution_service import oncology_evolution_service
+from backend.services.alert_scanner_service import alert_scanner_service
 
 # -----------------------------------------------------------------------------
 # Configuration & Logging
@@ -28,8 +42,9 @@ from backend.services.rag_service import rag_service
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create tables
+# Create tables (+ columnas/índices pendientes en bases existentes)
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # -----------------------------------------------------------------------------
 # Model Manager (The "AI Brain")
@@ -108,47 +123,44 @@ model_manager = ModelManager()
 # -----------------------------------------------------------------------------
 # Safety Layer
 # -----------------------------------------------------------------------------
-CRITICAL_KEYWORDS = [
-    # Riesgo Suicida / Psicológico
-    "matarme", "suicidio", "acabar con todo", "morir", "muerte", "no quiero vivir",
-    # Urgencias Oncológicas
-    "no puedo respirar", "falta de aire", "ahogo", "asfixia",  # Disnea
-    "dolor insoportable", "gritos de dolor", "no aguanto el dolor", # Crisis de dolor
-    "sangrando", "hemorragia", "sangre", # Sangrado
-    "fiebre alta", "tiritona" # Neutropenia/Sepsis
-]
+# El léxico de urgencias vive en services/triage_service.py (pre-triaje local
+# por niveles delante del agente LLM de riesgo).
 
 def check_risk_keywords(text: str):
     """
     Scans text for critical keywords indicating self-harm or immediate danger.
     Returns: (is_risky: bool, alert_message: str|None)
     """
-    text_lower = text.lower()
-    for keyword in CRITICAL_KEYWORDS:
-        if keyword in text_lower:
-            return True, f"⚠️ ALERTA: Palabra clave detectada '{keyword}'. Protocolo de seguridad activado."
+    hits = triage_service.scan(text)
+    for level in ("critical", "warning", "negated"):
+        for category, terms in hits.get(level, {}).items():
+            return True, f"⚠️ ALERTA: Palabra clave detectada '{terms[0]}' ({category}). Protocolo de seguridad activado."
     return False, None
 
+def ai_error_status(e: Exception) -> int:
+    """Traduce un error de los agentes IA a código HTTP (504 timeout, 429 cuota, 503 resto)."""
+    if isinstance(e, asyncio.TimeoutError):
+        return 504
+    if is_quota_error(e):
+        return 429
+    return 503
+
 # -----------------------------------------------------------------------------
 # Dependencies
 # -----------------------------------------------------------------------------
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """
     Dependencia para obtener el usuario actual desde el token JWT.
+    Devuelve un UserSnapshot cacheado (id, email, full_name, is_active).
     """
-    token_data = decode_token(token)
-    if not token_data:
-        raise HTTPException(
-            status_code=401,
-            detail="No se pudieron validar las credenciales",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
-        
-    return user
+    return resolve_current_user(token, db)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """
+    Variante async de get_current_user para los endpoints con AsyncSession:
+    no ocupa un hilo del threadpool (cache hit = sin consulta a la BD).
+    """
+    return await aresolve_current_user(token, db)
 
 # -----------------------------------------------------------------------------
 # FastAPI App Setup
@@ -165,6 +177,11 @@ async def startup_event():
     logger.info("🚀 Iniciando servicios de OncologIA...")
     # CLOUD: Modelo local deshabilitado (no está en repo)
     # model_manager.load_nlp_model()
+    alert_scanner_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    alert_scanner_service.stop()
 
 # CORS
 app.add_middleware(
@@ -192,6 +209,52 @@ class SessionResponse(BaseModel):
     risk_flag: bool
     alert: Optional[str] = None
     emotion_analysis: Dict[str, float]
+    triage_tier: Optional[str] = None
+
+class BatchSessionInput(BaseModel):
+    items: List[SessionInput]
+
+class BatchItemResult(BaseModel):
+    index: int
+    patient_id: str
+    success: bool
+    session_id: Optional[str] = None
+    timestamp: Optional[str] = None
+    risk_flag: Optional[bool] = None
+    alert: Optional[str] = None
+    emotion_analysis: Optional[Dict[str, float]] = None
+    triage_tier: Optional[str] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+
+class BatchSessionResponse(BaseModel):
+    success: bool
+    total: int
+    processed: int
+    failed: int
+    results: List[BatchItemResult]
+
+# Paginación del historial
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_PREVIEW_CHARS = 100
+
+def encode_history_cursor(created_at: datetime.datetime, session_id: str) -> str:
+    """Cursor opaco para paginación keyset sobre (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_history_cursor(cursor: str):
+    """Inverso de encode_history_cursor. Lanza ValueError si el cursor no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, session_id = raw.split("|", 1)
+        return datetime.datetime.fromisoformat(created_at), session_id
+    except Exception as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+# Tamaño máximo de lote aceptado por /session/analyze/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
 
 # -----------------------------------------------------------------------------
 # Test User Init
@@ -234,24 +297,90 @@ def get_model_info():
     }
 
 @app.get("/history", tags=["Historial"])
-def get_history(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    risk_flag: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    """Obtiene el historial de sesiones analizadas."""
-    logs = db.query(SessionLog).order_by(SessionLog.created_at.desc()).all()
+    """
+    Obtiene el historial de sesiones analizadas, paginado por cursor (created_at, id).
+    Solo proyecta las columnas del listado: el texto se trunca en SQL y el informe
+    SOAP no se carga (usar GET /session/{session_id} para el detalle).
+    """
+    query = select(
+        SessionLog.id,
+        SessionLog.patient_id,
+        SessionLog.created_at,
+        func.substr(SessionLog.raw_text, 1, HISTORY_PREVIEW_CHARS).label("preview"),
+        (func.length(SessionLog.raw_text) > HISTORY_PREVIEW_CHARS).label("truncated"),
+        SessionLog.emotion_analysis,
+        SessionLog.risk_flag,
+        SessionLog.triage_tier,
+        SessionLog.soap_report.isnot(None).label("has_soap_report")
+    )
+
+    if patient_id:
+        query = query.where(SessionLog.patient_id == patient_id)
+    if risk_flag is not None:
+        query = query.where(SessionLog.risk_flag == risk_flag)
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_history_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+        query = query.where(or_(
+            SessionLog.created_at < cursor_created_at,
+            and_(SessionLog.created_at == cursor_created_at, SessionLog.id < cursor_id)
+        ))
+
+    query = query.order_by(SessionLog.created_at.desc(), SessionLog.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
     # Mapear para que el frontend lo entienda
-    return [
+    items = [
         {
-            "id": log.id,
-            "patient_id": log.patient_id,
-            "timestamp": log.created_at.isoformat(),
-            "raw_text": log.raw_text[:100] + "..." if len(log.raw_text) > 100 else log.raw_text,
-            "emotion_analysis": log.emotion_analysis,
-            "risk_flag": log.risk_flag,
-            "soap_report": log.soap_report
-        } for log in logs
+            "id": row.id,
+            "patient_id": row.patient_id,
+            "timestamp": row.created_at.isoformat(),
+            "raw_text": row.preview + "..." if row.truncated else row.preview,
+            "raw_text_truncated": bool(row.truncated),
+            "emotion_analysis": row.emotion_analysis,
+            "risk_flag": row.risk_flag,
+            "triage_tier": row.triage_tier,
+            "has_soap_report": bool(row.has_soap_report)
+        } for row in rows
     ]
+    return {
+        "items": items,
+        "next_cursor": encode_history_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
+        "has_more": has_more
+    }
+
+@app.get("/session/{session_id}", tags=["Historial"])
+def get_session_detail(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Detalle completo de una sesión (texto íntegro e informe SOAP)."""
+    session = db.query(SessionLog).filter(SessionLog.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    return {
+        "id": session.id,
+        "patient_id": session.patient_id,
+        "timestamp": session.created_at.isoformat(),
+        "raw_text": session.raw_text,
+        "emotion_analysis": session.emotion_analysis,
+        "risk_flag": session.risk_flag,
+        "triage_tier": session.triage_tier,
+        "soap_report": session.soap_report
+    }
 
 @app.get("/gallery/images", tags=["Pacientes"])
 def get_patients_gallery(
@@ -272,31 +401,86 @@ def get_patients_gallery(
     ]
 
 @app.get("/patient/{patient_id}/evolution", tags=["Pacientes"])
-def get_patient_evolution(
+async def get_patient_evolution(
     patient_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Obtiene la evolución de los síntomas oncológicos (ESAS) del paciente.
     Devuelve tendencias de Dolor, Fatiga, Ansiedad, etc., y alertas de recaída.
     """
-    # 1. Obtener logs verificando que pertenezcan al paciente (o que el médico tenga acceso)
+    # 1. Serie temporal materializada (rango indexado por paciente/fecha, sin texto)
     # Por ahora asumimos médico admin puede ver todo.
-    logs = db.query(SessionLog).filter(SessionLog.patient_id == patient_id).all()
-    
-    if not logs:
+    rows = list((await db.execute(
+        select(
+            SymptomScore.session_id, SymptomScore.timestamp, SymptomScore.symptom, SymptomScore.value
+        ).where(
+            SymptomScore.patient_id == patient_id,
+            SymptomScore.symptom.in_(list(oncology_evolution_service.TRACKED_SYMPTOMS))
+        ).order_by(SymptomScore.timestamp)
+    )).all())
+
+    # Sesiones aún no migradas (ver `python -m backend.db_migrations --backfill-symptoms`):
+    # se fusionan con la serie para que un paciente con historial antiguo y sesiones
+    # nuevas no pierda las primeras del timeline, tendencias y alertas
+    pending = (await db.execute(
+        select(SessionLog.id, SessionLog.patient_id, SessionLog.created_at, SessionLog.emotion_analysis).where(
+            SessionLog.patient_id == patient_id,
+            ~exists().where(SymptomScore.session_id == SessionLog.id)
+        )
+    )).all()
+    for log in pending:
+        rows.extend(oncology_evolution_service.build_symptom_scores(log))
+    if not rows:
         return {"status": "no_data", "timeline": [], "alerts": []}
     
     # 2. Llamar al servicio de evolución oncológica
     try:
-        from backend.services.oncology_evolution_service import oncology_evolution_service
-        result = oncology_evolution_service.analyze_evolution(logs)
-        return result
+        return oncology_evolution_service.analyze_symptom_series(rows)
     except Exception as e:
         logger.error(f"Error analizando evolución oncológica: {e}")
         raise HTTPException(status_code=500, detail="Error analizando evolución del paciente")
 
+@app.get("/alerts", tags=["Pacientes"])
+def get_alerts(
+    since: Optional[datetime.datetime] = None,
+    patient_id: Optional[str] = None,
+    include_resolved: bool = False,
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Alertas clínicas precalculadas por el escáner de cohorte (sin recalcular por paciente).
+    `since` devuelve solo las alertas creadas, actualizadas o resueltas desde esa fecha (UTC).
+    """
+    query = db.query(Alert)
+    if not include_resolved:
+        query = query.filter(Alert.is_active == True)
+    if since:
+        query = query.filter(Alert.updated_at >= since)
+    if patient_id:
+        query = query.filter(Alert.patient_id == patient_id)
+
+    alerts = query.order_by(Alert.updated_at.desc()).limit(limit).all()
+    return [
+        {
+            "id": a.id,
+            "patient_id": a.patient_id,
+            "type": a.alert_type,
+            "severity": a.severity,
+            "symptom": a.symptom,
+            "message": a.message,
+            "trend_slope": a.trend_slope,
+            "date": a.session_date.isoformat() if a.session_date else None,
+            "is_active": a.is_active,
+            "created_at": a.created_at.isoformat(),
+            "updated_at": a.updated_at.isoformat(),
+            "resolved_at": a.resolved_at.isoformat() if a.resolved_at else None
+        } for a in alerts
+    ]
+
 # --- Asistente Clínico (RAG) ---
 
 class ChatRequest(BaseModel):
@@ -304,10 +488,10 @@ class ChatRequest(BaseModel):
     patient_id: Optional[str] = None
 
 @app.post("/api/chat", tags=["Asistente Clínico"])
-def chat_clinical_assistant(
+async def chat_clinical_assistant(
     request: ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Chat con el asistente clínico (RAG + Contexto Paciente).
@@ -316,14 +500,14 @@ def chat_clinical_assistant(
     patient_context = ""
     if request.patient_id:
         # Recuperar resumen básico del paciente
-        patient = db.query(Patient).filter(Patient.did == request.patient_id).first()
+        patient = (await db.execute(
+            select(Patient.full_name, Patient.did).where(Patient.did == request.patient_id)
+        )).first()
         if patient:
             patient_context = f"Paciente: {patient.full_name} (ID: {patient.did})."
             # Opcional: Podríamos añadir diagnósticos recientes aquí
     
-    from backend.services.langchain_manager import langchain_agent
-    result = langchain_agent.chat_agent(request.query, patient_context)
-    return result
+    return await langchain_agent.achat_agent(request.query, patient_context, patient_id=request.patient_id)
 
 @app.get("/health", tags=["Estatus"])
 def health_check():
@@ -335,66 +519,96 @@ def health_check():
         "app": "OncologIA"
     }
 
+@app.get("/llm-cache/stats", tags=["Estatus"])
+def get_llm_cache_stats(current_user: User = Depends(get_current_user)):
+    """Contadores de aciertos/fallos de la caché del LLM y de llamadas agrupadas (single-flight)."""
+    return {**llm_cache.stats(), "single_flight": llm_single_flight.stats()}
+
+@app.get("/embedding-cache/stats", tags=["Estatus"])
+def get_embedding_cache_stats(current_user: User = Depends(get_current_user)):
+    """Ratio de aciertos, memoria ocupada y CPU ahorrada de la caché de embeddings de consultas RAG."""
+    return embedding_cache.stats()
+
+@app.get("/rag/stats", tags=["Estatus"])
+def get_rag_stats(current_user: User = Depends(get_current_user)):
+    """Modo del RAG (local o servicio lateral), almacén, caché de embeddings, BM25 y lotes del servicio."""
+    return rag_service.stats()
+
+@app.get("/llm-router/stats", tags=["Estatus"])
+def get_llm_router_stats(current_user: User = Depends(get_current_user)):
+    """Latencias, errores, estado del circuito y hedges por backend LLM."""
+    return llm_router.stats()
+
+@app.get("/metrics", tags=["Estatus"])
+def get_metrics():
+    """Métricas Prometheus por agente: latencia, tokens, coste, caché, fallbacks y fallos de parseo."""
+    rendered = agent_metrics.render()
+    if rendered is None:
+        raise HTTPException(status_code=503, detail="Métricas no disponibles (prometheus-client no instalado)")
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
+@app.get("/llm-quota/stats", tags=["Estatus"])
+def get_llm_quota_stats(current_user: User = Depends(get_current_user)):
+    """Profundidad de cola y espera por carril de prioridad, 429 recibidos y cuota disponible."""
+    return quota_scheduler.stats()
+
+@app.get("/auth-cache/stats", tags=["Estatus"])
+def get_auth_cache_stats(current_user: User = Depends(get_current_user)):
+    """Ratio de aciertos de la caché de tokens JWT y usuarios autenticados."""
+    return auth_cache.stats()
+
+@app.get("/db-pool/stats", tags=["Estatus"])
+def get_db_pool_stats(current_user: User = Depends(get_current_user)):
+    """Ocupación del pool de conexiones y tiempos de espera por checkout."""
+    return get_pool_stats()
+
+@app.get("/password-pool/stats", tags=["Estatus"])
+def get_password_pool_stats(current_user: User = Depends(get_current_user)):
+    """Tiempos en cola/ejecución del pool bcrypt de login y registro."""
+    return password_service.stats()
+
 @app.post("/session/analyze", response_model=SessionResponse, tags=["Clinical Core"])
-def analyze_session(
+async def analyze_session(
     input_data: SessionInput,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Recibe texto de sesión/diario, analiza emociones y detecta riesgos con agentes LangChain.
+    El triaje de riesgo y la extracción de síntomas (ESAS) se ejecutan en paralelo.
     """
-    # 1. AI Risk Analysis (LangChain Agent)
+    # 1. AI Risk Analysis + Symptom Extraction (ESAS) en paralelo (LangChain Agents)
+    # El pre-triaje local (léxico y, si scikit-learn está instalado, el modelo TF-IDF de
+    # emotion_ml_service) resuelve los casos evidentes sin llamar al LLM.
     try:
-        risk_data = langchain_agent.analyze_risk_agent(input_data.text)
+        risk_data, emotions, triage_tier = await langchain_agent.analyze_session_agents(input_data.text)
         risk_flag = risk_data.risk_found
         risk_msg = risk_data.explanation if risk_flag else None
+    except asyncio.TimeoutError as e:
+        logger.error(f"Timeout en análisis de sesión: {e}")
+        raise HTTPException(status_code=504, detail="Tiempo de análisis de IA agotado")
     except Exception as e:
         logger.error(f"Error en Risk Analysis: {e}")
-        status_code = 503
-        if "429" in str(e) or "quota" in str(e).lower():
-            status_code = 429
-        raise HTTPException(status_code=status_code, detail=f"Error de IA: {str(e)}")
-    
+        raise HTTPException(status_code=ai_error_status(e), detail=f"Error de IA: {str(e)}")
     
-    # 2. Local Emotion Analysis -> Replaced by Symptom Extraction (ESAS) for Oncology
-    # emotions = model_manager.analyze_text(input_data.text)
-    
-    # NEW: Use LangChain Agent to extract clinical symptoms (Pain, Fatigue, etc.)
-    try:
-        emotions = langchain_agent.extract_symptoms_agent(input_data.text)
-        
-        # CLOUD LITE: ML model disabled (PyTorch not in requirements-lite)
-        # try:
-        #     from backend.services.emotion_ml_service import emotion_ml_service
-        #     ml_prediction = emotion_ml_service.predict_emotion(input_data.text)
-        #     if ml_prediction:
-        #         emotions['detected_mood_ml'] = ml_prediction['emotion']
-        #         emotions['mood_confidence'] = ml_prediction['confidence']
-        # except Exception as ml_e:
-        #     logger.warning(f"ML Public Model prediction failed: {ml_e}")
-
-    except Exception as e:
-        logger.error(f"Error extracting symptoms: {e}")
-        # Fallback to empty if fails, or try model_manager as last resort if loaded
-        emotions = {}
-    
-    # 3. Create Session Log
+    # 2. Create Session Log
     new_log = SessionLog(
         id=str(uuid.uuid4()),
         patient_id=input_data.patient_id,
         raw_text=input_data.text,
         emotion_analysis=emotions,
         risk_flag=risk_flag,
+        triage_tier=triage_tier,
         created_at=datetime.datetime.utcnow()
     )
     
     try:
         db.add(new_log)
-        db.commit()
-        db.refresh(new_log)
+        db.add_all(oncology_evolution_service.build_symptom_scores(new_log))
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error saving session: {e}")
         raise HTTPException(status_code=500, detail="Error guardando sesión")
         
@@ -404,17 +618,98 @@ def analyze_session(
         "timestamp": new_log.created_at.isoformat(),
         "risk_flag": risk_flag,
         "alert": risk_msg,
-        "emotion_analysis": emotions
+        "emotion_analysis": emotions,
+        "triage_tier": triage_tier
+    }
+
+@app.post("/session/analyze/batch", response_model=BatchSessionResponse, tags=["Clinical Core"])
+async def analyze_session_batch(
+    batch: BatchSessionInput,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Ingesta masiva de diarios (p.ej. un día completo de enfermería).
+    Los textos se reparten entre los agentes con concurrencia acotada y todas las
+    sesiones válidas se guardan en una única transacción. Los fallos por item se
+    reportan en la respuesta sin abortar el lote.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BATCH_MAX_ITEMS} sesiones por lote")
+
+    outcomes = await langchain_agent.analyze_sessions_batch([item.text for item in batch.items])
+
+    results = []
+    new_logs = []
+    for index, (item, outcome) in enumerate(zip(batch.items, outcomes)):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error en análisis de lote (item {index}): {outcome}")
+            detail = "Tiempo de análisis de IA agotado" if isinstance(outcome, asyncio.TimeoutError) else f"Error de IA: {str(outcome)}"
+            results.append(BatchItemResult(
+                index=index,
+                patient_id=item.patient_id,
+                success=False,
+                error=detail,
+                status_code=ai_error_status(outcome)
+            ))
+            continue
+
+        risk_data, emotions, triage_tier = outcome
+        new_log = SessionLog(
+            id=str(uuid.uuid4()),
+            patient_id=item.patient_id,
+            raw_text=item.text,
+            emotion_analysis=emotions,
+            risk_flag=risk_data.risk_found,
+            triage_tier=triage_tier,
+            created_at=datetime.datetime.utcnow()
+        )
+        new_logs.append(new_log)
+        results.append(BatchItemResult(
+            index=index,
+            patient_id=item.patient_id,
+            success=True,
+            session_id=new_log.id,
+            timestamp=new_log.created_at.isoformat(),
+            risk_flag=risk_data.risk_found,
+            alert=risk_data.explanation if risk_data.risk_found else None,
+            emotion_analysis=emotions,
+            triage_tier=triage_tier
+        ))
+
+    if new_logs:
+        try:
+            db.add_all(new_logs)
+            for log in new_logs:
+                db.add_all(oncology_evolution_service.build_symptom_scores(log))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error guardando lote de sesiones: {e}")
+            raise HTTPException(status_code=500, detail="Error guardando lote de sesiones")
+
+    failed = sum(1 for r in results if not r.success)
+    logger.info(f"📦 Lote procesado: {len(new_logs)} sesiones guardadas, {failed} fallidas")
+    return {
+        "success": failed == 0,
+        "total": len(results),
+        "processed": len(new_logs),
+        "failed": failed,
+        "results": results
     }
 
 @app.post("/api/reports/generate_soap/{session_id}", tags=["Generative AI"])
 def generate_soap_note(
     session_id: str,
+    regenerate: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Genera un informe clínico en formato SOAP con memoria usando Agentes LangChain.
+    Con regenerate=true se ignora la caché de respuestas del LLM.
     """
     session = db.query(SessionLog).filter(SessionLog.id == session_id).first()
     if not session:
@@ -430,7 +725,8 @@ def generate_soap_note(
         soap_note = langchain_agent.generate_soap_agent(
             session.patient_id, 
             raw_text, 
-            emotion_metrics
+            emotion_metrics,
+            use_cache=not regenerate
         )
         
         # 3. Persistir en DB
@@ -446,15 +742,13 @@ def generate_soap_note(
         }
     except Exception as e:
         logger.error(f"Error en generación SOAP: {e}")
-        status_code = 503
-        if "429" in str(e) or "quota" in str(e).lower():
-            status_code = 429
-        raise HTTPException(status_code=status_code, detail=f"Error de IA: {str(e)}")
+        raise HTTPException(status_code=ai_error_status(e), detail=f"Error de IA: {str(e)}")
 
 
 @app.post("/api/reports/psychoeducation/{session_id}", tags=["Generative AI"])
 def generate_psychoeducation(
     session_id: str,
+    regenerate: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -474,7 +768,8 @@ def generate_psychoeducation(
         draft = langchain_agent.generate_psychoeducation_agent(
             session.patient_id,
             session.soap_report,
-            session.emotion_analysis or {}
+            session.emotion_analysis or {},
+            use_cache=not regenerate
         )
         
         return {
@@ -484,10 +779,7 @@ def generate_psychoeducation(
         }
     except Exception as e:
         logger.error(f"Error en generación TCC: {e}")
-        status_code = 503
-        if "429" in str(e) or "quota" in str(e).lower():
-            status_code = 429
-        raise HTTPException(status_code=status_code, detail=f"Error de IA: {str(e)}")
+        raise HTTPException(status_code=ai_error_status(e), detail=f"Error de IA: {str(e)}")
 
 
 
@@ -40,6 +40,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Ahora podemos importar los módulos de la base de datos
 from backend.database import SessionLocal, engine, get_db
+from backend.db_migrations import run_migrations
 from backend.models import Base, User, AnalysisResult, Patient
 from backend.auth import create_access_token, verify_password, get_password_hash
 from backend.auth_routes import auth_router
@@ -60,6 +61,7 @@ logger = logging.getLogger(__name__)
 
 # Crear tablas en la base de datos
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # --- Creación de usuario de prueba ---
 def create_test_user_if_not_exists():
@@ -328,22 +330,11 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     """
     Dependencia para obtener el usuario actual desde el token JWT.
     Centraliza la lógica de autenticación y manejo de errores 401.
+    Devuelve un UserSnapshot cacheado (id, email, full_name, is_active).
     """
-    from backend.auth import decode_token
-    
-    token_data = decode_token(token)
-    if not token_data:
-        raise HTTPException(
-            status_code=401,
-            detail="No se pudieron validar las credenciales",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    user = db.query(User).filter(User.email == token_data.email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
-        
-    return user
+    from backend.auth import resolve_current_user
+
+    return resolve_current_user(token, db)
 
 def get_analysis_service(db: Session = Depends(get_db)):
     """Dependencia para obtener el servicio de análisis"""
@@ -0,0 +1,197 @@
+"""
+Servicio de recuperación (RAG) en un proceso aparte, compartido por todos los
+workers de la API a través de un socket Unix.
+
+Sin él, cada worker de gunicorn construye su propio RagService: una copia del
+modelo SentenceTransformer, un cliente Chroma propio y varios escritores sobre
+el mismo ./chroma_db. Con él, el modelo y los índices viven una sola vez (la
+memoria de embeddings no crece con el número de workers) y hay un único
+escritor; los workers usan RagSidecarClient (ver rag_service.py).
+
+Protocolo: una línea JSON por petición, {"op": ..., "args": {...}}, y una por
+respuesta, {"result": ...} o {"error": "..."}. Las consultas que llegan dentro
+de la misma ventana (--batch-window-ms) se agrupan: sus textos se vectorizan
+en una sola llamada al modelo (la caché de embeddings reparte los vectores) y
+después se resuelven en serie en un hilo, sin bloquear el event loop.
+
+Uso:
+    python backend/rag_server.py --socket /tmp/oncologia-rag.sock
+    RAG_SIDECAR_SOCKET=/tmp/oncologia-rag.sock gunicorn backend.onco_api:app --workers 4 ...
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Tuple
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("rag_server")
+
+# Tamaño máximo de una línea de petición (el límite por defecto de asyncio, 64 KiB,
+# se queda corto para un diario largo en store_feedback)
+MAX_LINE_BYTES = int(os.getenv("RAG_SIDECAR_MAX_LINE_BYTES", str(16 << 20)))
+
+# Operación -> argumento con el texto a vectorizar
+BATCHED_OPS = {"query_expert": "query", "find_similar_feedback": "text", "store_feedback": "text"}
+
+
+class RetrievalServer:
+    def __init__(self, service, batch_window_ms: float = 2.0, max_batch: int = 32,
+                 max_line_bytes: int = MAX_LINE_BYTES):
+        self.service = service
+        self.max_line_bytes = max_line_bytes
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "asyncio.Queue[Tuple[str, Dict, asyncio.Future]]" = None
+        self._ingest_lock = None
+
+        self.requests = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.embed_seconds = 0.0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Línea por encima del límite: el resto de la petición sigue en el socket,
+                    # así que se responde con el error y se cierra la conexión
+                    logger.warning(f"⚠️ Petición de más de {self.max_line_bytes} bytes rechazada")
+                    response = {"error": f"Petición demasiado grande (máximo {self.max_line_bytes} bytes)"}
+                    writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    response = {"result": await self._dispatch(request["op"], request.get("args") or {})}
+                except Exception as e:
+                    response = {"error": f"{type(e).__name__}: {e}"}
+                writer.write((json.dumps(response, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, op: str, args: Dict) -> Any:
+        if op in BATCHED_OPS:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((op, args, future))
+            return await future
+        if op == "ingest_documents":
+            # Fuera de los lotes: una ingesta larga no frena las consultas
+            async with self._ingest_lock:
+                return await asyncio.to_thread(self.service.ingest_documents, **args)
+        if op == "stats":
+            return self.stats()
+        raise ValueError(f"Operación desconocida: {op}")
+
+    async def _batcher(self) -> None:
+        """Agrupa lo que llega en la ventana (o mientras se resuelve el lote anterior)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            results = await asyncio.to_thread(self._run_batch, batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _run_batch(self, batch: List[Tuple[str, Dict, asyncio.Future]]) -> List[Tuple[bool, Any]]:
+        self.requests += len(batch)
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+        # Una sola llamada al modelo para todos los textos del lote: quedan en la caché
+        # de embeddings y cada operación los recupera de ahí
+        texts = list(dict.fromkeys(args[BATCHED_OPS[op]] for op, args, _ in batch))
+        started = time.perf_counter()
+        try:
+            if getattr(self.service, "ef", None) is not None:
+                self.service.embed_queries(texts)
+        except Exception as e:
+            logger.warning(f"⚠️ Error vectorizando lote de {len(texts)} textos: {e}")
+        self.embed_seconds += time.perf_counter() - started
+
+        results = []
+        for op, args, _ in batch:
+            try:
+                results.append((True, getattr(self.service, op)(**args)))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+    def stats(self) -> Dict:
+        return {
+            **self.service.stats(),
+            "sidecar": {
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch_seen,
+                "batch_embed_seconds": round(self.embed_seconds, 3),
+            },
+        }
+
+    async def serve(self, socket_path: str) -> None:
+        self._queue = asyncio.Queue()
+        self._ingest_lock = asyncio.Lock()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=socket_path, limit=self.max_line_bytes)
+        os.chmod(socket_path, 0o660)
+        batcher = asyncio.create_task(self._batcher())
+        logger.info(f"🧠 Servicio RAG escuchando en {socket_path} (ventana {self.batch_window * 1000:g} ms, "
+                    f"lotes de hasta {self.max_batch})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio RAG compartido por los workers de la API")
+    parser.add_argument("--socket", default=os.getenv("RAG_SIDECAR_SOCKET") or "/tmp/oncologia-rag.sock")
+    parser.add_argument("--batch-window-ms", type=float, default=float(os.getenv("RAG_SIDECAR_BATCH_WINDOW_MS", "2")))
+    parser.add_argument("--max-batch", type=int, default=int(os.getenv("RAG_SIDECAR_MAX_BATCH", "32")))
+    args = parser.parse_args()
+
+    # Este proceso es el servidor: RagService completo, no el cliente del socket
+    os.environ.pop("RAG_SIDECAR_SOCKET", None)
+    from backend.services.rag_service import rag_service
+
+    server = RetrievalServer(rag_service, args.batch_window_ms, args.max_batch)
+    try:
+        asyncio.run(server.serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Instrumentación por agente de las llamadas al LLM (Prometheus).
+
+Un callback de LangChain mide cada llamada real al modelo (inicio -> fin/error)
+etiquetada con el agente (risk, symptoms, soap, psycho, chat...) y el backend
+que la sirvió, y suma los tokens de entrada/salida que devuelve el proveedor.
+Lo que no llega al modelo se cuenta aparte desde langchain_manager: aciertos
+de caché, respuestas de modo demo (fallback) y salidas JSON que no se pudieron
+parsear.
+
+Con gunicorn (varios workers) definir PROMETHEUS_MULTIPROC_DIR antes de
+arrancar (no basta con ponerlo en la app: prometheus_client lo lee al
+importarse) y usar backend/gunicorn_conf.py, que limpia el directorio al
+arrancar y llama a multiprocess.mark_process_dead cuando muere un worker.
+Así /metrics agrega los contadores de todos los procesos.
+
+Si prometheus_client no está instalado, los contadores no hacen nada y
+/metrics responde 503.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class _NoopMetric:
+    """Sustituto de Counter/Histogram sin prometheus_client: acepta las mismas llamadas."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    def labels(self, *args: Any) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+if not PROMETHEUS_AVAILABLE:
+    logger.info("ℹ️ prometheus_client no instalado: métricas por agente desactivadas (/metrics responde 503).")
+    Counter = Histogram = _NoopMetric
+
+LLM_LATENCY = Histogram(
+    "llm_agent_latency_seconds", "Latencia de cada llamada al modelo por agente",
+    ["agent", "backend", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60),
+)
+LLM_TOKENS = Counter("llm_agent_tokens_total", "Tokens consumidos por agente", ["agent", "backend", "kind"])
+LLM_COST = Counter("llm_agent_cost_usd_total", "Coste estimado (USD) por agente", ["agent"])
+LLM_CACHE_HITS = Counter("llm_agent_cache_hits_total", "Respuestas servidas desde la caché LLM", ["agent"])
+LLM_FALLBACKS = Counter("llm_agent_fallbacks_total", "Respuestas de modo demo por fallo del servicio de IA", ["agent"])
+LLM_PARSE_FAILURES = Counter("llm_agent_parse_failures_total", "Salidas del modelo que no se pudieron parsear", ["agent"])
+
+
+class AgentMetricsCallback(BaseCallbackHandler):
+    """
+    Callback sin estado por petición: empareja inicio y fin por run_id.
+    Las llamadas async canceladas (hedges perdedores) no siempre reciben
+    on_llm_error; sus entradas se descartan pasado RUN_TTL_SECONDS.
+    """
+
+    RUN_TTL_SECONDS = 600
+
+    def __init__(self):
+        self._runs: "OrderedDict[UUID, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.price_input = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.10"))
+        self.price_output = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.40"))
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        now = time.perf_counter()
+        with self._lock:
+            while self._runs and now - next(iter(self._runs.values()))[2] > self.RUN_TTL_SECONDS:
+                self._runs.popitem(last=False)
+            self._runs[run_id] = (
+                metadata.get("agent", "unknown"),
+                metadata.get("llm_backend", "default"),
+                now,
+            )
+
+    def _finish(self, run_id: UUID, outcome: str):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        agent, backend, started = run
+        LLM_LATENCY.labels(agent, backend, outcome).observe(time.perf_counter() - started)
+        return agent, backend
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._finish(run_id, "ok")
+        if run is None:
+            return
+        agent, backend = run
+        input_tokens, output_tokens = self._usage(response)
+        if input_tokens or output_tokens:
+            LLM_TOKENS.labels(agent, backend, "prompt").inc(input_tokens)
+            LLM_TOKENS.labels(agent, backend, "completion").inc(output_tokens)
+            LLM_COST.labels(agent).inc(
+                (input_tokens * self.price_input + output_tokens * self.price_output) / 1_000_000
+            )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Un hedge perdedor se cancela: no es un error del backend
+        self._finish(run_id, "cancelled" if isinstance(error, asyncio.CancelledError) else "error")
+
+    @staticmethod
+    def _usage(response: LLMResult) -> tuple:
+        """Tokens de usage_metadata (Gemini y HTTPChatModel) o de llm_output['token_usage']."""
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens) and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+        return input_tokens, output_tokens
+
+
+class AgentMetrics:
+    def __init__(self):
+        self.callback = AgentMetricsCallback()
+
+    def config(self, agent: str) -> Dict[str, Any]:
+        """RunnableConfig para las llamadas al modelo de un agente."""
+        return {"callbacks": [self.callback], "metadata": {"agent": agent}, "run_name": f"agent:{agent}"}
+
+    def cache_hit(self, agent: str) -> None:
+        LLM_CACHE_HITS.labels(agent).inc()
+
+    def fallback(self, agent: str) -> None:
+        LLM_FALLBACKS.labels(agent).inc()
+
+    def parse_failure(self, agent: str) -> None:
+        LLM_PARSE_FAILURES.labels(agent).inc()
+
+    @staticmethod
+    def render() -> Optional[tuple]:
+        """(cuerpo, content-type) en formato de exposición Prometheus; None sin prometheus_client."""
+        if not PROMETHEUS_AVAILABLE:
+            return None
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return generate_latest(registry), CONTENT_TYPE_LATEST
+        return generate_latest(), CONTENT_TYPE_LATEST
+
+
+# Instancia global
+agent_metrics = AgentMetrics()
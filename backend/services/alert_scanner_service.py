@@ -0,0 +1,173 @@
+"""
+Escáner de alertas de cohorte en segundo plano.
+
+Re-evalúa periódicamente solo los pacientes con sesiones nuevas desde la
+última pasada (marca de agua sobre SymptomScore.id) usando el modo cohorte
+de OncologyEvolutionService, y mantiene la tabla `alerts` para que el
+dashboard lea alertas precalculadas.
+"""
+
+import os
+import logging
+import threading
+import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, update, or_
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import SessionLocal
+from backend.models import Alert, AlertScanState, SymptomScore
+from backend.services.oncology_evolution_service import oncology_evolution_service
+
+logger = logging.getLogger(__name__)
+
+
+class AlertScannerService:
+    """Worker en proceso (hilo daemon) que precalcula alertas de forma incremental."""
+
+    def __init__(self):
+        self.enabled = os.getenv("ALERT_SCANNER_ENABLED", "1") == "1"
+        self.interval = float(os.getenv("ALERT_SCAN_INTERVAL_SECONDS", "60"))
+        self.chunk_size = int(os.getenv("ALERT_SCAN_CHUNK_SIZE", "500"))
+        # Los workers de gunicorn comparten la BD: solo uno escanea a la vez
+        self.lock_seconds = max(self.interval * 5, 300)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------------------------------------------------------
+    # Ciclo de vida
+    # -------------------------------------------------------------------------
+    def start(self) -> None:
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="alert-scanner", daemon=True)
+        self._thread.start()
+        logger.info(f"🔔 Escáner de alertas iniciado (cada {self.interval:.0f}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Error en escáner de alertas: {e}")
+            self._stop.wait(self.interval)
+
+    # -------------------------------------------------------------------------
+    # Pasada incremental
+    # -------------------------------------------------------------------------
+    def _claim(self, db, now: datetime.datetime) -> bool:
+        """Toma el lock de escaneo compartido (fila única en alert_scan_state)."""
+        if db.get(AlertScanState, 1) is None:
+            try:
+                db.add(AlertScanState(id=1, last_score_id=0))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+        result = db.execute(
+            update(AlertScanState)
+            .where(AlertScanState.id == 1)
+            .where(or_(AlertScanState.locked_until.is_(None), AlertScanState.locked_until < now))
+            .values(locked_until=now + datetime.timedelta(seconds=self.lock_seconds))
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def run_once(self) -> Dict[str, int]:
+        """Re-evalúa los pacientes con SymptomScore nuevos. Devuelve estadísticas de la pasada."""
+        db = SessionLocal()
+        now = datetime.datetime.utcnow()
+        stats = {"patients": 0, "new_alerts": 0, "resolved_alerts": 0}
+        try:
+            if not self._claim(db, now):
+                stats["skipped"] = 1
+                return stats
+
+            state = db.get(AlertScanState, 1)
+            try:
+                last_id = state.last_score_id or 0
+                max_id = db.query(func.max(SymptomScore.id)).scalar() or 0
+
+                if max_id > last_id:
+                    patients = [p for (p,) in db.query(SymptomScore.patient_id).filter(
+                        SymptomScore.id > last_id, SymptomScore.id <= max_id
+                    ).distinct()]
+
+                    for i in range(0, len(patients), self.chunk_size):
+                        chunk = patients[i:i + self.chunk_size]
+                        rows = db.query(
+                            SymptomScore.patient_id, SymptomScore.session_id, SymptomScore.timestamp,
+                            SymptomScore.symptom, SymptomScore.value
+                        ).filter(SymptomScore.patient_id.in_(chunk), SymptomScore.id <= max_id).all()
+                        created, resolved = self._sync_alerts(db, chunk, oncology_evolution_service.analyze_cohort(rows), now)
+                        stats["new_alerts"] += created
+                        stats["resolved_alerts"] += resolved
+
+                    stats["patients"] = len(patients)
+                    state.last_score_id = max_id
+
+                state.last_run_at = now
+            finally:
+                state.locked_until = None
+                db.commit()
+
+            if stats["patients"]:
+                logger.info(f"🔔 Alertas re-evaluadas: {stats}")
+            return stats
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _sync_alerts(self, db, patient_ids: List[str], results: Dict[str, Dict], now: datetime.datetime):
+        """Inserta/actualiza las alertas vigentes y resuelve las que ya no se cumplen."""
+        existing = {
+            (a.patient_id, a.alert_type, a.symptom): a
+            for a in db.query(Alert).filter(Alert.patient_id.in_(patient_ids), Alert.is_active == True)
+        }
+        created = 0
+
+        for patient_id in patient_ids:
+            for alert in results.get(patient_id, {}).get("alerts", []):
+                key = (patient_id, alert["type"], alert["symptom"])
+                session_date = datetime.datetime.fromisoformat(alert["date"]) if alert.get("date") else None
+                current = existing.pop(key, None)
+                if current is None:
+                    db.add(Alert(
+                        patient_id=patient_id,
+                        alert_type=alert["type"],
+                        severity=alert["severity"],
+                        symptom=alert["symptom"],
+                        message=alert["message"],
+                        trend_slope=alert.get("trend_slope"),
+                        session_date=session_date,
+                        is_active=True,
+                        created_at=now,
+                        updated_at=now
+                    ))
+                    created += 1
+                elif current.message != alert["message"] or current.trend_slope != alert.get("trend_slope"):
+                    current.severity = alert["severity"]
+                    current.message = alert["message"]
+                    current.trend_slope = alert.get("trend_slope")
+                    current.session_date = session_date or current.session_date
+                    current.updated_at = now
+
+        for stale in existing.values():
+            stale.is_active = False
+            stale.resolved_at = now
+            stale.updated_at = now
+
+        return created, len(existing)
+
+
+# Instancia global
+alert_scanner_service = AlertScannerService()
@@ -0,0 +1,220 @@
+"""
+Índice invertido BM25 persistente para la búsqueda léxica del RAG.
+
+Los embeddings MiniLM casan mal nombres de fármacos y dosis exactas
+("fentanilo transmucoso", "200 mcg"); este índice los recupera por término y
+query_expert fusiona su ranking con el denso de ChromaDB (RRF).
+
+Estructura (CSR, todo NumPy):
+    terms[row]                        -> término
+    indptr[row]:indptr[row + 1]       -> tramo de postings del término
+    post_doc / post_tf                -> fragmento y frecuencia de cada posting
+    doc_ids / doc_len                 -> id del fragmento (el de ChromaDB) y longitud
+La puntuación de una consulta recorre solo los postings de sus términos con
+operaciones vectorizadas: milisegundos con cientos de miles de fragmentos.
+
+Las altas y bajas se acumulan en memoria y commit() las fusiona y guarda el
+.npz de forma atómica; otros procesos (la API) recargan al cambiar el mtime.
+"""
+import os
+import re
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "de la que el en y a los del se las por un para con no una su al lo como mas pero sus le ya o este "
+    "ha si porque esta entre cuando muy sin sobre tambien me hasta hay donde quien desde todo nos durante "
+    "todos uno les ni contra otros ese eso ante ellos e esto mi antes algunos que unos yo otro otras otra "
+    "el tanto esa estos mucho quienes nada muchos cual poco ella estar estas algunas algo nosotros es son "
+    "the of and to in is for on with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin tildes ni stopwords. Conserva números (dosis) y términos de 2+ caracteres."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", text) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._added: Dict[str, Counter] = {}
+        self._removed: set = set()
+        self._mtime = None
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.terms: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.post_doc = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.doc_ids = np.zeros(0, dtype=str)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self._positions: Dict[str, int] = {}
+        self._norm = np.zeros(0, dtype=np.float32)
+
+    # -------------------------------------------------------------------------
+    # Persistencia
+    # -------------------------------------------------------------------------
+    def _load(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+            with np.load(self.path, allow_pickle=False) as data:
+                self.terms = data["terms"].tolist()
+                self.indptr = data["indptr"]
+                self.post_doc = data["post_doc"]
+                self.post_tf = data["post_tf"]
+                self.doc_ids = data["doc_ids"]
+                self.doc_len = data["doc_len"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Índice BM25 ilegible ({e}); se reconstruirá en la próxima ingesta.")
+            self._reset()
+            return
+        self._mtime = mtime
+        self._derive()
+
+    def _derive(self) -> None:
+        """Estructuras derivadas: término -> fila, id -> posición y normalización por longitud."""
+        self._rows = {term: row for row, term in enumerate(self.terms)}
+        self._positions = {doc_id: i for i, doc_id in enumerate(self.doc_ids.tolist())}
+        avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 1.0
+        self._norm = (self.k1 * (1 - self.b + self.b * self.doc_len / max(avgdl, 1e-9))).astype(np.float32)
+
+    def _refresh(self) -> None:
+        """Recarga si otro proceso (ingest_knowledge.py) ha guardado una versión nueva."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime and not self._added and not self._removed:
+            self._load()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, terms=np.array(self.terms, dtype=str), indptr=self.indptr, post_doc=self.post_doc,
+                post_tf=self.post_tf, doc_ids=self.doc_ids, doc_len=self.doc_len,
+            )
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    # -------------------------------------------------------------------------
+    # Altas y bajas
+    # -------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def ids(self) -> set:
+        with self._lock:
+            return (set(self._positions) - self._removed) | set(self._added)
+
+    def add(self, doc_id: str, text: str) -> None:
+        with self._lock:
+            self._added[doc_id] = Counter(tokenize(text))
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in doc_ids:
+                self._added.pop(doc_id, None)
+                if doc_id in self._positions:
+                    self._removed.add(doc_id)
+
+    def commit(self) -> None:
+        """Fusiona las altas/bajas pendientes en el CSR y lo guarda (atómico)."""
+        with self._lock:
+            if not self._added and not self._removed:
+                return
+            # Un id re-añadido sustituye a su versión anterior
+            dropped = self._removed | (set(self._added) & set(self._positions))
+            alive = np.ones(len(self.doc_ids), dtype=bool)
+            if dropped:
+                alive[[self._positions[doc_id] for doc_id in dropped]] = False
+            remap = np.cumsum(alive, dtype=np.int64) - 1
+
+            # Postings vivos (fila, fragmento, tf) con el fragmento renumerado
+            rows = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.indptr))
+            keep = alive[self.post_doc]
+            rows, docs, tfs = [rows[keep]], [remap[self.post_doc[keep]]], [self.post_tf[keep]]
+
+            # Postings nuevos; los términos desconocidos se añaden al final del vocabulario
+            n_alive = int(alive.sum())
+            new_ids, new_len = [], []
+            new_rows, new_docs, new_tfs = [], [], []
+            for j, (doc_id, counts) in enumerate(self._added.items()):
+                new_ids.append(doc_id)
+                new_len.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    row = self._rows.get(term)
+                    if row is None:
+                        row = self._rows[term] = len(self.terms)
+                        self.terms.append(term)
+                    new_rows.append(row)
+                    new_docs.append(n_alive + j)
+                    new_tfs.append(tf)
+            rows.append(np.array(new_rows, dtype=np.int64))
+            docs.append(np.array(new_docs, dtype=np.int64))
+            tfs.append(np.array(new_tfs, dtype=np.float32))
+
+            rows, docs, tfs = np.concatenate(rows), np.concatenate(docs), np.concatenate(tfs)
+            order = np.lexsort((docs, rows))
+            self.indptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=len(self.terms)), out=self.indptr[1:])
+            self.post_doc = docs[order].astype(np.int32)
+            self.post_tf = tfs[order]
+            self.doc_ids = np.concatenate([self.doc_ids[alive], np.array(new_ids, dtype=str)])
+            self.doc_len = np.concatenate([self.doc_len[alive], np.array(new_len, dtype=np.float32)])
+
+            self._added.clear()
+            self._removed.clear()
+            self._derive()
+            self._save()
+
+    # -------------------------------------------------------------------------
+    # Búsqueda
+    # -------------------------------------------------------------------------
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (id, puntuación BM25) de los fragmentos confirmados (commit)."""
+        with self._lock:
+            self._refresh()
+            n_docs = len(self.doc_ids)
+            rows = [self._rows[t] for t in set(tokenize(query)) if t in self._rows]
+            if not n_docs or not rows:
+                return []
+
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for row in rows:
+                start, stop = self.indptr[row], self.indptr[row + 1]
+                if start == stop:
+                    continue
+                docs = self.post_doc[start:stop]
+                tf = self.post_tf[start:stop]
+                df = stop - start
+                idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+                # Un término aparece una sola vez por fragmento: sin índices repetidos
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+
+            k = min(k, n_docs)
+            top = np.argpartition(-scores, k - 1)[:k] if k < n_docs else np.arange(n_docs)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(str(self.doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def stats(self) -> Dict:
+        return {"chunks": len(self.doc_ids), "terms": len(self.terms), "postings": int(len(self.post_doc))}
@@ -0,0 +1,301 @@
+"""
+Memoria conversacional acotada del asistente clínico (por paciente).
+
+Sustituye al dict `histories` de LangChainAgentManager, que crecía sin límite
+y no se compartía entre workers de gunicorn:
+- Límite de turnos por paciente: al superarlo se expulsan los más antiguos
+  en bloque (hasta la mitad del límite).
+- Límite global en bytes con expulsión LRU de pacientes completos.
+- Resumen opcional: los turnos expulsados se condensan en un resumen corto
+  que se mantiene como contexto del paciente.
+
+Backends: "memory" (por proceso) y "sqlite" (compartido entre workers).
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# (turnos expulsados, resumen previo) -> nuevo resumen
+Summarizer = Callable[[List["Turn"], str], str]
+
+
+class Turn(NamedTuple):
+    role: str  # 'human' | 'ai'
+    content: str
+
+
+class ConversationMemory(NamedTuple):
+    summary: str
+    turns: List[Turn]
+
+
+def _turn_bytes(turn: Turn) -> int:
+    return len(turn.content.encode("utf-8")) + len(turn.role)
+
+
+class ConversationMemoryStore(ABC):
+    """Interfaz común de los backends de memoria conversacional."""
+
+    def __init__(self, max_turns: Optional[int] = None, max_bytes: Optional[int] = None,
+                 summarizer: Optional[Summarizer] = None):
+        self.max_turns = max_turns or int(os.getenv("MEMORY_MAX_TURNS", "20"))
+        self.max_bytes = max_bytes or int(os.getenv("MEMORY_MAX_BYTES", str(8 * 1024 * 1024)))
+        self.summarize_enabled = os.getenv("MEMORY_SUMMARIZE", "1") == "1"
+        self.summarizer = summarizer
+        self.evicted_turns = 0
+        self.evicted_patients = 0
+
+    @abstractmethod
+    def get(self, patient_id: str) -> ConversationMemory:
+        ...
+
+    @abstractmethod
+    def append(self, patient_id: str, role: str, content: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self, patient_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+    def _excess_turns(self, n_turns: int) -> int:
+        """Turnos a expulsar: al superar el límite se baja a la mitad para resumir en bloque."""
+        if n_turns <= self.max_turns:
+            return 0
+        return n_turns - max(1, self.max_turns // 2)
+
+    def _summarize(self, evicted: List[Turn], summary: str) -> str:
+        if not evicted or not self.summarize_enabled or self.summarizer is None:
+            return summary
+        try:
+            return self.summarizer(evicted, summary)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo resumir la memoria conversacional: {e}")
+            return summary
+
+
+class InMemoryConversationStore(ConversationMemoryStore):
+    """Backend por proceso: OrderedDict LRU de pacientes."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._patients: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, patient_id: str) -> ConversationMemory:
+        with self._lock:
+            entry = self._patients.get(patient_id)
+            if entry is None:
+                return ConversationMemory("", [])
+            self._patients.move_to_end(patient_id)
+            return ConversationMemory(entry["summary"], list(entry["turns"]))
+
+    def append(self, patient_id: str, role: str, content: str) -> None:
+        turn = Turn(role, content)
+        with self._lock:
+            entry = self._patients.setdefault(patient_id, {"summary": "", "turns": deque(), "bytes": 0})
+            self._patients.move_to_end(patient_id)
+            entry["turns"].append(turn)
+            entry["bytes"] += _turn_bytes(turn)
+            self._bytes += _turn_bytes(turn)
+
+            evicted = [entry["turns"].popleft() for _ in range(self._excess_turns(len(entry["turns"])))]
+            freed = sum(_turn_bytes(t) for t in evicted)
+            entry["bytes"] -= freed
+            self._bytes -= freed
+            self.evicted_turns += len(evicted)
+            summary = entry["summary"]
+
+        if evicted:
+            new_summary = self._summarize(evicted, summary)
+            with self._lock:
+                if patient_id in self._patients:
+                    entry = self._patients[patient_id]
+                    self._bytes += len(new_summary.encode("utf-8")) - len(entry["summary"].encode("utf-8"))
+                    entry["summary"] = new_summary
+
+        self._enforce_bytes(keep=patient_id)
+
+    def _enforce_bytes(self, keep: str) -> None:
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._patients) > 1:
+                oldest = next(iter(self._patients))
+                if oldest == keep:
+                    self._patients.move_to_end(oldest)
+                    continue
+                entry = self._patients.pop(oldest)
+                self._bytes -= entry["bytes"] + len(entry["summary"].encode("utf-8"))
+                self.evicted_patients += 1
+
+    def clear(self, patient_id: str) -> None:
+        with self._lock:
+            entry = self._patients.pop(patient_id, None)
+            if entry:
+                self._bytes -= entry["bytes"] + len(entry["summary"].encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "backend": "memory",
+            "patients": len(self._patients),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evicted_turns": self.evicted_turns,
+            "evicted_patients": self.evicted_patients,
+        }
+
+
+class SQLiteConversationStore(ConversationMemoryStore):
+    """Backend compartido entre workers: SQLite en modo WAL."""
+
+    def __init__(self, db_path: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = db_path or os.getenv("MEMORY_DB_PATH", "./conversation_memory.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, patient_id TEXT NOT NULL,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, bytes INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_conversation_turns_patient ON conversation_turns (patient_id, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_patients ("
+            " patient_id TEXT PRIMARY KEY, summary TEXT NOT NULL DEFAULT '',"
+            " bytes INTEGER NOT NULL DEFAULT 0, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_conversation_patients_last_access ON conversation_patients (last_access)")
+        self._conn.commit()
+        logger.info(f"🧠 Memoria conversacional compartida en '{self.db_path}'")
+
+    def get(self, patient_id: str) -> ConversationMemory:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM conversation_patients WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            if row is None:
+                return ConversationMemory("", [])
+            turns = self._conn.execute(
+                "SELECT role, content FROM conversation_turns WHERE patient_id = ? ORDER BY id", (patient_id,)
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE conversation_patients SET last_access = ? WHERE patient_id = ?", (time.time(), patient_id)
+            )
+            self._conn.commit()
+        return ConversationMemory(row[0], [Turn(*t) for t in turns])
+
+    def append(self, patient_id: str, role: str, content: str) -> None:
+        turn = Turn(role, content)
+        size = _turn_bytes(turn)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversation_patients (patient_id, bytes, last_access) VALUES (?, ?, ?)"
+                " ON CONFLICT(patient_id) DO UPDATE SET bytes = bytes + excluded.bytes, last_access = excluded.last_access",
+                (patient_id, size, time.time())
+            )
+            self._conn.execute(
+                "INSERT INTO conversation_turns (patient_id, role, content, bytes) VALUES (?, ?, ?, ?)",
+                (patient_id, role, content, size)
+            )
+            n_turns = self._conn.execute(
+                "SELECT COUNT(*) FROM conversation_turns WHERE patient_id = ?", (patient_id,)
+            ).fetchone()[0]
+            evicted_rows = self._conn.execute(
+                "SELECT id, role, content, bytes FROM conversation_turns WHERE patient_id = ? ORDER BY id LIMIT ?",
+                (patient_id, self._excess_turns(n_turns))
+            ).fetchall()
+            if evicted_rows:
+                self._conn.execute(
+                    f"DELETE FROM conversation_turns WHERE id IN ({','.join('?' * len(evicted_rows))})",
+                    [r[0] for r in evicted_rows]
+                )
+                self._conn.execute(
+                    "UPDATE conversation_patients SET bytes = bytes - ? WHERE patient_id = ?",
+                    (sum(r[3] for r in evicted_rows), patient_id)
+                )
+                self.evicted_turns += len(evicted_rows)
+            summary = self._conn.execute(
+                "SELECT summary FROM conversation_patients WHERE patient_id = ?", (patient_id,)
+            ).fetchone()[0]
+            self._conn.commit()
+
+        if evicted_rows:
+            new_summary = self._summarize([Turn(r[1], r[2]) for r in evicted_rows], summary)
+            if new_summary != summary:
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE conversation_patients SET summary = ? WHERE patient_id = ?", (new_summary, patient_id)
+                    )
+                    self._conn.commit()
+
+        self._enforce_bytes(keep=patient_id)
+
+    def _enforce_bytes(self, keep: str) -> None:
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(bytes + LENGTH(CAST(summary AS BLOB))), 0) FROM conversation_patients"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            candidates = self._conn.execute(
+                "SELECT patient_id, bytes + LENGTH(CAST(summary AS BLOB)) FROM conversation_patients"
+                " WHERE patient_id != ? ORDER BY last_access", (keep,)
+            )
+            victims = []
+            for pid, size in candidates:
+                if total <= self.max_bytes:
+                    break
+                victims.append(pid)
+                total -= size
+            for pid in victims:
+                self._conn.execute("DELETE FROM conversation_turns WHERE patient_id = ?", (pid,))
+                self._conn.execute("DELETE FROM conversation_patients WHERE patient_id = ?", (pid,))
+            self._conn.commit()
+            self.evicted_patients += len(victims)
+
+    def clear(self, patient_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_turns WHERE patient_id = ?", (patient_id,))
+            self._conn.execute("DELETE FROM conversation_patients WHERE patient_id = ?", (patient_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            patients, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes + LENGTH(CAST(summary AS BLOB))), 0) FROM conversation_patients"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "patients": patients,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evicted_turns": self.evicted_turns,
+            "evicted_patients": self.evicted_patients,
+        }
+
+
+def create_memory_store(**kwargs) -> ConversationMemoryStore:
+    """Crea el backend indicado por MEMORY_BACKEND ('sqlite' por defecto, o 'memory')."""
+    backend = os.getenv("MEMORY_BACKEND", "sqlite").lower()
+    if backend == "sqlite":
+        try:
+            return SQLiteConversationStore(**kwargs)
+        except Exception as e:
+            logger.error(f"❌ Error abriendo memoria SQLite (se usa memoria local): {e}")
+    return InMemoryConversationStore(**kwargs)
+
+
+# Instancia global
+conversation_memory = create_memory_store()
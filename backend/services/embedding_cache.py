@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Caché LRU en memoria de embeddings de consultas (RAG y feedback clínico).
+
+    Clave: sha256(modelo, texto normalizado). El límite es en bytes (no en
+    entradas) y, con EMBED_CACHE_FLOAT16=1, los vectores se guardan en float16:
+    la mitad de memoria con un error despreciable para la búsqueda por similitud.
+    El tiempo medio de cálculo por texto permite estimar la CPU ahorrada.
+    """
+
+    def __init__(self, max_bytes: int = None, float16: bool = None):
+        self.enabled = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+        self.max_bytes = max_bytes or int(os.getenv("EMBED_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        if float16 is None:
+            float16 = os.getenv("EMBED_CACHE_FLOAT16", "0") == "1"
+        self.dtype = np.float16 if float16 else np.float32
+
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embedded_texts = 0
+        self.embed_seconds = 0.0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza espacios para que variaciones triviales compartan entrada."""
+        return re.sub(r"\s+", " ", text).strip()
+
+    def make_key(self, model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], Any], model: str) -> List[List[float]]:
+        """
+        Embeddings de `texts` en orden: los cacheados se sirven de memoria y el
+        resto se calcula en una sola llamada a embed_fn.
+        """
+        if not self.enabled:
+            return [list(map(float, v)) for v in embed_fn(list(texts))]
+
+        keys = [self.make_key(model, text) for text in texts]
+        vectors: List[Any] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    vectors[i] = vector
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Fuera del lock: el modelo tarda (decenas de ms en CPU)
+            started = time.perf_counter()
+            computed = embed_fn([texts[i] for i in missing])
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.embed_seconds += elapsed
+                self.embedded_texts += len(missing)
+                for i, vector in zip(missing, computed):
+                    vectors[i] = self._remember(keys[i], np.asarray(vector, dtype=self.dtype))
+
+        return [v.astype(np.float32).tolist() for v in vectors]
+
+    def _remember(self, key: str, vector: np.ndarray) -> np.ndarray:
+        if vector.nbytes > self.max_bytes:
+            return vector
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        per_text = self.embed_seconds / self.embedded_texts if self.embedded_texts else 0.0
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "dtype": np.dtype(self.dtype).name,
+            "avg_embed_ms": round(per_text * 1000, 3),
+            "embed_seconds": round(self.embed_seconds, 3),
+            # Estimación: cada acierto evita un cálculo de coste medio
+            "saved_cpu_seconds": round(self.hits * per_text, 3),
+        }
+
+
+# Instancia global
+embedding_cache = EmbeddingCache()
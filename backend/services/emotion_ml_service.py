@@ -1,6 +1,7 @@
 import os
 import joblib
 import logging
+import threading
 import numpy as np
 
 logger = logging.getLogger(__name__)
@@ -8,6 +9,7 @@ logger = logging.getLogger(__name__)
 class EmotionMLService:
     def __init__(self):
         self.model = None
+        self._load_lock = threading.Lock()
         self.model_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models_ml', 'public_emotion_model.joblib'))
         # Actualizado a Etiquetas de Sentimiento (CardiffNLP Spanish)
         self.labels = {
@@ -33,6 +35,17 @@ class EmotionMLService:
         self.model = None # Limpiar referencia anterior
         return self.load_model()
 
+    def predict_proba(self, text: str):
+        """Probabilidad por etiqueta, sin explicación XAI (uso en triaje rápido)."""
+        if not self.model:
+            # Llamado desde varios hilos a la vez: cargar una sola vez
+            with self._load_lock:
+                if not self.model and not self.load_model():
+                    return None
+
+        probabilities = self.model.predict_proba([text])[0]
+        return {self.labels.get(idx, str(idx)): float(p) for idx, p in zip(self.model.classes_, probabilities)}
+
     def predict_emotion(self, text: str):
         if not self.model:
             if not self.load_model():
@@ -1,13 +1,22 @@
 import os
+import json
+import asyncio
 import logging
 import datetime
-from typing import Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Dict, Any, List, NamedTuple, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage, messages_from_dict, messages_to_dict
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.exceptions import OutputParserException
 from pydantic import BaseModel, Field
 from backend.services.rag_service import rag_service
+from backend.services.llm_cache import llm_cache
+from backend.services.llm_router import llm_router
+from backend.services.single_flight import llm_single_flight
+from backend.services.quota_scheduler import quota_scheduler, is_quota_error
+from backend.services.agent_metrics import agent_metrics
+from backend.services.triage_service import triage_service
+from backend.services.conversation_memory import conversation_memory, ConversationMemory, Turn
 
 logger = logging.getLogger(__name__)
 
@@ -16,31 +25,149 @@ class RiskAnalysis(BaseModel):
     risk_found: bool = Field(description="Si se encontró riesgo de autolesión o peligro")
     explanation: str = Field(description="Explicación breve del razonamiento del agente")
 
+class SymptomScores(BaseModel):
+    pain: float = Field(description="Intensidad de dolor (0.0 a 1.0)")
+    anxiety: float = Field(description="Nivel de ansiedad/nerviosismo (0.0 a 1.0)")
+    fatigue: float = Field(description="Nivel de cansancio/fatiga (0.0 a 1.0)")
+    nausea: float = Field(description="Intensidad de náuseas/vómitos (0.0 a 1.0)")
+    depression: float = Field(description="Nivel de tristeza/decaimiento (0.0 a 1.0)")
+    insomnia: float = Field(description="Problemas de sueño (0.0 a 1.0)")
+
+class SessionAnalysis(NamedTuple):
+    risk: RiskAnalysis
+    symptoms: Dict[str, float]
+    triage_tier: str  # 'lexicon', 'ml' o 'llm'
+
 class LangChainAgentManager:
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            logger.error("❌ GEMINI_API_KEY no encontrada.")
+        self.temperature = llm_router.temperature
+        # Router sobre LLM_BACKENDS (failover, circuit breakers y hedging); None si no hay backends
+        if not llm_router:
+            logger.error("❌ Ningún backend LLM disponible (¿GEMINI_API_KEY no encontrada?).")
             self.llm = None
         else:
-            model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
-            self.llm = ChatGoogleGenerativeAI(
-                model=model_name,
-                google_api_key=self.api_key,
-                temperature=0.7,
-                max_retries=3
-            )
+            self.llm = llm_router
+        self.model_name = llm_router.primary_name or os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
         
-        self.histories: Dict[str, List[Any]] = {}
+        # Deadline por petición para el camino asíncrono (triaje + ESAS en paralelo)
+        self.agent_deadline = float(os.getenv("AGENT_DEADLINE_SECONDS", "25"))
+        # Concurrencia máxima al procesar lotes de sesiones
+        self.batch_concurrency = int(os.getenv("AGENT_BATCH_CONCURRENCY", "4"))
+
+        # Memoria conversacional acotada y compartida entre workers (ver conversation_memory)
+        self.memory = conversation_memory
+        if self.memory.summarizer is None:
+            self.memory.summarizer = self._summarize_turns
+        self.summary_max_chars = int(os.getenv("MEMORY_SUMMARY_MAX_CHARS", "1500"))
+
+    def get_patient_history(self, patient_id: str) -> List[BaseMessage]:
+        memory = self.memory.get(patient_id)
+        return self._memory_messages(memory)
+
+    @staticmethod
+    def _memory_messages(memory: ConversationMemory) -> List[BaseMessage]:
+        messages: List[BaseMessage] = []
+        if memory.summary:
+            messages.append(SystemMessage(content=f"RESUMEN DE LA CONVERSACIÓN PREVIA:\n{memory.summary}"))
+        for turn in memory.turns:
+            messages.append(HumanMessage(content=turn.content) if turn.role == "human" else AIMessage(content=turn.content))
+        return messages
+
+    def _remember_turn(self, patient_id: str, query: str, answer: str) -> None:
+        try:
+            self.memory.append(patient_id, "human", query)
+            self.memory.append(patient_id, "ai", answer)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar la memoria conversacional: {e}")
+
+    def _summarize_turns(self, turns: List[Turn], previous_summary: str) -> str:
+        """Condensa los turnos expulsados en el resumen acumulado del paciente."""
+        transcript = "\n".join(f"{'Médico' if t.role == 'human' else 'Asistente'}: {t.content}" for t in turns)
+        if self.llm:
+            messages = [
+                SystemMessage(content=(
+                    "Resume de forma muy compacta (máx. 5 líneas) la conversación clínica, conservando "
+                    "datos del paciente, dosis, decisiones y dudas pendientes. Integra el resumen previo."
+                )),
+                HumanMessage(content=f"RESUMEN PREVIO:\n{previous_summary or '(ninguno)'}\n\nNUEVOS TURNOS:\n{transcript}")
+            ]
+            summary = self._invoke_llm("memory_summary", messages).content
+        else:
+            summary = f"{previous_summary}\n{transcript}".strip()
+        # Solo se conserva la parte más reciente si el resumen crece demasiado
+        return summary[-self.summary_max_chars:]
 
-    def get_patient_history(self, patient_id: str) -> List[Any]:
-        if patient_id not in self.histories:
-            self.histories[patient_id] = []
-        return self.histories[patient_id]
+    def _invoke_llm(self, agent: str, messages: List[BaseMessage], use_cache: bool = True,
+                    parser: Optional[PydanticOutputParser] = None):
+        """
+        Punto único de llamada síncrona al LLM, con caché de respuestas.
+        use_cache=False ignora la caché en lectura pero refresca la entrada.
+        Las llamadas idénticas concurrentes comparten una sola petición (single-flight)
+        y cada agente espera turno de cuota en su carril de prioridad (quota_scheduler).
+        Con parser devuelve la salida ya parseada, y solo se cachean las respuestas que
+        parsean: una respuesta malformada no se repite durante todo el TTL.
+        """
+        key = llm_cache.make_key(agent, self.model_name, self.temperature, messages)
+        if use_cache:
+            cached = self._from_cache(agent, key, llm_cache.get(key), parser)
+            if cached is not None:
+                return cached
+
+        def call():
+            with quota_scheduler.lane(agent):
+                response = self.llm.invoke(messages, config=agent_metrics.config(agent))
+            result = self._parse(agent, parser, response) if parser else response
+            llm_cache.set(key, agent, messages_to_dict([response]))
+            return result
+
+        return llm_single_flight.do(key, call)
+
+    async def _ainvoke_llm(self, agent: str, messages: List[BaseMessage], use_cache: bool = True,
+                           parser: Optional[PydanticOutputParser] = None):
+        """Versión asíncrona (ainvoke) de _invoke_llm. La caché (SQLite) se consulta en un hilo."""
+        key = llm_cache.make_key(agent, self.model_name, self.temperature, messages)
+        if use_cache:
+            cached = self._from_cache(agent, key, await asyncio.to_thread(llm_cache.get, key), parser)
+            if cached is not None:
+                return cached
+
+        async def call():
+            with quota_scheduler.lane(agent):
+                response = await self.llm.ainvoke(messages, config=agent_metrics.config(agent))
+            result = self._parse(agent, parser, response) if parser else response
+            await asyncio.to_thread(llm_cache.set, key, agent, messages_to_dict([response]))
+            return result
+
+        return await llm_single_flight.ado(key, call)
+
+    def _from_cache(self, agent: str, key: str, cached: Optional[Any], parser: Optional[PydanticOutputParser]):
+        """Entrada de caché ya decodificada (y parseada si hay parser); las que no parsean se descartan."""
+        if cached is None:
+            return None
+        message = messages_from_dict(cached)[0]
+        if parser:
+            try:
+                message = parser.invoke(message)
+            except OutputParserException:
+                logger.warning(f"⚠️ Respuesta cacheada de '{agent}' no parseable: se descarta")
+                llm_cache.delete(key)
+                return None
+        agent_metrics.cache_hit(agent)
+        return message
+
+    @staticmethod
+    def _parse(agent: str, parser: PydanticOutputParser, message: AIMessage):
+        """Parsea la salida estructurada del agente contando los fallos de formato."""
+        try:
+            return parser.invoke(message)
+        except OutputParserException:
+            agent_metrics.parse_failure(agent)
+            raise
 
     def _get_demo_fallback(self, agent_type: str) -> str:
         """Devuelve una respuesta de alta calidad cuando hay problemas con el servicio de IA."""
         logger.warning(f"🔦 MODO SEGURO: Interrupción en el servicio de IA. Usando demo para: {agent_type}")
+        agent_metrics.fallback(agent_type)
         
         demos = {
             "risk": "{\"risk_level\": \"high\", \"risk_found\": true, \"explanation\": \"(MODO SEGURO) Detectada crisis de dolor referida (EVA > 7) y posible disnea. Requiere evaluación médica inmediata.\"}",
@@ -65,24 +192,58 @@ class LangChainAgentManager:
         }
         return demos.get(agent_type, "Servicio temporalmente no disponible.")
 
-    def chat_agent(self, query: str, patient_context: str = "") -> Dict[str, Any]:
-        """Agente de Chat Clínico con RAG (Consultas a Guías)"""
+    def chat_agent(self, query: str, patient_context: str = "", use_cache: bool = True,
+                   patient_id: Optional[str] = None) -> Dict[str, Any]:
+        """Agente de Chat Clínico con RAG (Consultas a Guías). Con patient_id usa la memoria conversacional."""
         # Fallback inmediato si no hay cliente (api key missing)
         if not self.llm:
              return {"answer": self._get_demo_fallback("chat"), "sources": ["Demo_Mode.pdf"]}
 
         # 1. Recuperar info relevante de RAG
+        rag_context, sources = self._retrieve_chat_context(query)
+
+        # 2. Construir Prompt
+        memory = self.memory.get(patient_id) if patient_id else None
+        messages = self._build_chat_prompt(query, patient_context, rag_context, memory)
+
+        try:
+            response = self._invoke_llm("chat", messages, use_cache)
+        except Exception as e:
+            return self._chat_error_fallback(e)
+        if patient_id:
+            self._remember_turn(patient_id, query, response.content)
+        return {"answer": response.content, "sources": sources}
+
+    async def achat_agent(self, query: str, patient_context: str = "", use_cache: bool = True,
+                          patient_id: Optional[str] = None) -> Dict[str, Any]:
+        """Versión async de chat_agent: RAG y memoria van a un hilo y el LLM se espera sin bloquear."""
+        if not self.llm:
+             return {"answer": self._get_demo_fallback("chat"), "sources": ["Demo_Mode.pdf"]}
+
+        rag_context, sources = await asyncio.to_thread(self._retrieve_chat_context, query)
+        memory = await asyncio.to_thread(self.memory.get, patient_id) if patient_id else None
+        messages = self._build_chat_prompt(query, patient_context, rag_context, memory)
+
+        try:
+            response = await self._ainvoke_llm("chat", messages, use_cache)
+        except Exception as e:
+            return self._chat_error_fallback(e)
+        if patient_id:
+            # Puede resumir turnos expulsados (llamada al LLM): fuera del event loop
+            await asyncio.to_thread(self._remember_turn, patient_id, query, response.content)
+        return {"answer": response.content, "sources": sources}
+
+    def _retrieve_chat_context(self, query: str):
         # rag_service ya está importado arriba
         try:
             rag_data = rag_service.query_expert(query)
-            rag_context = rag_data.get("context", "")
-            sources = rag_data.get("sources", [])
+            return rag_data.get("context", ""), rag_data.get("sources", [])
         except Exception as e:
             logger.error(f"Error RAG: {e}")
-            rag_context = ""
-            sources = []
+            return "", []
 
-        # 2. Construir Prompt
+    def _build_chat_prompt(self, query: str, patient_context: str, rag_context: str,
+                           memory: Optional[ConversationMemory] = None):
         system_instruction = (
             "Eres un Asistente Clínico Inteligente para Oncólogos. Tu objetivo es responder preguntas médicas de forma precisa.\n"
             "INSTRUCCIONES:\n"
@@ -93,25 +254,20 @@ class LangChainAgentManager:
         )
         
         human_content = f"INFORMACIÓN DE REFERENCIA (RAG):\n{rag_context}\n\nCONTEXTO DEL PACIENTE:\n{patient_context}\n\nPREGUNTA DEL MÉDICO:\n{query}"
+        history = self._memory_messages(memory) if memory else []
+        return [SystemMessage(content=system_instruction), *history, HumanMessage(content=human_content)]
 
-        try:
-            messages = [SystemMessage(content=system_instruction), HumanMessage(content=human_content)]
-            response = self.llm.invoke(messages)
-            return {"answer": response.content, "sources": sources}
-        except Exception as e:
-            logger.error(f"❌ Error en Chat Agent: {e}")
-            if "429" in str(e) or "quota" in str(e).lower():
-                return {
-                    "answer": self._get_demo_fallback("chat"), 
-                    "sources": ["Demo_Mode.pdf (Fallback por Rate Limit)"]
-                }
-            return {"answer": "Hubo un error procesando tu consulta con el asistente.", "sources": []}
-    def analyze_risk_agent(self, text: str) -> RiskAnalysis:
-        """Agente especializado en detección de urgencias oncológicas y psiquiátricas."""
-        if not self.llm:
-            import json
-            return RiskAnalysis(**json.loads(self._get_demo_fallback("risk")))
+    def _chat_error_fallback(self, e: Exception) -> Dict[str, Any]:
+        logger.error(f"❌ Error en Chat Agent: {e}")
+        if is_quota_error(e):
+            return {
+                "answer": self._get_demo_fallback("chat"), 
+                "sources": ["Demo_Mode.pdf (Fallback por Rate Limit)"]
+            }
+        return {"answer": "Hubo un error procesando tu consulta con el asistente.", "sources": []}
 
+    def _build_risk_prompt(self, text: str):
+        """Renderiza los mensajes del agente de triaje y devuelve (mensajes, parser)."""
         parser = PydanticOutputParser(pydantic_object=RiskAnalysis)
         system_prompt = (
             "Eres un Triaje Oncológico experto. Analiza el texto buscando URGENCIAS FÍSICAS O PSICOLÓGICAS.\n"
@@ -125,16 +281,23 @@ class LangChainAgentManager:
             "{format_instructions}"
         )
         prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", "{text}")])
-        chain = prompt | self.llm | parser
+        messages = prompt.format_messages(text=text, format_instructions=parser.get_format_instructions())
+        return messages, parser
+
+    def analyze_risk_agent(self, text: str, use_cache: bool = True) -> RiskAnalysis:
+        """Agente especializado en detección de urgencias oncológicas y psiquiátricas."""
+        if not self.llm:
+            return RiskAnalysis(**json.loads(self._get_demo_fallback("risk")))
+
+        messages, parser = self._build_risk_prompt(text)
         
         try:
-            return chain.invoke({"text": text, "format_instructions": parser.get_format_instructions()})
+            return self._invoke_llm("risk", messages, use_cache, parser)
         except Exception as e:
             logger.error(f"❌ Error en Risk Agent: {e}")
-            import json
             return RiskAnalysis(**json.loads(self._get_demo_fallback("risk")))
 
-    def generate_soap_agent(self, patient_id: str, raw_text: str, emotion_metrics: Dict[str, float]) -> str:
+    def generate_soap_agent(self, patient_id: str, raw_text: str, emotion_metrics: Dict[str, float], use_cache: bool = True) -> str:
         """Agente especializado en notas clínicas oncológicas (Dolor, Toxicidad, Emocional)."""
         if not self.llm:
             return self._get_demo_fallback("soap")
@@ -151,13 +314,13 @@ class LangChainAgentManager:
 
         try:
             messages = [SystemMessage(content=system_instruction), HumanMessage(content=human_content)]
-            response = self.llm.invoke(messages)
+            response = self._invoke_llm("soap", messages, use_cache)
             return response.content
         except Exception as e:
             logger.error(f"❌ Error en SOAP Agent: {e}")
             return self._get_demo_fallback("soap")
 
-    def generate_psychoeducation_agent(self, patient_id: str, soap_plan: str, emotion_metrics: Dict[str, float]) -> str:
+    def generate_psychoeducation_agent(self, patient_id: str, soap_plan: str, emotion_metrics: Dict[str, float], use_cache: bool = True) -> str:
         """Agente de Educación al Paciente (Adherencia y Manejo de Síntomas)."""
         if not self.llm:
             return self._get_demo_fallback("psycho")
@@ -171,33 +334,17 @@ class LangChainAgentManager:
 
         try:
             messages = [SystemMessage(content=system_instruction), HumanMessage(content=human_content)]
-            response = self.llm.invoke(messages)
+            response = self._invoke_llm("psycho", messages, use_cache)
             return response.content
         except Exception as e:
             logger.error(f"❌ Error en Psycho Education Agent: {e}")
             return self._get_demo_fallback("psycho")
 
-    def extract_symptoms_agent(self, text: str) -> Dict[str, float]:
-        """Agente de Extracción de Síntomas (Escala ESAS Estimada)."""
-        import json
-        
-        if not self.llm:
-            return json.loads(self._get_demo_fallback("symptoms"))
-
-        # Definimos el esquema de salida esperado
-        class SymptomScores(BaseModel):
-            pain: float = Field(description="Intensidad de dolor (0.0 a 1.0)")
-            anxiety: float = Field(description="Nivel de ansiedad/nerviosismo (0.0 a 1.0)")
-            fatigue: float = Field(description="Nivel de cansancio/fatiga (0.0 a 1.0)")
-            nausea: float = Field(description="Intensidad de náuseas/vómitos (0.0 a 1.0)")
-            depression: float = Field(description="Nivel de tristeza/decaimiento (0.0 a 1.0)")
-            insomnia: float = Field(description="Problemas de sueño (0.0 a 1.0)")
-        
+    def _build_symptoms_prompt(self, text: str, past_corrections: List[Dict]):
+        """Renderiza el prompt ESAS con few-shot dinámico y devuelve (mensajes, parser)."""
         parser = PydanticOutputParser(pydantic_object=SymptomScores)
         
         # RAG - Dynamic Few-Shot Prompting (Active Learning)
-        # Buscar correcciones pasadas similares para guiar al modelo
-        past_corrections = rag_service.find_similar_feedback(text)
         learning_context = ""
         
         if past_corrections:
@@ -216,20 +363,113 @@ class LangChainAgentManager:
         )
 
         prompt = ChatPromptTemplate.from_messages([("system", system_instruction), ("human", "{text}")])
-        chain = prompt | self.llm | parser
+        messages = prompt.format_messages(
+            text=text,
+            format_instructions=parser.get_format_instructions(),
+            learning_context=learning_context
+        )
+        return messages, parser
+
+    def extract_symptoms_agent(self, text: str, use_cache: bool = True) -> Dict[str, float]:
+        """Agente de Extracción de Síntomas (Escala ESAS Estimada)."""
+        if not self.llm:
+            return json.loads(self._get_demo_fallback("symptoms"))
+
+        # Buscar correcciones pasadas similares para guiar al modelo
+        past_corrections = rag_service.find_similar_feedback(text)
+        messages, parser = self._build_symptoms_prompt(text, past_corrections)
 
         try:
-            result = chain.invoke({
-                "text": text, 
-                "format_instructions": parser.get_format_instructions(),
-                "learning_context": learning_context
-            })
+            result = self._invoke_llm("symptoms", messages, use_cache, parser)
             return result.dict()
         except Exception as e:
             logger.error(f"❌ Error en Symptom Extraction Agent: {e}")
             # Fallback a demo en caso de error (e.g. Rate Limit)
             return json.loads(self._get_demo_fallback("symptoms"))
 
+    # -------------------------------------------------------------------------
+    # Camino asíncrono (ainvoke): triaje + ESAS + feedback RAG en paralelo
+    # -------------------------------------------------------------------------
+    async def _arisk_agent(self, text: str, use_cache: bool = True) -> RiskAnalysis:
+        """Triaje vía ainvoke. A diferencia de la versión síncrona, propaga los errores."""
+        messages, parser = self._build_risk_prompt(text)
+        return await self._ainvoke_llm("risk", messages, use_cache, parser)
+
+    async def aextract_symptoms_agent(self, text: str, use_cache: bool = True) -> Dict[str, float]:
+        """Versión asíncrona de extract_symptoms_agent (misma semántica de fallback)."""
+        if not self.llm:
+            return json.loads(self._get_demo_fallback("symptoms"))
+
+        # ChromaDB es síncrono: la búsqueda de feedback va a un hilo
+        past_corrections = await asyncio.to_thread(rag_service.find_similar_feedback, text)
+        messages, parser = self._build_symptoms_prompt(text, past_corrections)
+
+        try:
+            result = await self._ainvoke_llm("symptoms", messages, use_cache, parser)
+            return result.dict()
+        except Exception as e:
+            logger.error(f"❌ Error en Symptom Extraction Agent (async): {e}")
+            return json.loads(self._get_demo_fallback("symptoms"))
+
+    async def analyze_session_agents(self, text: str, timeout: Optional[float] = None, use_cache: bool = True) -> SessionAnalysis:
+        """
+        Ejecuta en paralelo el triaje de riesgo y la extracción ESAS (con su búsqueda
+        de feedback en ChromaDB) bajo un deadline por petición.
+
+        - El pre-triaje local (léxico / TF-IDF) decide sin LLM los casos evidentes;
+          solo los ambiguos llegan al agente de riesgo.
+        - Si el triaje falla, se cancelan las llamadas restantes y se propaga el error.
+        - Si se supera el deadline, se cancela todo y se lanza asyncio.TimeoutError.
+        """
+        # El nivel TF-IDF carga/ejecuta sklearn: fuera del event loop
+        local = await asyncio.to_thread(triage_service.pre_triage, text)
+        local_risk = None
+        if local is not None:
+            local_risk = RiskAnalysis(risk_level=local.risk_level, risk_found=local.risk_found, explanation=local.explanation)
+
+        if not self.llm:
+            return SessionAnalysis(
+                local_risk or RiskAnalysis(**json.loads(self._get_demo_fallback("risk"))),
+                json.loads(self._get_demo_fallback("symptoms")),
+                local.tier if local else "llm"
+            )
+
+        deadline = self.agent_deadline if timeout is None else timeout
+        symptoms_task = asyncio.create_task(self.aextract_symptoms_agent(text, use_cache))
+        tasks = [symptoms_task]
+        if local_risk is None:
+            risk_task = asyncio.create_task(self._arisk_agent(text, use_cache))
+            tasks.append(risk_task)
+
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=deadline, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            if pending:
+                raise asyncio.TimeoutError(f"Deadline de {deadline:.1f}s superado en el análisis de sesión")
+            if local_risk is not None:
+                return SessionAnalysis(local_risk, symptoms_task.result(), local.tier)
+            return SessionAnalysis(risk_task.result(), symptoms_task.result(), "llm")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def analyze_sessions_batch(self, texts: List[str], max_concurrency: Optional[int] = None) -> List[Any]:
+        """
+        Analiza un lote de textos con concurrencia acotada.
+        Devuelve, por cada texto y en el mismo orden, un SessionAnalysis
+        o la excepción que produjo ese item (los fallos no abortan el lote).
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.batch_concurrency)
+
+        async def run_one(text: str):
+            async with semaphore:
+                return await self.analyze_session_agents(text)
+
+        return await asyncio.gather(*(run_one(text) for text in texts), return_exceptions=True)
+
 
 
 # Instancia global
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    Caché persistente de respuestas del LLM direccionada por contenido.
+
+    Clave: sha256(agente, modelo, temperatura, prompt normalizado).
+    - Nivel 1: LRU en memoria con TTL (por proceso).
+    - Nivel 2: SQLite en disco (sobrevive reinicios y se comparte entre workers de gunicorn).
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_disk_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+        self.db_path = db_path or os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        self.max_disk_entries = max_disk_entries or int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "20000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_prune = 0
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.enabled:
+            try:
+                self._conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY, agent TEXT NOT NULL, value TEXT NOT NULL,"
+                    " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+                self._conn.commit()
+                logger.info(f"🗄️ LLMCache: persistencia en '{self.db_path}'")
+            except Exception as e:
+                logger.error(f"❌ Error inicializando caché LLM en disco (solo memoria): {e}")
+                self._conn = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza espacios para que variaciones triviales compartan entrada."""
+        return re.sub(r"\s+", " ", text).strip()
+
+    def make_key(self, agent: str, model_name: str, temperature: float, messages: List[Any]) -> str:
+        """Clave direccionada por contenido a partir de los mensajes ya renderizados."""
+        prompt = "\n".join(
+            f"{getattr(m, 'type', 'text')}:{self.normalize(str(getattr(m, 'content', m)))}" for m in messages
+        )
+        payload = json.dumps([agent, model_name, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] <= self.ttl_seconds:
+                        self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                        self._conn.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                except Exception as e:
+                    logger.warning(f"⚠️ Error leyendo caché LLM en disco: {e}")
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, agent: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, value, now)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, agent, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, agent, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                self._conn.commit()
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune_disk(now)
+            except Exception as e:
+                logger.warning(f"⚠️ Error escribiendo caché LLM en disco: {e}")
+
+    def delete(self, key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Error borrando de la caché LLM en disco: {e}")
+
+    def _remember(self, key: str, value: Any, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now: float) -> None:
+        """Elimina entradas caducadas y las menos usadas por encima del límite en disco."""
+        self._writes_since_prune = 0
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+        self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+# Instancia global
+llm_cache = LLMCache()
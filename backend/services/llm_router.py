@@ -0,0 +1,515 @@
+"""
+Router multi-backend para el LLM con circuit breakers y peticiones cubiertas (hedging).
+
+Sustituye al único ChatGoogleGenerativeAI(max_retries=3): cuando un modelo va
+lento o devuelve 429, en lugar de esperar los reintentos se consulta otro
+backend. Objetivo: reducir la latencia de cola (p95/p99) de los agentes.
+
+- Cada backend registra latencias (ventana deslizante) y errores.
+- Circuit breaker por backend: se abre tras N fallos seguidos y pasa a
+  semiabierto tras un enfriamiento (una petición de prueba).
+- Hedging: si el backend primario no responde en su p95 observado, se lanza
+  un duplicado al siguiente backend sano y gana la primera respuesta válida.
+- Cuota: cada llamada pide turno a quota_scheduler (RPM/TPM por backend y
+  carril de prioridad). Los hedges solo salen si hay cuota libre y, si todos
+  los backends devuelven 429, la petición vuelve a la cola tras Retry-After.
+
+Configuración (LLM_BACKENDS, separados por comas):
+    gemini-2.0-flash                      -> Gemini con GEMINI_API_KEY
+    gemini-2.0-flash-lite@GEMINI_API_KEY_2 -> Gemini con otra clave
+    http://127.0.0.1:8765                 -> servidor de chat HTTP (fake_llm_server.py)
+    fake://?latency=300&error_rate=0.01   -> LLM falso en proceso (fake_llm_server.FakeChatModel)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait, FIRST_COMPLETED
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from backend.services.quota_scheduler import quota_scheduler, is_quota_error, estimate_tokens, QuotaWaitTimeout
+
+logger = logging.getLogger(__name__)
+
+
+# Hilos por defecto del threadpool de Starlette/anyio (endpoints def síncronos)
+STARLETTE_THREADPOOL = 40
+
+
+class AllBackendsUnavailable(RuntimeError):
+    """Todos los backends tienen el circuito abierto."""
+
+
+# Hilos para las llamadas HTTP bloqueantes (el executor por defecto de asyncio es muy pequeño)
+_http_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HTTP_THREADS", "64")), thread_name_prefix="llm-http")
+
+
+class HTTPChatModel(BaseChatModel):
+    """
+    Chat model mínimo sobre HTTP: POST {url}/chat {"messages": [...]} -> {"content": "..."}.
+    Lo sirve backend/fake_llm_server.py para pruebas de carga y de latencia de cola.
+    """
+    base_url: str
+    timeout: float = 60.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "http-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        import requests
+        response = requests.post(
+            f"{self.base_url.rstrip('/')}/chat",
+            json={"messages": messages_to_dict(messages)},
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.status_code} {response.text[:200]}")
+        data = response.json()
+        message = AIMessage(content=data["content"], usage_metadata=data.get("usage"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await asyncio.get_running_loop().run_in_executor(_http_executor, self._generate, messages, stop)
+
+
+class Backend:
+    """Un modelo/clave con sus métricas y su circuit breaker."""
+
+    def __init__(self, name: str, llm: Any, failure_threshold: int, cooldown: float, window: int):
+        self.name = name
+        self.llm = llm
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)  # True = éxito
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+        self.throttled = 0
+
+    # --- Circuit breaker ---
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def acquire(self) -> bool:
+        """True si el backend acepta una petición ahora (en semiabierto, solo una de prueba)."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency)
+            self._outcomes.append(True)
+            self.consecutive_failures = 0
+            if self.opened_at is not None:
+                logger.info(f"✅ Circuito cerrado para backend LLM '{self.name}'")
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            self._outcomes.append(False)
+            self.consecutive_failures += 1
+            if self._probe_in_flight or self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None or self._probe_in_flight:
+                    logger.warning(f"🔌 Circuito abierto para backend LLM '{self.name}' "
+                                   f"({self.consecutive_failures} fallos seguidos)")
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def record_throttled(self) -> None:
+        """429 de cuota: cuenta como error, pero no abre el circuito (la pausa la gestiona quota_scheduler)."""
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            self.throttled += 1
+            self._outcomes.append(False)
+            self._probe_in_flight = False
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """
+        Petición cancelada (perdió el hedge): no cuenta como éxito ni fallo, pero el
+        tiempo transcurrido se guarda como latencia (cota inferior) para no sesgar el p95.
+        """
+        with self._lock:
+            self._latencies.append(elapsed)
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Devuelve el turno concedido por acquire() sin llegar a llamar (hedge sin cuota)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    # --- Métricas ---
+    def latency_percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        return (outcomes.count(False) / len(outcomes)) if outcomes else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.latency_percentile(q) for q in (0.50, 0.95, 0.99))
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 4),
+            "latency_ms_p50": ms(p50),
+            "latency_ms_p95": ms(p95),
+            "latency_ms_p99": ms(p99),
+            "throttled": self.throttled,
+            "hedges_sent": self.hedges,
+            "wins": self.wins,
+        }
+
+
+class LLMRouter:
+    """Expone invoke/ainvoke como un chat model y reparte entre backends."""
+
+    def __init__(self, backends: Optional[List[Backend]] = None):
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "1") == "1"
+        self.hedge_quantile = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+        self.hedge_min_delay = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.2"))
+        self.hedge_default_delay = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "2.0"))
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.max_hedges = int(os.getenv("LLM_MAX_HEDGES", "1"))
+        self.temperature = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+        self.backends = backends if backends is not None else self._backends_from_env()
+        # Cada llamada síncrona ocupa un hilo del router (más uno por hedge) mientras el hilo
+        # de Starlette que la hizo espera: por debajo de su threadpool la concurrencia se capa
+        threads = int(os.getenv("LLM_ROUTER_THREADS", "0")) or STARLETTE_THREADPOOL * (1 + self.max_hedges)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm-router")
+
+    # -------------------------------------------------------------------------
+    # Configuración
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def make_backend(spec: str, max_retries: int, temperature: float) -> Optional[Backend]:
+        spec = spec.strip()
+        failure_threshold = int(os.getenv("LLM_CB_FAILURE_THRESHOLD", "3"))
+        cooldown = float(os.getenv("LLM_CB_COOLDOWN_SECONDS", "30"))
+        window = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+        if spec.startswith("http://") or spec.startswith("https://"):
+            llm = HTTPChatModel(base_url=spec)
+        elif spec.startswith("fake://"):
+            from backend.fake_llm_server import FakeChatModel, FakeLLMProfile
+            llm = FakeChatModel(profile=FakeLLMProfile.from_url(spec))
+        else:
+            model, _, key_env = spec.partition("@")
+            api_key = os.getenv(key_env or "GEMINI_API_KEY")
+            if not api_key:
+                logger.error(f"❌ Backend LLM '{spec}' sin API key ({key_env or 'GEMINI_API_KEY'}).")
+                return None
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            llm = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=api_key,
+                temperature=temperature,
+                max_retries=max_retries
+            )
+        return Backend(spec, llm, failure_threshold, cooldown, window)
+
+    def _backends_from_env(self) -> List[Backend]:
+        specs = [s for s in os.getenv("LLM_BACKENDS", os.getenv("GEMINI_MODEL", "gemini-2.0-flash")).split(",") if s.strip()]
+        # Con varios backends el router hace el failover: los reintentos internos solo añaden cola
+        max_retries = int(os.getenv("GEMINI_MAX_RETRIES", "3" if len(specs) == 1 else "0"))
+        backends = [b for b in (self.make_backend(s, max_retries, self.temperature) for s in specs) if b]
+        if backends:
+            logger.info(f"🔀 Router LLM: {[b.name for b in backends]}")
+        return backends
+
+    def __bool__(self) -> bool:
+        return bool(self.backends)
+
+    @property
+    def primary_name(self) -> str:
+        return self.backends[0].name if self.backends else ""
+
+    # -------------------------------------------------------------------------
+    # Selección y hedging
+    # -------------------------------------------------------------------------
+    def _hedge_delay(self, backend: Backend) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        with backend._lock:
+            samples = len(backend._latencies)
+        if samples < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, backend.latency_percentile(self.hedge_quantile))
+
+    def _hedge_timeout(self, backend: Backend, hedges: int, tried: set, started: Dict[str, float]) -> Optional[float]:
+        """
+        Espera hasta el próximo hedge, o None si no cabe ninguno (sin más backends o sin
+        hedges restantes). El reloj empieza cuando la llamada sale al backend, no al
+        encolarla: la espera de cuota o de hilo no cuenta como latencia del backend.
+        """
+        if hedges >= self.max_hedges or len(tried) >= len(self.backends):
+            return None
+        delay = self._hedge_delay(backend)
+        if delay is None or backend.name not in started:
+            return delay
+        return max(0.0, started[backend.name] + delay - time.perf_counter())
+
+    def _hedge_due(self, backend: Backend, started: Dict[str, float]) -> bool:
+        """¿El backend en curso ya superó su retardo de hedge desde que empezó la llamada?"""
+        if backend.name not in started:
+            return False
+        return time.perf_counter() - started[backend.name] >= (self._hedge_delay(backend) or 0.0)
+
+    def _next_backend(self, tried: set) -> Optional[Backend]:
+        """
+        Siguiente backend en orden de configuración que acepte peticiones. Se
+        prefieren los que no están en pausa por Retry-After; si todos lo están,
+        se devuelve igualmente uno y la petición espera su turno en la cola.
+        """
+        candidates = [b for b in self.backends if b.name not in tried]
+        candidates.sort(key=lambda b: quota_scheduler.is_blocked(b.name))
+        for backend in candidates:
+            if backend.acquire():
+                tried.add(backend.name)
+                return backend
+        return None
+
+    def _on_error(self, backend: Backend, e: Exception) -> None:
+        if is_quota_error(e):
+            quota_scheduler.report_quota_error(backend.name, e)
+            backend.record_throttled()
+        else:
+            backend.record_failure()
+
+    @staticmethod
+    def _backend_config(config: Optional[Dict[str, Any]], backend: Backend) -> Optional[Dict[str, Any]]:
+        """Propaga callbacks/metadata del llamador añadiendo qué backend sirve la llamada."""
+        if not config:
+            return None
+        return {**config, "metadata": {**config.get("metadata", {}), "llm_backend": backend.name}}
+
+    def _call_sync(self, backend: Backend, messages: List[BaseMessage], lane: str, tokens: int,
+                   acquired: bool = False, config: Optional[Dict[str, Any]] = None,
+                   started_at: Optional[Dict[str, float]] = None) -> AIMessage:
+        if not acquired:
+            quota_scheduler.acquire(backend.name, tokens, lane)
+        started = time.perf_counter()
+        if started_at is not None:
+            started_at[backend.name] = started
+        try:
+            response = backend.llm.invoke(messages, config=self._backend_config(config, backend))
+        except Exception as e:
+            self._on_error(backend, e)
+            raise
+        backend.record_success(time.perf_counter() - started)
+        return response
+
+    async def _call_async(self, backend: Backend, messages: List[BaseMessage], lane: str, tokens: int,
+                          acquired: bool = False, config: Optional[Dict[str, Any]] = None,
+                          started_at: Optional[Dict[str, float]] = None) -> AIMessage:
+        if not acquired:
+            await quota_scheduler.aacquire(backend.name, tokens, lane)
+        started = time.perf_counter()
+        if started_at is not None:
+            started_at[backend.name] = started
+        try:
+            response = await backend.llm.ainvoke(messages, config=self._backend_config(config, backend))
+        except asyncio.CancelledError:
+            backend.record_cancelled(time.perf_counter() - started)
+            raise
+        except Exception as e:
+            self._on_error(backend, e)
+            raise
+        backend.record_success(time.perf_counter() - started)
+        return response
+
+    def _requeue(self, e: Exception, attempt: int) -> bool:
+        """
+        ¿Volver a encolar tras un 429 de todos los backends? (en vez de fallar)
+        QuotaWaitTimeout no se reencola: ya agotó QUOTA_MAX_WAIT_SECONDS en la cola.
+        """
+        if isinstance(e, QuotaWaitTimeout) or not is_quota_error(e) or attempt >= quota_scheduler.max_retries:
+            return False
+        logger.warning(f"⏳ Cuota agotada en todos los backends; reintento {attempt + 1} "
+                       f"de {quota_scheduler.max_retries} en cola")
+        return True
+
+    def invoke(self, messages: List[BaseMessage], config: Optional[Dict[str, Any]] = None, **kwargs) -> AIMessage:
+        # El carril se lee aquí: los hilos del executor no heredan el contexto
+        lane = quota_scheduler.current_lane()
+        tokens = estimate_tokens(messages, quota_scheduler.expected_output_tokens)
+        attempt = 0
+        while True:
+            try:
+                return self._route_sync(messages, lane, tokens, config)
+            except Exception as e:
+                if not self._requeue(e, attempt):
+                    raise
+                attempt += 1
+
+    async def ainvoke(self, messages: List[BaseMessage], config: Optional[Dict[str, Any]] = None, **kwargs) -> AIMessage:
+        lane = quota_scheduler.current_lane()
+        tokens = estimate_tokens(messages, quota_scheduler.expected_output_tokens)
+        attempt = 0
+        while True:
+            try:
+                return await self._route_async(messages, lane, tokens, config)
+            except Exception as e:
+                if not self._requeue(e, attempt):
+                    raise
+                attempt += 1
+
+    def _route_sync(self, messages: List[BaseMessage], lane: str, tokens: int,
+                    config: Optional[Dict[str, Any]] = None) -> AIMessage:
+        tried: set = set()
+        backend = self._next_backend(tried)
+        if backend is None:
+            raise AllBackendsUnavailable("Todos los backends LLM tienen el circuito abierto")
+        if len(self.backends) == 1:
+            # Sin failover ni hedge posibles: en el propio hilo, sin pasar por el executor
+            response = self._call_sync(backend, messages, lane, tokens, False, config)
+            backend.wins += 1
+            return response
+
+        started: Dict[str, float] = {}
+        futures = {self._executor.submit(self._call_sync, backend, messages, lane, tokens, False, config, started): backend}
+        hedges = 0
+        last_error: Optional[Exception] = None
+
+        while futures:
+            timeout = self._hedge_timeout(backend, hedges, tried, started)
+            done, _ = futures_wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                winner = futures.pop(future)
+                if future.exception() is None:
+                    # Los perdedores terminan en su hilo (registran su propia latencia); se descartan
+                    winner.wins += 1
+                    return future.result()
+                last_error = future.exception()
+                logger.warning(f"⚠️ Backend LLM '{winner.name}' falló: {last_error}")
+
+            # Fallo -> failover inmediato; timeout -> petición cubierta (hedge)
+            if done and futures:
+                continue
+            if not done and (hedges >= self.max_hedges or not self._hedge_due(backend, started)):
+                continue
+            next_backend = self._next_backend(tried)
+            if next_backend is None:
+                if not futures:
+                    break
+                # Hedge vencido sin destino (circuito abierto o sonda en curso): se da por
+                # gastado; si no, cada vuelta esperaría con timeout 0 hasta que acabe el primario
+                hedges += 1
+                continue
+            if not done:
+                # Un hedge no debe gastar cuota que necesitan otras peticiones
+                hedges += 1
+                if not quota_scheduler.try_acquire(next_backend.name, tokens):
+                    next_backend.release()
+                    # Sin llegar a llamarlo: sigue disponible para un failover si falla el primario
+                    tried.discard(next_backend.name)
+                    continue
+                next_backend.hedges += 1
+            backend = next_backend
+            futures[self._executor.submit(self._call_sync, backend, messages, lane, tokens, not done, config,
+                                          started)] = backend
+
+        raise last_error or AllBackendsUnavailable("Ningún backend LLM disponible")
+
+    async def _route_async(self, messages: List[BaseMessage], lane: str, tokens: int,
+                           config: Optional[Dict[str, Any]] = None) -> AIMessage:
+        tried: set = set()
+        backend = self._next_backend(tried)
+        if backend is None:
+            raise AllBackendsUnavailable("Todos los backends LLM tienen el circuito abierto")
+
+        started: Dict[str, float] = {}
+        tasks = {asyncio.create_task(self._call_async(backend, messages, lane, tokens, False, config, started)): backend}
+        hedges = 0
+        last_error: Optional[Exception] = None
+
+        try:
+            while tasks:
+                timeout = self._hedge_timeout(backend, hedges, tried, started)
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    winner = tasks.pop(task)
+                    if task.exception() is None:
+                        winner.wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"⚠️ Backend LLM '{winner.name}' falló: {last_error}")
+
+                if done and tasks:
+                    continue
+                if not done and (hedges >= self.max_hedges or not self._hedge_due(backend, started)):
+                    continue
+                next_backend = self._next_backend(tried)
+                if next_backend is None:
+                    if not tasks:
+                        break
+                    # Hedge vencido sin destino (circuito abierto o sonda en curso): se da por
+                    # gastado; si no, cada vuelta esperaría con timeout 0 hasta que acabe el primario
+                    hedges += 1
+                    continue
+                if not done:
+                    hedges += 1
+                    if not quota_scheduler.try_acquire(next_backend.name, tokens):
+                        next_backend.release()
+                        # Sin llegar a llamarlo: sigue disponible para un failover si falla el primario
+                        tried.discard(next_backend.name)
+                        continue
+                    next_backend.hedges += 1
+                backend = next_backend
+                tasks[asyncio.create_task(
+                    self._call_async(backend, messages, lane, tokens, not done, config, started))] = backend
+        finally:
+            # Cancela los perdedores (o todo, si el llamador fue cancelado)
+            for task in tasks:
+                task.cancel()
+
+        raise last_error or AllBackendsUnavailable("Ningún backend LLM disponible")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge_enabled": self.hedge_enabled,
+            "hedge_quantile": self.hedge_quantile,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
+
+
+# Instancia global
+llm_router = LLMRouter()
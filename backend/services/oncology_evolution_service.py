@@ -23,12 +23,48 @@ class OncologyEvolutionService:
         'shortness_of_breath': 'Falta de Aire'
     }
 
+    def symptom_values(self, analysis: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Valores numéricos de un JSON emotion_analysis.
+        Los síntomas ESAS seguidos siempre están presentes (0.0 si faltan o no son numéricos).
+        """
+        analysis = analysis or {}
+        values = {}
+        for key, val in analysis.items():
+            if isinstance(val, (int, float)) and not isinstance(val, bool):
+                values[key] = float(val)
+
+        for key in self.TRACKED_SYMPTOMS:
+            # Intentar buscar la key exacta o variaciones
+            val = analysis.get(key, analysis.get(key.lower(), 0))
+            
+            # Normalizar a float (manejar strings o ints)
+            try:
+                val = float(val)
+            except (ValueError, TypeError):
+                val = 0.0
+            values[key] = val
+        return values
+
+    def build_symptom_scores(self, session_log: Any) -> List[Any]:
+        """Filas SymptomScore (serie temporal materializada) para un SessionLog."""
+        from backend.models import SymptomScore
+        return [
+            SymptomScore(
+                session_id=session_log.id,
+                patient_id=session_log.patient_id,
+                timestamp=session_log.created_at,
+                symptom=symptom,
+                value=value
+            ) for symptom, value in self.symptom_values(session_log.emotion_analysis).items()
+        ]
+
     def analyze_evolution(self, session_logs: List[Any]) -> Dict[str, Any]:
         """
         Analiza el historial de sesiones y calcula tendencias.
         
         Args:
-            session_logs: Lista de objetos SessionLog (ORM)
+            session_logs: Lista de objetos con created_at y emotion_analysis (SessionLog ORM o filas proyectadas)
             
         Returns:
             Dict con timeline estructurado y alertas.
@@ -42,29 +78,43 @@ class OncologyEvolutionService:
         sorted_logs = sorted(session_logs, key=lambda x: x.created_at)
         
         for log in sorted_logs:
-            entry = {
+            # Extraer síntomas del JSON emotion_analysis
+            values = self.symptom_values(log.emotion_analysis)
+            timeline.append({
                 "date": log.created_at.isoformat(),
                 "timestamp": log.created_at.timestamp(),
-                "symptoms": {}
-            }
-            
-            # Extraer síntomas del JSON emotion_analysis
-            analysis = log.emotion_analysis or {}
-            
-            for key, label in self.TRACKED_SYMPTOMS.items():
-                # Intentar buscar la key exacta o variaciones
-                val = analysis.get(key, analysis.get(key.lower(), 0))
-                
-                # Normalizar a float (manejar strings o ints)
-                try:
-                    val = float(val)
-                except (ValueError, TypeError):
-                    val = 0.0
-                
-                entry["symptoms"][key] = val
-                
-            timeline.append(entry)
+                "symptoms": {key: values[key] for key in self.TRACKED_SYMPTOMS}
+            })
+
+        return self._analyze_timeline(timeline)
+
+    def analyze_symptom_series(self, rows: List[Any]) -> Dict[str, Any]:
+        """
+        Igual que analyze_evolution pero a partir de filas SymptomScore
+        (session_id, timestamp, symptom, value) ordenadas por timestamp.
+        """
+        if not rows:
+            return {"timeline": [], "alerts": [], "status": "insufficient_data"}
 
+        timeline = []
+        by_session: Dict[str, Dict] = {}
+        for row in rows:
+            entry = by_session.get(row.session_id)
+            if entry is None:
+                entry = {
+                    "date": row.timestamp.isoformat(),
+                    "timestamp": row.timestamp.timestamp(),
+                    "symptoms": {key: 0.0 for key in self.TRACKED_SYMPTOMS}
+                }
+                by_session[row.session_id] = entry
+                timeline.append(entry)
+            if row.symptom in entry["symptoms"]:
+                entry["symptoms"][row.symptom] = row.value
+
+        timeline.sort(key=lambda e: e["timestamp"])
+        return self._analyze_timeline(timeline)
+
+    def _analyze_timeline(self, timeline: List[Dict]) -> Dict[str, Any]:
         # 2. Calcular Tendencias (Regresión Lineal por Síntoma)
         trends = self._calculate_trends(timeline)
         
@@ -80,37 +130,128 @@ class OncologyEvolutionService:
 
     def _calculate_trends(self, timeline: List[Dict]) -> Dict[str, float]:
         """Calcula la pendiente de cambio para cada síntoma (puntos/día)."""
-        trends = {}
-        
         if len(timeline) < 2:
             return {k: 0.0 for k in self.TRACKED_SYMPTOMS}
 
+        keys = list(self.TRACKED_SYMPTOMS)
         # Eje X: Días desde el primer registro
         start_time = timeline[0]["timestamp"]
-        x = np.array([(t["timestamp"] - start_time) / 86400.0 for t in timeline]) # Días
-        
-        for key in self.TRACKED_SYMPTOMS:
-            y = np.array([t["symptoms"][key] for t in timeline])
-            
-            # Si todos los valores son 0, pendiente 0
-            if np.all(y == 0):
-                trends[key] = 0.0
+        x = np.fromiter(((t["timestamp"] - start_time) / 86400.0 for t in timeline), dtype=float, count=len(timeline))
+        # Matriz (n_sesiones x n_síntomas)
+        y = np.array([[t["symptoms"][k] for k in keys] for t in timeline], dtype=float)
+
+        slopes = self._least_squares_slopes(x, y)
+        return {k: float(m) for k, m in zip(keys, slopes)}
+
+    @staticmethod
+    def _least_squares_slopes(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Pendientes de regresión lineal simple (y = mx + b) de todas las columnas de y
+        a la vez. Columnas constantes (p.ej. todo 0) o eje X degenerado -> pendiente 0.
+        """
+        xc = x - x.mean()
+        sxx = float(xc @ xc)
+        if sxx <= 1e-12:
+            return np.zeros(y.shape[1])
+        return xc @ (y - y.mean(axis=0)) / sxx
+
+    def cohort_trends(self, patient_ids: np.ndarray, timestamps: np.ndarray, values: np.ndarray) -> Dict[str, Dict[str, Any]]:
+        """
+        Modo cohorte: tendencias y alertas de miles de pacientes en una sola pasada.
+
+        Args:
+            patient_ids: (n,) id de paciente de cada sesión
+            timestamps: (n,) epoch en segundos de cada sesión
+            values: (n, n_síntomas) valores en el orden de TRACKED_SYMPTOMS
+
+        Returns:
+            {patient_id: {"trends", "alerts", "latest", "n_sessions"}}
+        """
+        if len(patient_ids) == 0:
+            return {}
+        keys = list(self.TRACKED_SYMPTOMS)
+        patient_ids = np.asarray(patient_ids)
+        timestamps = np.asarray(timestamps, dtype=float)
+        values = np.asarray(values, dtype=float)
+
+        # Agrupar por paciente y ordenar por fecha dentro de cada grupo
+        order = np.lexsort((timestamps, patient_ids))
+        pids, ts, y = patient_ids[order], timestamps[order], values[order]
+
+        starts = np.flatnonzero(np.r_[True, pids[1:] != pids[:-1]])
+        ends = np.r_[starts[1:], len(pids)]
+        counts = (ends - starts).astype(float)
+        segment = np.repeat(np.arange(len(starts)), ends - starts)
+
+        # Reducciones por segmento: sumas para mínimos cuadrados cerrados por paciente
+        x = (ts - ts[starts][segment]) / 86400.0
+        sx = np.add.reduceat(x, starts)
+        sxx = np.add.reduceat(x * x, starts)
+        sy = np.add.reduceat(y, starts, axis=0)
+        sxy = np.add.reduceat(y * x[:, None], starts, axis=0)
+
+        denom = counts * sxx - sx * sx
+        valid = (counts >= 2) & (denom > 1e-12)
+        slopes = np.zeros_like(sy)
+        slopes[valid] = (counts[valid, None] * sxy[valid] - sx[valid, None] * sy[valid]) / denom[valid, None]
+
+        latest = y[ends - 1]
+        latest_ts = ts[ends - 1]
+
+        # Umbrales vectorizados (misma lógica que _generate_alerts)
+        scale_10 = latest > 1.0
+        critical = latest >= np.where(scale_10, 7.0, 0.7)
+        worsening = slopes > np.where(scale_10, 0.2, 0.02)
+        flagged = critical.any(axis=1) | worsening.any(axis=1)
+
+        result = {}
+        for i, pid in enumerate(pids[starts]):
+            trends = dict(zip(keys, slopes[i].tolist()))
+            latest_values = dict(zip(keys, latest[i].tolist()))
+            alerts = []
+            if flagged[i]:
+                date = datetime.fromtimestamp(latest_ts[i]).isoformat()
+                alerts = self._alerts_for(latest_values, trends, date)
+            result[str(pid)] = {
+                "trends": trends,
+                "alerts": alerts,
+                "latest": latest_values,
+                "n_sessions": int(counts[i])
+            }
+        return result
+
+    def analyze_cohort(self, rows: List[Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Modo cohorte a partir de filas SymptomScore
+        (patient_id, session_id, timestamp, symptom, value).
+        """
+        keys = list(self.TRACKED_SYMPTOMS)
+        column = {k: j for j, k in enumerate(keys)}
+        index: Dict[str, int] = {}
+        patient_ids, timestamps, matrix = [], [], []
+
+        for row in rows:
+            j = column.get(row.symptom)
+            if j is None:
                 continue
-                
-            # Regresión Lineal Simple (y = mx + b)
-            # m es la pendiente (cambio de severidad por día)
-            try:
-                slope, _ = np.polyfit(x, y, 1)
-                trends[key] = slope
-            except Exception:
-                trends[key] = 0.0
-                
-        return trends
+            i = index.get(row.session_id)
+            if i is None:
+                i = index[row.session_id] = len(patient_ids)
+                patient_ids.append(row.patient_id)
+                timestamps.append(row.timestamp.timestamp())
+                matrix.append([0.0] * len(keys))
+            matrix[i][j] = row.value
+
+        if not patient_ids:
+            return {}
+        return self.cohort_trends(np.array(patient_ids), np.array(timestamps), np.array(matrix))
 
     def _generate_alerts(self, timeline: List[Dict], trends: Dict[str, float]) -> List[Dict]:
         """Genera alertas basadas en niveles actuales y tendencias negativas."""
+        return self._alerts_for(timeline[-1]["symptoms"], trends, timeline[-1]["date"])
+
+    def _alerts_for(self, latest: Dict[str, float], trends: Dict[str, float], date: str) -> List[Dict]:
         alerts = []
-        latest = timeline[-1]["symptoms"]
         
         for key, label in self.TRACKED_SYMPTOMS.items():
             current_val = latest.get(key, 0)
@@ -127,7 +268,7 @@ class OncologyEvolutionService:
                     "severity": "high",
                     "symptom": label,
                     "message": f"Nivel crítico de {label} detectado ({current_val:.1f}). Requiere atención inmediata.",
-                    "date": timeline[-1]["date"]
+                    "date": date
                 })
             
             # B. Alerta de Tendencia de Empeoramiento (Pendiente Positiva)
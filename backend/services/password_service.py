@@ -0,0 +1,112 @@
+"""
+Pool acotado para hashing/verificación bcrypt fuera del event loop.
+
+bcrypt (12 rondas ~250 ms de CPU) bloqueaba el worker de uvicorn durante cada
+login/registro. bcrypt libera el GIL, así que un ThreadPoolExecutor dedicado da
+paralelismo real sin el coste de serializar a un proceso aparte.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordPoolSaturated(Exception):
+    """Hay demasiadas operaciones de contraseña en curso o en cola."""
+
+
+class PasswordService:
+    """
+    - Pool de hilos con tamaño fijo (PASSWORD_HASH_WORKERS).
+    - Límite de operaciones concurrentes (en curso + en cola): por encima se
+      rechaza con PasswordPoolSaturated para no acumular latencia sin límite.
+    - Métricas de tiempo en cola y de ejecución.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_pending = int(os.getenv("PASSWORD_MAX_PENDING", str(self.workers * 8)))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._queue_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta fn(*args) en el pool y espera el resultado sin bloquear el event loop."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordPoolSaturated(f"{self._pending} operaciones de contraseña pendientes")
+            self._pending += 1
+
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._queue_times.append(started - submitted)
+                    self._run_times.append(finished - started)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, task)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        from backend.auth import verify_password
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        from backend.auth import get_password_hash
+        return await self.run(get_password_hash, password)
+
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queue_times = list(self._queue_times)
+            run_times = list(self._run_times)
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "queue_ms_p50": round(self._percentile(queue_times, 0.50) * 1000, 2),
+            "queue_ms_p95": round(self._percentile(queue_times, 0.95) * 1000, 2),
+            "queue_ms_max": round(max(queue_times, default=0.0) * 1000, 2),
+            "run_ms_p50": round(self._percentile(run_times, 0.50) * 1000, 2),
+            "run_ms_p95": round(self._percentile(run_times, 0.95) * 1000, 2),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+# Instancia global
+password_service = PasswordService()
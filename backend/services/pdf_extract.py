@@ -0,0 +1,16 @@
+"""
+Extracción de texto de PDFs para el pool de procesos de la ingesta RAG.
+
+Módulo aparte y ligero a propósito: el pool arranca con "spawn" (no "fork",
+que desde el sidecar con hilos y event loop puede heredar locks tomados) y
+cada proceso hijo importa el módulo de la función que ejecuta. Importar
+rag_service ahí cargaría ChromaDB y el modelo de embeddings en cada hijo.
+"""
+from typing import List
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Texto de las páginas [start, stop) de un PDF."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
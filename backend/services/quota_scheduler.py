@@ -0,0 +1,364 @@
+"""
+Planificador de cuota del LLM en el cliente (token bucket RPM/TPM con prioridades).
+
+En lugar de reaccionar al 429 cuando la cuota de Gemini ya se agotó, todas las
+llamadas piden permiso aquí antes de salir:
+- Un token bucket de peticiones/minuto (RPM) y otro de tokens/minuto (TPM) por
+  backend, modelados sobre los límites de la API.
+- Carriles de prioridad: el triaje de riesgo se sirve antes que ESAS/chat, y
+  estos antes que SOAP/psicoeducación. Dentro de un carril, FIFO.
+- Ante un 429 se respeta Retry-After: el backend queda bloqueado hasta entonces
+  y las peticiones esperan en cola en lugar de fallar (hasta QUOTA_MAX_WAIT_SECONDS).
+"""
+
+import os
+import re
+import time
+import heapq
+import asyncio
+import logging
+import threading
+import itertools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Carril por agente (menor = más urgente)
+LANES = {"urgent": 0, "interactive": 1, "batch": 2, "background": 3}
+AGENT_LANES = {
+    "risk": "urgent",
+    "symptoms": "interactive",
+    "chat": "interactive",
+    "soap": "batch",
+    "psycho": "batch",
+    "memory_summary": "background",
+}
+
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("llm_lane", default="interactive")
+
+
+def is_quota_error(e: BaseException) -> bool:
+    """Único criterio para reconocer errores de cuota/rate limit (429) de cualquier cliente."""
+    message = str(e)
+    return (
+        "429" in message
+        or "quota" in message.lower()
+        or "RESOURCE_EXHAUSTED" in message
+        or type(e).__name__ in ("ResourceExhausted", "QuotaWaitTimeout")
+    )
+
+
+_RETRY_PATTERNS = [
+    re.compile(r"retry[_ ]delay\s*\{\s*seconds:\s*(\d+)", re.I),
+    re.compile(r"\"retryDelay\":\s*\"(\d+(?:\.\d+)?)s\"", re.I),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.I),
+    re.compile(r"retry-after[\"']?:?\s*[\"']?(\d+(?:\.\d+)?)", re.I),
+]
+
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """Extrae Retry-After de la excepción (atributo, cabecera HTTP o mensaje de Gemini)."""
+    value = getattr(e, "retry_after", None)
+    if value is not None:
+        return float(value)
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers and headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(str(e))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def estimate_tokens(messages: List[Any], expected_output: int) -> int:
+    """Estimación barata (~4 caracteres por token) del consumo TPM de una petición."""
+    chars = sum(len(str(getattr(m, "content", m))) for m in messages)
+    return chars // 4 + expected_output
+
+
+class QuotaWaitTimeout(RuntimeError):
+    """La petición esperó en cola más de QUOTA_MAX_WAIT_SECONDS (se trata como 429)."""
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self) -> None:
+        self.tokens = 0.0
+
+
+class _Waiter:
+    __slots__ = ("tokens", "lane", "enqueued", "event", "loop", "future", "cancelled")
+
+    def __init__(self, tokens: int, lane: str, loop=None, future=None):
+        self.tokens = tokens
+        self.lane = lane
+        self.enqueued = time.perf_counter()
+        self.event = threading.Event() if future is None else None
+        self.loop = loop
+        self.future = future
+        self.cancelled = False
+
+
+class _BackendQuota:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.rpm = _TokenBucket(rpm) if rpm else None
+        self.tpm = _TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.queue: List[Tuple[int, int, _Waiter]] = []
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.blocked_until - now)
+        if self.rpm:
+            wait = max(wait, self.rpm.wait_time(1, now))
+        if self.tpm:
+            wait = max(wait, self.tpm.wait_time(tokens, now))
+        return wait
+
+    def consume(self, tokens: int) -> None:
+        if self.rpm:
+            self.rpm.consume(1)
+        if self.tpm:
+            self.tpm.consume(tokens)
+
+
+class QuotaScheduler:
+    def __init__(self):
+        self.enabled = os.getenv("QUOTA_ENABLED", "1") == "1"
+        self.default_rpm = float(os.getenv("QUOTA_RPM", "15"))
+        self.default_tpm = float(os.getenv("QUOTA_TPM", "1000000"))
+        self.expected_output_tokens = int(os.getenv("QUOTA_EST_OUTPUT_TOKENS", "500"))
+        self.max_wait = float(os.getenv("QUOTA_MAX_WAIT_SECONDS", "60"))
+        self.max_retries = int(os.getenv("QUOTA_MAX_RETRIES", "3"))
+        self.default_backoff = float(os.getenv("QUOTA_DEFAULT_BACKOFF_SECONDS", "10"))
+        self.overrides = self._parse_limits(os.getenv("QUOTA_LIMITS", ""))
+        # Los buckets son por proceso: con N workers de gunicorn cada uno recibe 1/N de la cuota
+        self.workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+        self._cond = threading.Condition()
+        self._backends: Dict[str, _BackendQuota] = {}
+        self._seq = itertools.count()
+        self._dispatcher: Optional[threading.Thread] = None
+
+        self.throttled = 0
+        self.timeouts = 0
+        self.granted = {lane: 0 for lane in LANES}
+        self._waits = {lane: deque(maxlen=500) for lane in LANES}
+
+    # -------------------------------------------------------------------------
+    # Configuración
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _parse_limits(raw: str) -> Dict[str, Tuple[float, float]]:
+        """QUOTA_LIMITS="gemini-2.0-flash=15:1000000,gemini-2.0-flash-lite=30:1000000" """
+        limits = {}
+        for item in filter(None, (s.strip() for s in raw.split(","))):
+            name, _, values = item.partition("=")
+            rpm, _, tpm = values.partition(":")
+            limits[name] = (float(rpm or 0), float(tpm or 0))
+        return limits
+
+    def _quota(self, backend: str) -> _BackendQuota:
+        quota = self._backends.get(backend)
+        if quota is None:
+            if backend in self.overrides:
+                rpm, tpm = self.overrides[backend]
+            elif backend.startswith(("http://", "https://", "fake://")):
+                rpm, tpm = None, None  # backends locales (fake_llm_server): sin límite propio
+            else:
+                rpm, tpm = self.default_rpm, self.default_tpm
+            if rpm:
+                rpm /= self.workers
+            if tpm:
+                tpm /= self.workers
+            quota = self._backends[backend] = _BackendQuota(rpm, tpm)
+        return quota
+
+    # -------------------------------------------------------------------------
+    # Carril de la llamada actual
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def lane_for(agent: str) -> str:
+        return AGENT_LANES.get(agent, "interactive")
+
+    @staticmethod
+    def current_lane() -> str:
+        return _current_lane.get()
+
+    @contextmanager
+    def lane(self, agent: str):
+        """Marca el carril de las llamadas al LLM hechas dentro del bloque (hereda a tareas async)."""
+        token = _current_lane.set(self.lane_for(agent))
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    # -------------------------------------------------------------------------
+    # Adquisición
+    # -------------------------------------------------------------------------
+    def try_acquire(self, backend: str, tokens: int) -> bool:
+        """Sin esperar (peticiones cubiertas/hedges: no se lanzan si no hay cuota)."""
+        if not self.enabled:
+            return True
+        with self._cond:
+            quota = self._quota(backend)
+            if quota.queue or quota.wait_time(tokens, time.monotonic()) > 0:
+                return False
+            quota.consume(tokens)
+            return True
+
+    def acquire(self, backend: str, tokens: int, lane: Optional[str] = None) -> None:
+        """Bloquea el hilo hasta que haya cuota para el backend (o QuotaWaitTimeout)."""
+        if not self.enabled:
+            return
+        waiter = _Waiter(tokens, lane or self.current_lane())
+        self._enqueue(backend, waiter)
+        if not waiter.event.wait(self.max_wait):
+            with self._cond:
+                if not waiter.event.is_set():
+                    waiter.cancelled = True
+                    self.timeouts += 1
+                    raise QuotaWaitTimeout(f"429 quota: más de {self.max_wait:.0f}s en cola para '{backend}'")
+
+    async def aacquire(self, backend: str, tokens: int, lane: Optional[str] = None) -> None:
+        """Versión async: espera sin bloquear el event loop; cancelar la tarea abandona la cola."""
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(tokens, lane or self.current_lane(), loop=loop, future=loop.create_future())
+        self._enqueue(backend, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            with self._cond:
+                waiter.cancelled = True
+                if not waiter.future.done():
+                    self.timeouts += 1
+                    raise QuotaWaitTimeout(f"429 quota: más de {self.max_wait:.0f}s en cola para '{backend}'")
+        except asyncio.CancelledError:
+            with self._cond:
+                waiter.cancelled = True
+            raise
+
+    def _enqueue(self, backend: str, waiter: _Waiter) -> None:
+        with self._cond:
+            quota = self._quota(backend)
+            heapq.heappush(quota.queue, (LANES.get(waiter.lane, 1), next(self._seq), waiter))
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="quota-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+
+    def _dispatch_loop(self) -> None:
+        """Concede cuota en orden (carril, llegada) y duerme hasta el siguiente rellenado."""
+        with self._cond:
+            while True:
+                timeout = None
+                now = time.monotonic()
+                for quota in self._backends.values():
+                    while quota.queue:
+                        _, _, waiter = quota.queue[0]
+                        if waiter.cancelled:
+                            heapq.heappop(quota.queue)
+                            continue
+                        wait = quota.wait_time(waiter.tokens, now)
+                        if wait > 0:
+                            # Prioridad estricta: nadie adelanta al primero de la cola
+                            timeout = wait if timeout is None else min(timeout, wait)
+                            break
+                        heapq.heappop(quota.queue)
+                        quota.consume(waiter.tokens)
+                        self._grant(waiter)
+                self._cond.wait(timeout)
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self.granted[waiter.lane] = self.granted.get(waiter.lane, 0) + 1
+        self._waits.setdefault(waiter.lane, deque(maxlen=500)).append(time.perf_counter() - waiter.enqueued)
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(
+                lambda f=waiter.future: f.done() or f.set_result(True)
+            )
+
+    # -------------------------------------------------------------------------
+    # Respuesta a los 429
+    # -------------------------------------------------------------------------
+    def report_quota_error(self, backend: str, e: BaseException) -> float:
+        """Bloquea el backend durante Retry-After (o el backoff por defecto). Devuelve la espera."""
+        delay = retry_after_seconds(e) or self.default_backoff
+        with self._cond:
+            quota = self._quota(backend)
+            quota.blocked_until = max(quota.blocked_until, time.monotonic() + delay)
+            if quota.rpm:
+                quota.rpm.drain()
+            self.throttled += 1
+            self._cond.notify()
+        logger.warning(f"⏳ Cuota agotada en '{backend}': se reanuda en {delay:.1f}s")
+        return delay
+
+    def is_blocked(self, backend: str) -> bool:
+        with self._cond:
+            return self._quota(backend).blocked_until > time.monotonic()
+
+    # -------------------------------------------------------------------------
+    # Métricas
+    # -------------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            depth = {lane: 0 for lane in LANES}
+            backends = {}
+            for name, quota in self._backends.items():
+                for _, _, waiter in quota.queue:
+                    if not waiter.cancelled:
+                        depth[waiter.lane] = depth.get(waiter.lane, 0) + 1
+                backends[name] = {
+                    "queued": sum(1 for _, _, w in quota.queue if not w.cancelled),
+                    "blocked_for_s": round(max(0.0, quota.blocked_until - now), 1),
+                    "rpm_available": round(quota.rpm.tokens, 1) if quota.rpm else None,
+                    "tpm_available": round(quota.tpm.tokens) if quota.tpm else None,
+                }
+            waits = {lane: sorted(values) for lane, values in self._waits.items()}
+
+        pct = lambda v, q: round(v[min(len(v) - 1, int(q * len(v)))] * 1000, 1) if v else 0.0
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "throttled": self.throttled,
+            "timeouts": self.timeouts,
+            "queue_depth": depth,
+            "granted": dict(self.granted),
+            "wait_ms_p50": {lane: pct(v, 0.50) for lane, v in waits.items()},
+            "wait_ms_p95": {lane: pct(v, 0.95) for lane, v in waits.items()},
+            "backends": backends,
+        }
+
+
+# Instancia global
+quota_scheduler = QuotaScheduler()
@@ -1,24 +1,279 @@
 import os
+import re
+import json
+import time
+import hashlib
+import socket
 import logging
-from typing import List, Dict
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, List, Dict, Iterator, Optional, Tuple
 from datetime import datetime
 
+from backend.services.embedding_cache import embedding_cache
+from backend.services.bm25_index import BM25Index
+from backend.services.vector_store import FlatVectorStore, VectorStore
+from backend.services.pdf_extract import extract_page_range as _extract_page_range
+
+# Almacén vectorial: "chroma" (por defecto) o "flat" (matriz float16 mapeada en
+# memoria, ver vector_store.py: sin HNSW ni cliente Chroma en cada worker)
+RAG_VECTOR_STORE = os.getenv("RAG_VECTOR_STORE", "chroma")
+
+# Con RAG_SIDECAR_SOCKET, los workers de la API son clientes ligeros del proceso
+# rag_server.py, que es el único que carga el modelo de embeddings y los índices
+RAG_SIDECAR_SOCKET = os.getenv("RAG_SIDECAR_SOCKET", "")
+# Mismo límite por línea que aplica rag_server.py (16 MiB por defecto)
+RAG_SIDECAR_MAX_LINE_BYTES = int(os.getenv("RAG_SIDECAR_MAX_LINE_BYTES", str(16 << 20)))
+
 # Intentamos importar librerías RAG, fallback si no están instaladas
-try:
-    import chromadb
-    from chromadb.utils import embedding_functions
-    from pypdf import PdfReader
-    RAG_AVAILABLE = True
-except ImportError as e:
-    print(f"DEBUG: Error importando librerías RAG. Detalles: {e}")
-    RAG_AVAILABLE = False
-except Exception as e:
-    print(f"DEBUG: Error inesperado al importar RAG: {e}")
-    RAG_AVAILABLE = False
+if RAG_SIDECAR_SOCKET:
+    RAG_AVAILABLE = CHROMA_AVAILABLE = False
+else:
+    try:
+        from pypdf import PdfReader
+        try:
+            import chromadb
+            from chromadb.utils import embedding_functions
+            CHROMA_AVAILABLE = True
+        except ImportError:
+            # Con el almacén "flat" ChromaDB es opcional
+            if RAG_VECTOR_STORE != "flat":
+                raise
+            CHROMA_AVAILABLE = False
+        RAG_AVAILABLE = True
+    except ImportError as e:
+        print(f"DEBUG: Error importando librerías RAG. Detalles: {e}")
+        RAG_AVAILABLE = False
+    except Exception as e:
+        print(f"DEBUG: Error inesperado al importar RAG: {e}")
+        RAG_AVAILABLE = False
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "sentence-transformers" (por defecto) o "fake" para pruebas de carga sin modelo
+RAG_EMBEDDINGS = os.getenv("RAG_EMBEDDINGS", "sentence-transformers")
+
+# Recuperación: "dense" (ChromaDB), "sparse" (BM25) o "hybrid" (fusión RRF de ambos)
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+RRF_K = 60
+
+
+class HashingEmbeddingFunction:
+    """
+    Embeddings falsos y deterministas (hashing de palabras con signo, normalizados L2).
+    No descargan ni cargan ningún modelo; textos con palabras en común siguen
+    quedando cerca, lo justo para ejercitar ChromaDB en pruebas de carga.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in input]
+
+    @staticmethod
+    def name() -> str:
+        return "hashing-fake"
+
+def _sentence_transformer_ef(model_name: str):
+    """Embeddings Sentence Transformers: los de Chroma si está instalado, si no directamente."""
+    if CHROMA_AVAILABLE:
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(list(texts), convert_to_numpy=True).tolist()
+
+
+def _load_manifest(path: str) -> Dict:
+    """Manifiesto de la ingesta: {ruta relativa: {size, mtime, sha256, chunk_ids}}."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Manifiesto de ingesta ilegible ({e}); se reindexará todo.")
+        return {}
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _save_manifest(path: str, manifest: Dict) -> None:
+    """Escritura atómica (fichero temporal + rename) para no dejar un manifiesto a medias."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# -----------------------------------------------------------------------------
+# Pipeline de ingesta en streaming
+# -----------------------------------------------------------------------------
+def _resolve(index: int, item: Any) -> Tuple[int, Any]:
+    """(índice, páginas | excepción) de un tramo: futuro del pool, tarea en línea o error previo."""
+    try:
+        if isinstance(item, Future):
+            return index, item.result()
+        if isinstance(item, tuple):
+            return index, _extract_page_range(*item)
+        return index, item
+    except Exception as e:
+        return index, e
+
+
+def _rrf(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Reciprocal-rank fusion: suma de 1 / (k + posición) de cada id en cada ranking."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _chunk_pages(pages: List[str], carry: str, size: int) -> Tuple[List[str], str]:
+    """
+    Troceado incremental cada `size` caracteres: devuelve los fragmentos completos
+    y el resto pendiente. Mismo resultado que trocear el texto entero del PDF.
+    """
+    text = carry + "".join(page + "\n" for page in pages)
+    cut = len(text) - len(text) % size
+    return [text[i:i + size] for i in range(0, cut, size)], text[cut:]
+
+
+class _FileIngest:
+    """Estado de un fichero en el pipeline: IDs por contenido, resto sin trocear y errores."""
+
+    def __init__(self, path: str, rel_path: str, stat: os.stat_result, sha256: str, previous: Optional[Dict]):
+        self.path = path
+        self.rel_path = rel_path
+        self.filename = os.path.basename(path)
+        self.stat = stat
+        self.sha256 = sha256
+        self.previous = previous
+        self.old_ids = set(previous["chunk_ids"]) if previous else set()
+        self.ids: List[str] = []
+        self.fresh_ids: List[str] = []
+        self._seen: Dict[str, int] = {}
+        self.carry = ""
+        self.error: Optional[Exception] = None
+        self.opened = False
+
+    def add(self, chunk: str) -> bool:
+        """
+        Asigna ID por contenido (no por posición) al siguiente fragmento: si un PDF
+        cambia solo en parte, los idénticos conservan su ID y no se revectorizan.
+        Devuelve True si el fragmento es nuevo.
+        """
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+        self._seen[digest] = self._seen.get(digest, 0) + 1
+        suffix = f"-{self._seen[digest]}" if self._seen[digest] > 1 else ""
+        chunk_id = f"{self.rel_path}#{digest}{suffix}"
+        self.ids.append(chunk_id)
+        if chunk_id in self.old_ids:
+            return False
+        self.fresh_ids.append(chunk_id)
+        return True
+
+    def metadata(self) -> Dict:
+        return {"source": self.filename, "path": self.rel_path, "chunk_index": len(self.ids) - 1}
+
+
+class _IngestBatcher:
+    """
+    Embeddings en lotes de tamaño fijo y upserts acotados: la memoria del pipeline
+    es O(embed_batch + upsert_batch) fragmentos, no O(tamaño del PDF).
+    """
+
+    def __init__(self, collection, ef, embed_batch: int, upsert_batch: int, timings: Dict,
+                 bm25: Optional[BM25Index] = None):
+        self.collection = collection
+        self.ef = ef
+        self.bm25 = bm25
+        self.embed_batch = max(1, embed_batch)
+        self.upsert_batch = max(1, upsert_batch)
+        self.timings = timings
+        self.embedded = 0
+        # Ruta -> primer error de embeddings/upsert de sus fragmentos (el fichero se da por fallido)
+        self.failed: Dict[str, Exception] = {}
+        self._pending: List[Tuple[str, str, Dict]] = []
+        self._ready = {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+
+    def add(self, chunk_id: str, document: str, metadata: Dict) -> None:
+        if self.bm25 is not None:
+            t = time.perf_counter()
+            self.bm25.add(chunk_id, document)
+            self.timings["bm25"] += time.perf_counter() - t
+        self._pending.append((chunk_id, document, metadata))
+        if len(self._pending) >= self.embed_batch:
+            self._embed()
+
+    def _embed(self) -> None:
+        if not self._pending:
+            return
+        ids, documents, metadatas = zip(*self._pending)
+        self._pending = []
+        t = time.perf_counter()
+        try:
+            embeddings = self.ef(list(documents))
+        except Exception as e:
+            self._fail(metadatas, e)
+            return
+        finally:
+            self.timings["embed"] += time.perf_counter() - t
+        self.embedded += len(documents)
+
+        self._ready["ids"].extend(ids)
+        self._ready["documents"].extend(documents)
+        self._ready["embeddings"].extend(embeddings)
+        self._ready["metadatas"].extend(metadatas)
+        if len(self._ready["ids"]) >= self.upsert_batch:
+            self._upsert()
+
+    def _upsert(self) -> None:
+        if not self._ready["ids"]:
+            return
+        ready, self._ready = self._ready, {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+        t = time.perf_counter()
+        try:
+            self.collection.upsert(**ready)
+        except Exception as e:
+            self._fail(ready["metadatas"], e)
+        finally:
+            self.timings["upsert"] += time.perf_counter() - t
+
+    def _fail(self, metadatas, error: Exception) -> None:
+        for metadata in metadatas:
+            self.failed.setdefault(metadata["path"], error)
+
+    def flush(self) -> None:
+        self._embed()
+        self._upsert()
+
+    def discard(self) -> None:
+        """Descarta lo pendiente sin vectorizar ni escribir (fichero fallido)."""
+        self._pending = []
+        self._ready = {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+
+
 class RagService:
     """
     Servicio de 'Cerebro Clínico' que gestiona una base de conocimientos local.
@@ -27,39 +282,68 @@ class RagService:
     def __init__(self, knowledge_path: str = "knowledge_base", db_path: str = "./chroma_db"):
         self.knowledge_path = knowledge_path
         self.db_path = db_path
+        # Con embeddings falsos, colecciones (y manifiesto) propias: *_fake
+        suffix = "_fake" if RAG_EMBEDDINGS == "fake" else ""
+        self.embedding_model = HashingEmbeddingFunction.name() if RAG_EMBEDDINGS == "fake" else "all-MiniLM-L6-v2"
+        # Cada almacén tiene su propio manifiesto e índice BM25 (cambiar de almacén reindexa)
+        self.store_path = os.path.join(db_path, "flat") if RAG_VECTOR_STORE == "flat" else db_path
+        self.manifest_path = os.path.join(self.store_path, f"ingest_manifest{suffix}.json")
+        # Pipeline de ingesta: procesos de extracción, páginas por tarea, tareas en
+        # vuelo, fragmentos por lote de embeddings y por upsert en ChromaDB
+        # Por defecto como mucho 2 procesos: cada uno es un intérprete con pypdf (objetivo < 512 MB)
+        self.ingest_workers = int(os.getenv("RAG_INGEST_WORKERS", str(min(os.cpu_count() or 1, 2))))
+        self.ingest_pages_per_task = int(os.getenv("RAG_INGEST_PAGES_PER_TASK", "16"))
+        self.ingest_prefetch = int(os.getenv("RAG_INGEST_PREFETCH", str(2 * max(self.ingest_workers, 1))))
+        self.embed_batch_size = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+        self.upsert_batch_size = int(os.getenv("RAG_UPSERT_BATCH_SIZE", "512"))
+        self.retrieval_mode = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+        # Candidatos de cada ranking (denso y BM25) antes de la fusión
+        self.hybrid_candidates = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
         self.client = None
         self.collection = None
+        self.bm25 = None
         
         if RAG_AVAILABLE:
             try:
                 # Usamos almacenamiento persistente en disco
-                self.client = chromadb.PersistentClient(path=self.db_path)
+                if RAG_VECTOR_STORE != "flat":
+                    self.client = chromadb.PersistentClient(path=self.db_path)
                 
                 # Función de embedding por defecto (Sentence Transformers - all-MiniLM-L6-v2)
                 # Es ligera, rápida y corre en CPU.
-                self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-                    model_name="all-MiniLM-L6-v2"
-                )
+                # Con RAG_EMBEDDINGS=fake se usan embeddings por hashing en colecciones
+                # propias (*_fake) para no mezclar vectores de distinto origen.
+                if RAG_EMBEDDINGS == "fake":
+                    self.ef = HashingEmbeddingFunction()
+                else:
+                    self.ef = _sentence_transformer_ef(self.embedding_model)
                 
-                self.collection = self.client.get_or_create_collection(
-                    name="clinical_knowledge",
-                    embedding_function=self.ef
-                )
+                self.collection = self._open_store(f"clinical_knowledge{suffix}")
                 
                 # Active Learning Collection
-                self.feedback_collection = self.client.get_or_create_collection(
-                    name="feedback_learning",
-                    embedding_function=self.ef
-                )
+                self.feedback_collection = self._open_store(f"feedback_learning{suffix}")
                 
-                logger.info(f"🧠 RagService: Conectado a ChromaDB en '{db_path}'")
+                # Índice léxico BM25 de los mismos fragmentos (búsqueda híbrida)
+                self.bm25 = BM25Index(os.path.join(self.store_path, f"bm25_index{suffix}.npz"))
+                
+                logger.info(f"🧠 RagService: Almacén vectorial '{RAG_VECTOR_STORE}' en '{self.store_path}'")
             except Exception as e:
-                logger.error(f"❌ Error inicializando ChromaDB: {e}")
+                logger.error(f"❌ Error inicializando el almacén vectorial ({RAG_VECTOR_STORE}): {e}")
                 # No modificamos la variable global para evitar UnboundLocalError
                 self.client = None
                 self.collection = None
                 self.feedback_collection = None
 
+    def _open_store(self, name: str) -> VectorStore:
+        """Colección de Chroma o FlatVectorStore: misma interfaz (upsert/delete/query/get/count)."""
+        if RAG_VECTOR_STORE == "flat":
+            return FlatVectorStore(os.path.join(self.store_path, name))
+        return self.client.get_or_create_collection(name=name, embedding_function=self.ef)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de consultas a través de la caché LRU (evita recalcular textos repetidos en CPU)."""
+        return embedding_cache.embed(texts, self.ef, self.embedding_model)
+
     def store_feedback(self, text: str, correction: dict, session_id: str) -> bool:
         """
         Almacena una corrección médica como vector.
@@ -76,6 +360,7 @@ class RagService:
             
             self.feedback_collection.upsert(
                 documents=[text],
+                embeddings=self.embed_queries([text]),
                 metadatas=[{"session_id": session_id, "correction": correction_str}],
                 ids=[f"feedback_{session_id}"]
             )
@@ -94,7 +379,7 @@ class RagService:
             
         try:
             results = self.feedback_collection.query(
-                query_texts=[text],
+                query_embeddings=self.embed_queries([text]),
                 n_results=3
             )
             
@@ -118,9 +403,109 @@ class RagService:
             logger.error(f"Error buscando feedback similar: {e}")
             return []
 
-    def ingest_documents(self) -> dict:
+    # -------------------------------------------------------------------------
+    # Ingesta incremental en streaming
+    # -------------------------------------------------------------------------
+    CHUNK_SIZE = 1000
+
+    def _list_pdfs(self) -> List[str]:
+        files = []
+        for root, dirs, filenames in os.walk(self.knowledge_path):
+            for filename in filenames:
+                if filename.lower().endswith(".pdf"):
+                    # Guardamos ruta completa
+                    files.append(os.path.join(root, filename))
+        return sorted(files)
+
+    def _stream_pages(self, paths: List[str], pool: Optional[ProcessPoolExecutor]) -> Iterator[Tuple[int, Any]]:
         """
-        Lee todos los PDFs de la carpeta knowledge_base y los indexa.
+        Genera (índice de fichero, páginas | excepción) en orden, con la extracción
+        repartida en tramos de páginas entre procesos. Solo hay ingest_prefetch
+        tramos en vuelo: la memoria no crece con el tamaño de la biblioteca.
+        """
+        in_flight = deque()
+        for index, path in enumerate(paths):
+            try:
+                n_pages = len(PdfReader(path).pages)
+            except Exception as e:
+                in_flight.append((index, e))
+                continue
+            # Un PDF sin páginas produce igualmente un tramo vacío (para cerrarlo)
+            for start in range(0, max(n_pages, 1), self.ingest_pages_per_task):
+                task = (path, start, min(start + self.ingest_pages_per_task, n_pages))
+                in_flight.append((index, pool.submit(_extract_page_range, *task) if pool else task))
+                while len(in_flight) > self.ingest_prefetch:
+                    yield _resolve(*in_flight.popleft())
+        while in_flight:
+            yield _resolve(*in_flight.popleft())
+
+    def _open_file(self, state: "_FileIngest", timings: Dict) -> None:
+        if state.previous is None:
+            # Primera vez en el manifiesto (o force): purgar fragmentos de versiones
+            # anteriores de la ingesta (IDs posicionales "<fichero>_<n>") y, con force,
+            # los de esta misma ruta, antes de que el batcher empiece a escribir los
+            # nuevos. "source" es solo el nombre: otro guia.pdf en otra subcarpeta
+            # comparte ese valor y sus fragmentos no se tocan
+            t = time.perf_counter()
+            found = self.collection.get(where={"source": state.filename}, include=[])
+            purge = [chunk_id for chunk_id in found["ids"]
+                     if "#" not in chunk_id or chunk_id.startswith(f"{state.rel_path}#")]
+            if purge:
+                self.collection.delete(ids=purge)
+            timings["delete"] += time.perf_counter() - t
+        state.opened = True
+
+    def _finish_file(self, state: "_FileIngest", batcher: "_IngestBatcher", new_manifest: Dict,
+                     counts: Dict, timings: Dict) -> int:
+        """Cierra un fichero: último fragmento, borrado de obsoletos y entrada del manifiesto."""
+        if state.error is None and state.carry:
+            if state.add(state.carry):
+                batcher.add(state.ids[-1], state.carry, state.metadata())
+        # Lotes cerrados por fichero: un error de embeddings o de ChromaDB solo
+        # afecta a este fichero y se sabe antes de escribir su manifiesto
+        if state.error is None:
+            batcher.flush()
+            state.error = batcher.failed.get(state.rel_path)
+
+        if state.error is not None:
+            logger.error(f"⚠️ Error procesando {state.filename}: {state.error}")
+            counts["failed"] += 1
+            batcher.discard()
+            if state.fresh_ids:
+                # Fragmentos ya enviados de un fichero a medias: fuera, para no dejar huérfanos
+                try:
+                    self.collection.delete(ids=state.fresh_ids)
+                except Exception as e:
+                    logger.error(f"⚠️ No se pudieron borrar los fragmentos de {state.filename}: {e}")
+            if state.previous:
+                new_manifest[state.rel_path] = state.previous
+            return 0
+
+        stale = sorted(state.old_ids - set(state.ids))
+        if stale:
+            t = time.perf_counter()
+            self.collection.delete(ids=stale)
+            timings["delete"] += time.perf_counter() - t
+
+        new_manifest[state.rel_path] = {
+            "size": state.stat.st_size, "mtime": state.stat.st_mtime, "sha256": state.sha256, "chunk_ids": state.ids
+        }
+        counts["updated" if state.previous else "added"] += 1
+        logger.info(f"📄 Procesado: {state.filename} ({len(state.fresh_ids)} fragmentos nuevos, {len(stale)} obsoletos)")
+        return len(stale)
+
+    def ingest_documents(self, force: bool = False) -> dict:
+        """
+        Indexa los PDFs de la carpeta knowledge_base de forma incremental.
+
+        Un manifiesto (ruta -> tamaño, mtime, sha256, ids de fragmentos) permite
+        saltarse los ficheros sin cambios; de los modificados solo se vectorizan
+        los fragmentos nuevos y se borran los obsoletos, y los ficheros eliminados
+        se purgan de la colección. force=True reindexa todo.
+
+        Los ficheros nuevos o modificados pasan por un pipeline en streaming:
+        extracción de páginas en un pool de procesos -> troceado incremental ->
+        embeddings en lotes fijos -> upserts acotados en ChromaDB.
         """
         if not RAG_AVAILABLE:
             return {"error": "Librerías RAG no instaladas (chromadb, pypdf)."}
@@ -129,79 +514,323 @@ class RagService:
             os.makedirs(self.knowledge_path)
             return {"message": f"Carpeta '{self.knowledge_path}' creada. Añade PDFs ahí."}
 
-        files = []
-        for root, dirs, filenames in os.walk(self.knowledge_path):
-            for filename in filenames:
-                if filename.lower().endswith(".pdf"):
-                    # Guardamos ruta completa
-                    files.append(os.path.join(root, filename))
+        timings = dict.fromkeys(
+            ("scan", "hash", "extract", "chunk", "embed", "upsert", "delete", "bm25", "manifest"), 0.0
+        )
+        started = time.perf_counter()
+        manifest = _load_manifest(self.manifest_path)
+        files = self._list_pdfs()
+        timings["scan"] = time.perf_counter() - started
 
-        if not files:
+        if not files and not manifest:
             return {"message": "No hay PDFs en la carpeta de conocimiento (ni subcarpetas)."}
-            
-        total_chunks = 0
-        
+
+        counts = dict.fromkeys(("unchanged", "added", "updated", "removed", "failed"), 0)
+        new_manifest = {}
+        pending: List[_FileIngest] = []
+
+        # 1. Detección de cambios: tamaño/mtime y, solo si difieren, sha256
         for path in files:
-            filename = os.path.basename(path)
-            try:
-                reader = PdfReader(path)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                # Troceado básico (Chunking) cada 1000 caracteres
-                chunk_size = 1000
-                chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-                
-                # Generar IDs únicos y metadatos
-                ids = [f"{filename}_{i}" for i in range(len(chunks))]
-                metadatas = [{"source": filename, "chunk_index": i} for i in range(len(chunks))]
-                
-                # Upsert (Insertar o Actualizar)
-                self.collection.upsert(
-                    documents=chunks,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                total_chunks += len(chunks)
-                logger.info(f"📄 Procesado: {filename} ({len(chunks)} fragmentos)")
-                
-            except Exception as e:
-                logger.error(f"⚠️ Error procesando {filename}: {e}")
+            rel_path = os.path.relpath(path, self.knowledge_path)
+            stat = os.stat(path)
+            previous = None if force else manifest.get(rel_path)
+
+            if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                new_manifest[rel_path] = previous
+                counts["unchanged"] += 1
+                continue
+
+            t = time.perf_counter()
+            sha256 = _sha256_file(path)
+            timings["hash"] += time.perf_counter() - t
+
+            # Solo ha cambiado el mtime (copia, checkout...): se actualiza el manifiesto
+            if previous and previous["sha256"] == sha256:
+                new_manifest[rel_path] = {**previous, "size": stat.st_size, "mtime": stat.st_mtime}
+                counts["unchanged"] += 1
+                continue
+            pending.append(_FileIngest(path, rel_path, stat, sha256, previous))
+
+        # 2. Pipeline en streaming para los ficheros nuevos o modificados
+        batcher = _IngestBatcher(self.collection, self.ef, self.embed_batch_size, self.upsert_batch_size, timings,
+                                 bm25=self.bm25)
+        pages_total = chunks_total = chunks_deleted = 0
+        pipeline_started = time.perf_counter()
+        # Se reparte por tramos de páginas: un único PDF grande también aprovecha el pool
+        workers = max(self.ingest_workers, 1) if pending else 0
+        # spawn, no fork: desde el sidecar se ingesta en un hilo de un proceso con event loop
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) \
+            if workers > 1 else None
+        try:
+            state = None
+            t = time.perf_counter()
+            for index, pages in self._stream_pages([f.path for f in pending], pool):
+                timings["extract"] += time.perf_counter() - t
+                if state is not pending[index]:
+                    if state is not None:
+                        chunks_deleted += self._finish_file(state, batcher, new_manifest, counts, timings)
+                    state = pending[index]
+
+                if isinstance(pages, Exception):
+                    state.error = pages
+                elif state.error is None and state.rel_path in batcher.failed:
+                    state.error = batcher.failed[state.rel_path]
+                elif state.error is None:
+                    if not state.opened:
+                        self._open_file(state, timings)
+                    t = time.perf_counter()
+                    pages_total += len(pages)
+                    chunks, state.carry = _chunk_pages(pages, state.carry, self.CHUNK_SIZE)
+                    timings["chunk"] += time.perf_counter() - t
+                    for chunk in chunks:
+                        chunks_total += 1
+                        if state.add(chunk):
+                            batcher.add(state.ids[-1], chunk, state.metadata())
+                t = time.perf_counter()
+            if state is not None:
+                chunks_deleted += self._finish_file(state, batcher, new_manifest, counts, timings)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        pipeline_seconds = time.perf_counter() - pipeline_started
 
-        return {"success": True, "files_processed": len(files), "chunks_added": total_chunks}
+        # 3. Ficheros eliminados: purgar sus fragmentos
+        t = time.perf_counter()
+        for rel_path in set(manifest) - set(new_manifest):
+            removed_ids = manifest[rel_path]["chunk_ids"]
+            if removed_ids:
+                self.collection.delete(ids=removed_ids)
+            chunks_deleted += len(removed_ids)
+            counts["removed"] += 1
+            logger.info(f"🗑️ Eliminado del índice: {rel_path} ({len(removed_ids)} fragmentos)")
+        timings["delete"] += time.perf_counter() - t
 
-    def query_expert(self, query: str, n_results: int = 3) -> Dict:
+        if self.bm25 is not None:
+            t = time.perf_counter()
+            self._sync_bm25(new_manifest)
+            timings["bm25"] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        _save_manifest(self.manifest_path, new_manifest)
+        timings["manifest"] = time.perf_counter() - t
+
+        # "extract" es el tiempo que el pipeline esperó por páginas (la extracción corre en paralelo)
+        return {
+            "success": True,
+            "files_processed": counts["added"] + counts["updated"],
+            "chunks_added": batcher.embedded,
+            "chunks_deleted": chunks_deleted,
+            "files": counts,
+            "workers": max(workers, 1),
+            "pages": pages_total,
+            "pages_per_s": round(pages_total / pipeline_seconds, 1) if pipeline_seconds else 0.0,
+            "chunks_per_s": round(chunks_total / pipeline_seconds, 1) if pipeline_seconds else 0.0,
+            "bm25": self.bm25.stats() if self.bm25 is not None else None,
+            "timings_ms": {phase: round(v * 1000, 1) for phase, v in timings.items()},
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def _sync_bm25(self, manifest: Dict) -> None:
+        """
+        Alinea el índice BM25 con el manifiesto: fuera los fragmentos que ya no
+        existen (obsoletos, ficheros borrados o fallidos) y se rellenan desde
+        ChromaDB los que falten (p. ej. colecciones indexadas antes del BM25).
+        """
+        valid = {chunk_id for entry in manifest.values() for chunk_id in entry["chunk_ids"]}
+        indexed = self.bm25.ids()
+        self.bm25.remove(indexed - valid)
+
+        missing = sorted(valid - indexed)
+        for i in range(0, len(missing), self.upsert_batch_size):
+            batch = self.collection.get(ids=missing[i:i + self.upsert_batch_size], include=["documents"])
+            for chunk_id, document in zip(batch["ids"], batch["documents"]):
+                self.bm25.add(chunk_id, document or "")
+        if missing:
+            logger.info(f"🔤 Índice BM25: {len(missing)} fragmentos recuperados de ChromaDB")
+        self.bm25.commit()
+
+    def _dense_search(self, query: str, n: int) -> List[Tuple[str, str, Dict]]:
+        results = self.collection.query(query_embeddings=self.embed_queries([query]), n_results=n)
+        if not results['documents'] or not results['documents'][0]:
+            return []
+        return list(zip(results['ids'][0], results['documents'][0], results['metadatas'][0]))
+
+    def _fetch(self, ids: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        """Documento y metadatos de fragmentos que solo ha devuelto el BM25."""
+        if not ids:
+            return {}
+        found = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {i: (d, m) for i, d, m in zip(found['ids'], found['documents'], found['metadatas'])}
+
+    def query_expert(self, query: str, n_results: int = 3, mode: Optional[str] = None) -> Dict:
         """
         Busca contexto relevante para una pregunta clínica.
+
+        mode: "dense" (embeddings), "sparse" (BM25: nombres de fármacos, dosis)
+        o "hybrid" (fusión RRF de ambos rankings). Por defecto RAG_RETRIEVAL_MODE;
+        sin índice BM25 se degrada a "dense".
         """
         if not RAG_AVAILABLE or not self.collection:
             return {"error": "RAG no disponible"}
+
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            return {"error": f"Modo de recuperación desconocido: {mode} (usar {', '.join(RETRIEVAL_MODES)})"}
+        if mode != "dense" and (self.bm25 is None or not len(self.bm25)):
+            mode = "dense"
             
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results
-            )
+            if mode == "dense":
+                hits = self._dense_search(query, n_results)
+            else:
+                candidates = max(n_results, self.hybrid_candidates)
+                sparse_ids = [doc_id for doc_id, _ in self.bm25.search(query, candidates)]
+                if mode == "sparse":
+                    ranked, known = sparse_ids[:n_results], {}
+                else:
+                    dense = self._dense_search(query, candidates)
+                    known = {doc_id: (doc, meta) for doc_id, doc, meta in dense}
+                    ranked = _rrf([[doc_id for doc_id, _, _ in dense], sparse_ids])[:n_results]
+                known.update(self._fetch([doc_id for doc_id in ranked if doc_id not in known]))
+                hits = [(doc_id, *known[doc_id]) for doc_id in ranked if doc_id in known]
             
             # Verificar si hay resultados
-            if not results['documents'] or not results['documents'][0]:
-                return {"query": query, "context": "No se encontró información relevante.", "sources": []}
+            if not hits:
+                return {"query": query, "context": "No se encontró información relevante.", "sources": [], "mode": mode}
 
             # Extracción segura de documentos y metadatos
-            documents = results['documents'][0]
-            metadatas = results['metadatas'][0]
+            documents = [doc for _, doc, _ in hits]
+            metadatas = [meta for _, _, meta in hits]
             
             context_text = "\n\n".join([f"[Fuente: {m['source']}]\n{d}" for d, m in zip(documents, metadatas)])
             
             return {
                 "query": query,
                 "context": context_text,
-                "sources": [m['source'] for m in metadatas]
+                "sources": [m['source'] for m in metadatas],
+                "mode": mode
             }
         except Exception as e:
-            logger.error(f"Error consultando ChromaDB: {e}")
+            logger.error(f"Error consultando el almacén vectorial: {e}")
             return {"error": str(e)}
 
-# Instancia Global
-rag_service = RagService()
+    def stats(self) -> Dict:
+        return {
+            "mode": "local",
+            "vector_store": RAG_VECTOR_STORE,
+            "retrieval_mode": self.retrieval_mode,
+            "embedding_cache": embedding_cache.stats(),
+            "bm25": self.bm25.stats() if self.bm25 is not None else None,
+        }
+
+
+class RagSidecarClient:
+    """
+    Cliente de rag_server.py por socket Unix, con la misma interfaz que RagService.
+
+    Una conexión por hilo (las llamadas llegan desde asyncio.to_thread y desde
+    código síncrono); el servidor agrupa en lotes las peticiones concurrentes
+    de todos los workers. Si el proceso lateral no responde, se devuelven los
+    mismos valores de "RAG no disponible" que RagService sin librerías.
+    """
+
+    def __init__(self, socket_path: str, knowledge_path: str = "knowledge_base", timeout: float = None):
+        self.socket_path = socket_path
+        self.knowledge_path = knowledge_path
+        self.timeout = timeout or float(os.getenv("RAG_SIDECAR_TIMEOUT_SECONDS", "30"))
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+
+    def _close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def _call(self, op: str, timeout: Optional[float] = -1, **args) -> Any:
+        """
+        Una petición (línea JSON) y su respuesta.
+
+        Reintenta una vez solo si una conexión reutilizada estaba rota: fallo al
+        enviar o EOF sin ningún byte de respuesta. Un timeout leyendo no se
+        reintenta: el servidor puede estar ejecutando la petición (store_feedback
+        se guardaría dos veces) y se duplicaría la latencia.
+        """
+        payload = (json.dumps({"op": op, "args": args}, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(payload) > RAG_SIDECAR_MAX_LINE_BYTES:
+            # El servidor la rechazaría; mejor un error claro aquí que una conexión cortada
+            raise ValueError(f"Petición al servicio RAG demasiado grande ({len(payload)} bytes, "
+                             f"máximo {RAG_SIDECAR_MAX_LINE_BYTES})")
+        for attempt in (1, 2):
+            reused = getattr(self._local, "conn", None) is not None
+            # Una conexión reutilizada puede haber muerto con un reinicio del servidor
+            retry = attempt == 1 and reused
+            try:
+                sock, reader = self._connection()
+                sock.settimeout(self.timeout if timeout == -1 else timeout)
+                sock.sendall(payload)
+            except OSError:
+                self._close()
+                if not retry:
+                    raise
+                continue
+            try:
+                line = reader.readline()
+            except OSError:
+                self._close()
+                raise
+            if line:
+                break
+            self._close()
+            if not retry:
+                raise ConnectionResetError("El servicio RAG cerró la conexión")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def query_expert(self, query: str, n_results: int = 3, mode: Optional[str] = None) -> Dict:
+        try:
+            return self._call("query_expert", query=query, n_results=n_results, mode=mode)
+        except (OSError, RuntimeError, ValueError) as e:
+            logger.error(f"Error consultando el servicio RAG: {e}")
+            return {"error": f"Servicio RAG no disponible: {e}"}
+
+    def find_similar_feedback(self, text: str, threshold: float = 0.5) -> List[Dict]:
+        try:
+            return self._call("find_similar_feedback", text=text, threshold=threshold)
+        except (OSError, RuntimeError, ValueError) as e:
+            logger.error(f"Error buscando feedback similar en el servicio RAG: {e}")
+            return []
+
+    def store_feedback(self, text: str, correction: dict, session_id: str) -> bool:
+        try:
+            return self._call("store_feedback", text=text, correction=correction, session_id=session_id)
+        except (OSError, RuntimeError, ValueError) as e:
+            logger.error(f"Error guardando feedback en el servicio RAG: {e}")
+            return False
+
+    def ingest_documents(self, force: bool = False) -> dict:
+        # La ingesta la hace el servidor (único escritor de los índices); puede tardar minutos
+        try:
+            return self._call("ingest_documents", timeout=None, force=force)
+        except (OSError, RuntimeError, ValueError) as e:
+            return {"error": f"Servicio RAG no disponible: {e}"}
+
+    def stats(self) -> Dict:
+        try:
+            return {**self._call("stats"), "mode": "sidecar", "socket": self.socket_path}
+        except (OSError, RuntimeError, ValueError) as e:
+            return {"mode": "sidecar", "socket": self.socket_path, "error": str(e)}
+
+
+# Instancia Global (con RAG_SIDECAR_SOCKET, cliente del proceso rag_server.py)
+rag_service = RagSidecarClient(RAG_SIDECAR_SOCKET) if RAG_SIDECAR_SOCKET else RagService()
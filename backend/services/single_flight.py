@@ -0,0 +1,116 @@
+"""
+Single-flight: las llamadas idénticas concurrentes comparten una sola ejecución.
+
+Si varios clínicos abren la misma sesión (o el frontend envía dos veces), las
+llamadas al LLM con el mismo prompt normalizado se agrupan: solo la primera
+(líder) consulta a Gemini y el resto espera su resultado.
+
+Semántica:
+- Errores: la excepción del líder se propaga a todos los que esperaban.
+- Cancelación (async): cancelar a un llamador solo lo cancela a él; la llamada
+  compartida solo se cancela cuando ya no queda nadie esperándola.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _SyncCall:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 1
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_calls: Dict[str, _SyncCall] = {}
+        self._async_calls: Dict[Tuple[int, str], _AsyncCall] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Ejecuta fn() una sola vez por clave entre hilos concurrentes."""
+        with self._lock:
+            call = self._sync_calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._sync_calls[key] = _SyncCall()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Versión async: todos los llamadores del mismo event loop comparten una tarea."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        call = self._async_calls.get(loop_key)
+        if call is None or call.task.done():
+            call = self._async_calls[loop_key] = _AsyncCall(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _t, k=loop_key, c=call: self._forget(k, c))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # shield: cancelar a este llamador no cancela la llamada compartida
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, loop_key: Tuple[int, str], call: _AsyncCall) -> None:
+        if self._async_calls.get(loop_key) is call:
+            del self._async_calls[loop_key]
+        # Evita el aviso "exception was never retrieved" si nadie quedaba esperando
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._sync_calls) + len(self._async_calls),
+        }
+
+
+# Instancia global (llamadas al LLM)
+llm_single_flight = SingleFlight()
@@ -4,6 +4,8 @@ from google import genai
 from google.genai import types
 from typing import Dict, Any
 
+from backend.services.quota_scheduler import quota_scheduler, is_quota_error, estimate_tokens
+
 logger = logging.getLogger(__name__)
 
 class SOAPService:
@@ -71,6 +73,11 @@ class SOAPService:
         )
 
         try:
+            quota_scheduler.acquire(
+                self.model_id,
+                estimate_tokens([system_instruction, user_content], quota_scheduler.expected_output_tokens),
+                quota_scheduler.lane_for("soap")
+            )
             response = self.client.models.generate_content(
                 model=self.model_id,
                 contents=user_content,
@@ -87,7 +94,8 @@ class SOAPService:
             logger.error(f"❌ Error llamando a Gemini: {e}")
             
             # Detectar error de cuota específicamente
-            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+            if is_quota_error(e):
+                quota_scheduler.report_quota_error(self.model_id, e)
                 return (
                     "⚠️ LÍMITE DE CUOTA ALCANZADO\n\n"
                     "La API de Gemini ha alcanzado su límite de uso gratuito.\n\n"
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import logging
+import importlib.util
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Léxico de urgencias (texto normalizado: minúsculas y sin acentos).
+# Un '*' final indica raíz: acepta cualquier terminación (flexión verbal/nominal).
+# - critical: urgencia inequívoca -> se marca riesgo sin consultar al LLM.
+# - warning: término ambiguo ("muerte", "sangre"...) -> decide el agente LLM.
+DEFAULT_LEXICON: Dict[str, Dict[str, List[str]]] = {
+    "critical": {
+        "suicidio": ["matarme", "suicid*", "quitarme la vida", "acabar con todo", "no quiero vivir",
+                     "quiero morirme", "hacerme dano"],
+        "disnea": ["no puedo respirar", "falta de aire", "me ahog*", "ahogand*", "ahogo", "asfixi*"],
+        "dolor": ["dolor insoportable", "gritos de dolor", "no aguanto el dolor", "dolor inaguantable"],
+        "hemorragia": ["sangrando", "hemorragi*", "vomit* sangre", "escup* sangre"],
+        "sepsis": ["fiebre alta", "tiriton*", "tiritand*"],
+        "compresion_medular": ["no puedo mover las piernas", "perdida de fuerza en las piernas", "no siento las piernas"],
+    },
+    "warning": {
+        "muerte": ["morir*", "muerte", "muero"],
+        "sangrado": ["sangr*"],
+        "fiebre": ["fiebre", "escalofrio*"],
+        "dolor": ["dolor fuerte", "mucho dolor", "me duele mucho"],
+        "incontinencia": ["incontinencia", "no controlo la orina"],
+    },
+}
+
+
+# Negación en las palabras previas a un término ("no tengo fiebre alta", "ya no
+# pienso en suicidarme"): la coincidencia se aparta a hits["negated"] y decide el
+# LLM. El ámbito se corta en la puntuación y en conjunciones ("no duermo, me ahogo").
+NEGATION_WINDOW = 4
+NEGATORS = {"no", "sin", "nunca", "jamas", "tampoco", "ni"}
+_NEGATION_SCOPE_BREAK = re.compile(r"[.,;:!?]|\b(?:pero|aunque|y)\b")
+
+
+class TriageDecision(NamedTuple):
+    risk_found: bool
+    risk_level: str
+    explanation: str
+    tier: str  # "lexicon" | "ml"
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", stripped).strip()
+
+
+class TriageService:
+    """
+    Pre-triaje local por niveles delante del agente LLM de riesgo:
+
+    1. Léxico: un único autómata regex compilado sobre el texto normalizado.
+    2. Modelo TF-IDF (emotion_ml_service): solo descarta riesgo si el texto es
+       claramente positivo y no hay ningún término de alarma.
+    3. Si ninguno decide, devuelve None y el llamador consulta al LLM.
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        self.ml_enabled = os.getenv("TRIAGE_ML_ENABLED", "1") == "1"
+        self.ml_safe_threshold = float(os.getenv("TRIAGE_ML_SAFE_THRESHOLD", "0.85"))
+        if self.ml_enabled and not all(importlib.util.find_spec(m) for m in ("sklearn", "joblib")):
+            # requirements-lite (imagen Docker) no instala scikit-learn: solo léxico + LLM
+            logger.info("ℹ️ Nivel ML de triaje desactivado: scikit-learn/joblib no instalados.")
+            self.ml_enabled = False
+        self.lexicon = {level: {cat: list(terms) for cat, terms in cats.items()}
+                        for level, cats in (lexicon or DEFAULT_LEXICON).items()}
+
+        extra_path = os.getenv("TRIAGE_LEXICON_PATH")
+        if extra_path and os.path.exists(extra_path):
+            try:
+                with open(extra_path, encoding="utf-8") as f:
+                    self.extend(json.load(f))
+                logger.info(f"📚 Léxico de triaje ampliado desde {extra_path}")
+            except Exception as e:
+                logger.error(f"❌ Error cargando léxico de triaje {extra_path}: {e}")
+
+        self._compile()
+
+    def extend(self, extra: Dict[str, Dict[str, List[str]]]) -> None:
+        """Añade términos al léxico ({nivel: {categoría: [términos]}}) y recompila."""
+        for level, cats in extra.items():
+            for cat, terms in cats.items():
+                self.lexicon.setdefault(level, {}).setdefault(cat, []).extend(terms)
+        self._compile()
+
+    @staticmethod
+    def _term_to_regex(term: str) -> str:
+        words = normalize_text(term).split(" ")
+        parts = [re.escape(w[:-1]) + r"\w*" if w.endswith("*") else re.escape(w) for w in words]
+        return r"\b" + r"\s+".join(parts) + r"\b"
+
+    def _compile(self) -> None:
+        # Un grupo con nombre por (nivel, categoría): m.lastgroup identifica la coincidencia
+        self._groups: Dict[str, tuple] = {}
+        alternatives = []
+        for level, cats in self.lexicon.items():
+            for cat, terms in cats.items():
+                if not terms:
+                    continue
+                name = f"g{len(self._groups)}"
+                self._groups[name] = (level, cat)
+                alternatives.append(f"(?P<{name}>" + "|".join(self._term_to_regex(t) for t in terms) + ")")
+        self._pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    @staticmethod
+    def _negated(normalized: str, start: int) -> bool:
+        """¿Hay una negación en las NEGATION_WINDOW palabras previas, dentro de la misma cláusula?"""
+        prefix = normalized[:start]
+        breaks = list(_NEGATION_SCOPE_BREAK.finditer(prefix))
+        if breaks:
+            prefix = prefix[breaks[-1].end():]
+        return any(w in NEGATORS for w in re.findall(r"\w+", prefix)[-NEGATION_WINDOW:])
+
+    def scan(self, text: str) -> Dict[str, Dict[str, List[str]]]:
+        """Devuelve {nivel: {categoría: [coincidencias]}} para el texto; las negadas, en el nivel "negated"."""
+        hits: Dict[str, Dict[str, List[str]]] = {}
+        if self._pattern is None:
+            return hits
+        normalized = normalize_text(text)
+        for m in self._pattern.finditer(normalized):
+            level, cat = self._groups[m.lastgroup]
+            if self._negated(normalized, m.start()):
+                level = "negated"
+            hits.setdefault(level, {}).setdefault(cat, []).append(m.group(0))
+        return hits
+
+    def _ml_positive_confidence(self, text: str) -> Optional[float]:
+        if not self.ml_enabled:
+            return None
+        try:
+            from backend.services.emotion_ml_service import emotion_ml_service
+            probabilities = emotion_ml_service.predict_proba(text)
+        except Exception as e:
+            logger.debug(f"Nivel ML de triaje no disponible: {e}")
+            return None
+        if not probabilities:
+            return None
+        return probabilities.get("bienestar (positivo)")
+
+    def pre_triage(self, text: str) -> Optional[TriageDecision]:
+        """Decisión local (niveles 1-2) o None si el caso es ambiguo y debe ir al LLM."""
+        hits = self.scan(text)
+
+        critical = hits.get("critical")
+        if critical:
+            found = ", ".join(f"{cat} ('{terms[0]}')" for cat, terms in critical.items())
+            return TriageDecision(
+                risk_found=True,
+                risk_level="critical",
+                explanation=f"⚠️ ALERTA: Señales de urgencia detectadas: {found}. Protocolo de seguridad activado.",
+                tier="lexicon"
+            )
+
+        # Términos ambiguos o negados: decide el LLM (tampoco se descartan por ML)
+        if hits:
+            return None
+
+        positive = self._ml_positive_confidence(text)
+        if positive is not None and positive >= self.ml_safe_threshold:
+            return TriageDecision(
+                risk_found=False,
+                risk_level="low",
+                explanation=f"Relato sin señales de alarma y con tono positivo (confianza {positive:.2f}).",
+                tier="ml"
+            )
+
+        return None
+
+
+# Instancia global
+triage_service = TriageService()
@@ -0,0 +1,308 @@
+"""
+Almacenes vectoriales intercambiables para RagService.
+
+VectorStore es el subconjunto de la API de colecciones de ChromaDB que usa el
+RAG (upsert / delete / query / get / count): una colección de Chroma ya lo
+cumple tal cual, y FlatVectorStore es la alternativa ligera seleccionable con
+RAG_VECTOR_STORE=flat.
+
+FlatVectorStore guarda los embeddings en una matriz .npy float16 mapeada en
+memoria y los documentos/metadatos en un SQLite al lado:
+
+    <dir>/vectors.npy    (capacidad x dim) float16, filas libres a cero
+    <dir>/norms.npy      |x|^2 en float32; inf = fila libre o borrada
+    <dir>/chunks.db      row -> id, documento, metadatos (JSON)
+
+La búsqueda es exacta: productos matriz-vector por bloques sobre el mmap
+(distancia L2 al cuadrado, la misma escala que Chroma por defecto). Los
+workers de gunicorn comparten las páginas de la matriz a través de la caché
+de páginas del sistema, en lugar de cargar cada uno su índice HNSW.
+
+Varios procesos pueden escribir (p. ej. store_feedback desde cada worker): las
+escrituras se serializan con flock sobre <dir>/write.lock y, dentro del lock,
+se reabren los mmap si otro proceso amplió la matriz. Sin fcntl (Windows) solo
+se serializan los hilos del proceso: un único escritor (el sidecar RAG).
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Protocol
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore(Protocol):
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+               metadatas: List[Dict]) -> None: ...
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None: ...
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              include: Optional[List[str]] = None) -> Dict[str, Any]: ...
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]: ...
+
+    def count(self) -> int: ...
+
+
+class FlatVectorStore:
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, dtype: str = None, block_rows: int = None):
+        self.path = path
+        self.dtype = np.dtype(dtype or os.getenv("RAG_FLAT_DTYPE", "float16"))
+        self.block_rows = block_rows or int(os.getenv("RAG_FLAT_BLOCK_ROWS", "4096"))
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._norms_path = os.path.join(path, "norms.npy")
+
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(path, "write.lock"), "a+")
+        self._conn = sqlite3.connect(os.path.join(path, "chunks.db"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._conn.commit()
+
+        self.vectors = None
+        self.norms = None
+        self._inode = None
+        self._writable = False
+        self._open()
+
+    # -------------------------------------------------------------------------
+    # Ficheros mapeados
+    # -------------------------------------------------------------------------
+    def _open(self, writable: bool = False) -> None:
+        """(Re)abre los mmap; en solo lectura mientras nadie escriba en este proceso."""
+        try:
+            inode = os.stat(self._vectors_path).st_ino
+        except FileNotFoundError:
+            self.vectors = self.norms = self._inode = None
+            return
+        mode = "r+" if writable else "r"
+        self.vectors = np.load(self._vectors_path, mmap_mode=mode)
+        self.norms = np.load(self._norms_path, mmap_mode=mode)
+        self._inode = inode
+        self._writable = writable
+
+    def _refresh(self) -> None:
+        """Otro proceso (ingesta) puede haber ampliado la matriz: reabrir si cambió el fichero."""
+        try:
+            inode = os.stat(self._vectors_path).st_ino
+        except FileNotFoundError:
+            return
+        if inode != self._inode:
+            self._open(self._writable)
+
+    @contextmanager
+    def _write_lock(self):
+        """Escritor único entre hilos y procesos; al entrar se ve la matriz que dejó el anterior."""
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _ensure_capacity(self, rows: int, dim: int) -> None:
+        """Crea o amplía (x2) la matriz. Se escribe en ficheros nuevos y se renombran: los lectores no ven una a medias."""
+        if self.vectors is not None:
+            if self.vectors.shape[1] != dim:
+                raise ValueError(f"Dimensión {dim} distinta de la del almacén ({self.vectors.shape[1]})")
+            if rows <= self.vectors.shape[0]:
+                if not self._writable:
+                    self._open(writable=True)
+                return
+        old = self.vectors.shape[0] if self.vectors is not None else 0
+        capacity = max(self.INITIAL_CAPACITY, old)
+        while capacity < rows:
+            capacity *= 2
+
+        # Temporales por proceso: un escritor interrumpido no deja uno a medias para otro
+        vectors_tmp, norms_tmp = f"{self._vectors_path}.{os.getpid()}.tmp", f"{self._norms_path}.{os.getpid()}.tmp"
+        vectors = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=self.dtype, shape=(capacity, dim))
+        norms = np.lib.format.open_memmap(norms_tmp, mode="w+", dtype=np.float32, shape=(capacity,))
+        norms[:] = np.inf
+        if old:
+            for start in range(0, old, self.block_rows):
+                stop = min(start + self.block_rows, old)
+                vectors[start:stop] = self.vectors[start:stop]
+            norms[:old] = self.norms[:old]
+        vectors.flush()
+        norms.flush()
+        del vectors, norms
+        # norms antes que vectors: un lector que vea la matriz nueva ya tiene sus normas
+        os.replace(norms_tmp, self._norms_path)
+        os.replace(vectors_tmp, self._vectors_path)
+        self._open(writable=True)
+
+    # -------------------------------------------------------------------------
+    # API tipo colección de Chroma
+    # -------------------------------------------------------------------------
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]],
+               metadatas: List[Dict]) -> None:
+        if embeddings is None:
+            raise ValueError("FlatVectorStore necesita embeddings calculados (no tiene función de embedding)")
+        if len(set(ids)) != len(ids):
+            raise ValueError("IDs duplicados en el mismo upsert")
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._write_lock():
+            existing = dict(self._conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()) if ids else {}
+            n_rows = self._n_rows()
+            free = self._free_rows(n_rows)
+            rows = []
+            for chunk_id in ids:
+                if chunk_id in existing:
+                    rows.append(existing[chunk_id])
+                elif free:
+                    rows.append(free.pop())
+                else:
+                    rows.append(n_rows)
+                    n_rows += 1
+            self._ensure_capacity(n_rows, matrix.shape[1])
+
+            index = np.asarray(rows)
+            self.vectors[index] = matrix.astype(self.dtype)
+            # Normas de lo realmente almacenado (float16 redondea)
+            stored = self.vectors[index].astype(np.float32)
+            self.vectors.flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(row, chunk_id, doc, json.dumps(meta or {}, ensure_ascii=False))
+                 for row, chunk_id, doc, meta in zip(rows, ids, documents, metadatas)]
+            )
+            self._conn.commit()
+            # La fila solo pasa a ser visible (norma finita) cuando ya está en SQLite
+            self.norms[index] = np.einsum("ij,ij->i", stored, stored)
+            self.norms.flush()
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None:
+        with self._write_lock():
+            if ids:
+                found = self._conn.execute(
+                    f"SELECT row FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+                ).fetchall()
+            elif where:
+                found = self._select_where("row", where)
+            else:
+                return
+            rows = [row for (row,) in found]
+            if not rows:
+                return
+            if not self._writable:
+                self._open(writable=True)
+            self.norms[np.asarray(rows)] = np.inf
+            self.norms.flush()
+            self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._conn.commit()
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        if ids:
+            found = self._conn.execute(
+                f"SELECT id, document, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        elif where:
+            found = self._select_where("id, document, metadata", where)
+            ids = [chunk_id for chunk_id, _, _ in found]
+        else:
+            return {"ids": [], "documents": [], "metadatas": []}
+        by_id = {chunk_id: (doc, json.loads(meta)) for chunk_id, doc, meta in found}
+        ordered = [chunk_id for chunk_id in ids if chunk_id in by_id]
+        return {
+            "ids": ordered,
+            "documents": [by_id[i][0] for i in ordered],
+            "metadatas": [by_id[i][1] for i in ordered],
+        }
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Búsqueda exacta por bloques. Varias consultas comparten cada conversión del bloque."""
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            self._refresh()
+        vectors, norms = self.vectors, self.norms
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        n_rows = min(self._n_rows(), len(vectors)) if vectors is not None else 0
+        if not n_rows:
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+
+        k = min(n_results, n_rows)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_r = np.zeros((len(queries), 0), dtype=np.int64)
+        buffer = np.empty((min(self.block_rows, n_rows), vectors.shape[1]), dtype=np.float32)
+        for start in range(0, n_rows, self.block_rows):
+            stop = min(start + self.block_rows, n_rows)
+            block = buffer[:stop - start]
+            np.copyto(block, vectors[start:stop])
+            # |x - q|^2 = |x|^2 + |q|^2 - 2 x.q  (norma inf = fila libre)
+            dist = norms[start:stop][None, :] + q_norms[:, None] - 2.0 * (queries @ block.T)
+            dist = np.concatenate([best_d, dist], axis=1)
+            rows = np.concatenate([best_r, np.broadcast_to(np.arange(start, stop), (len(queries), stop - start))], axis=1)
+            if dist.shape[1] > k:
+                keep = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                dist = np.take_along_axis(dist, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_d, best_r = dist, rows
+
+        order = np.argsort(best_d, axis=1, kind="stable")
+        best_d = np.take_along_axis(best_d, order, axis=1)
+        best_r = np.take_along_axis(best_r, order, axis=1)
+
+        wanted = {int(r) for r, d in zip(best_r.ravel(), best_d.ravel()) if np.isfinite(d)}
+        found = self._conn.execute(
+            f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(wanted))})",
+            list(wanted)
+        ).fetchall() if wanted else []
+        by_row = {row: (chunk_id, doc, meta) for row, chunk_id, doc, meta in found}
+        for rows, dists in zip(best_r, best_d):
+            hits = [(by_row[int(r)], float(d)) for r, d in zip(rows, dists) if np.isfinite(d) and int(r) in by_row]
+            result["ids"].append([h[0] for h, _ in hits])
+            result["documents"].append([h[1] for h, _ in hits])
+            result["metadatas"].append([json.loads(h[2]) for h, _ in hits])
+            result["distances"].append([max(d, 0.0) for _, d in hits])
+        return result
+
+    # -------------------------------------------------------------------------
+    # Auxiliares
+    # -------------------------------------------------------------------------
+    def _select_where(self, columns: str, where: Dict) -> List[tuple]:
+        """Filtro de igualdad sobre metadatos, como where={"source": ...} de Chroma."""
+        clause = " AND ".join("json_extract(metadata, ?) = ?" for _ in where)
+        params = [p for key, value in where.items() for p in (f"$.{key}", value)]
+        return self._conn.execute(f"SELECT {columns} FROM chunks WHERE {clause}", params).fetchall()
+
+    def _n_rows(self) -> int:
+        """Filas en uso (incluidos huecos de borrados): hasta la mayor fila registrada."""
+        return self._conn.execute("SELECT COALESCE(MAX(row), -1) + 1 FROM chunks").fetchone()[0]
+
+    def _free_rows(self, n_rows: int) -> List[int]:
+        """Huecos de filas borradas por debajo de n_rows, reutilizables en el siguiente upsert."""
+        if self.norms is None or not n_rows:
+            return []
+        return np.flatnonzero(np.isinf(self.norms[:n_rows])).tolist()[::-1]
@@ -0,0 +1,107 @@
+"""
+Pruebas del router LLM (hedging, circuit breaker y failover) con backends fake://.
+
+Uso:
+    python backend/test_llm_router.py      (o con pytest)
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from backend.services.llm_router import LLMRouter
+from backend.services.quota_scheduler import quota_scheduler
+
+logging.getLogger("backend.services.llm_router").setLevel(logging.ERROR)
+logging.getLogger("backend.services.quota_scheduler").setLevel(logging.ERROR)
+
+MESSAGES = [SystemMessage(content="Eres un Oncólogo experto."), HumanMessage(content="Dolor EVA 7")]
+
+
+def make_router(*specs, hedge_delay=0.1):
+    """Router con hedge fijo; cada spec lleva su propia semilla para no compartir cuota entre pruebas."""
+    router = LLMRouter([LLMRouter.make_backend(spec, 0, 0.7) for spec in specs])
+    router.hedge_enabled = True
+    router.hedge_default_delay = hedge_delay
+    router.max_hedges = 1
+    return router
+
+
+def count_next_backend(router):
+    """Envuelve _next_backend para contar cuántas veces se consulta en una llamada."""
+    calls = []
+    original = router._next_backend
+
+    def wrapper(tried):
+        calls.append(1)
+        return original(tried)
+
+    router._next_backend = wrapper
+    return calls
+
+
+def test_hedge_fires():
+    slow, fast = "fake://?latency=800&jitter=0&seed=101", "fake://?latency=50&jitter=0&seed=102"
+    router = make_router(slow, fast)
+    started = time.perf_counter()
+    router.invoke(MESSAGES)
+    elapsed = time.perf_counter() - started
+    stats = router.stats()["backends"]
+    assert stats[fast]["hedges_sent"] == 1 and stats[fast]["wins"] == 1, stats
+    assert elapsed < 0.5, elapsed
+
+
+def test_open_circuit_no_busy_loop():
+    """Hedge vencido con el secundario abierto: se espera al primario sin girar en vacío."""
+    for mode, seed in (("sync", 110), ("async", 120)):
+        slow, down = f"fake://?latency=600&jitter=0&seed={seed}", f"fake://?latency=50&seed={seed + 1}"
+        router = make_router(slow, down)
+        router.backends[1].opened_at = time.monotonic()
+        calls = count_next_backend(router)
+        cpu = time.process_time()
+        if mode == "sync":
+            router.invoke(MESSAGES)
+        else:
+            asyncio.run(router.ainvoke(MESSAGES))
+        cpu = time.process_time() - cpu
+        assert router.backends[0].wins == 1
+        assert len(calls) <= 3, (mode, len(calls))
+        assert cpu < 0.3, (mode, cpu)
+
+
+def test_failover_after_hedge_without_quota():
+    """Un hedge sin cuota no debe impedir el failover cuando luego falla el primario."""
+    failing = "fake://?latency=300&jitter=0&error_rate=1&retry_after=0&seed=131"
+    backup = "fake://?latency=50&jitter=0&seed=132"
+    router = make_router(failing, backup)
+    original = quota_scheduler.try_acquire
+    quota_scheduler.try_acquire = lambda backend, tokens: False
+    try:
+        response = router._route_sync(MESSAGES, "interactive", 100)
+    finally:
+        quota_scheduler.try_acquire = original
+    assert response.content
+    stats = router.stats()["backends"]
+    assert stats[backup]["wins"] == 1 and stats[backup]["hedges_sent"] == 0, stats
+
+
+def test_failover_async():
+    failing = "fake://?latency=50&jitter=0&error_rate=1&retry_after=0&seed=141"
+    backup = "fake://?latency=50&jitter=0&seed=142"
+    router = make_router(failing, backup, hedge_delay=5.0)
+    response = asyncio.run(router._route_async(MESSAGES, "interactive", 100))
+    assert response.content
+    assert router.backends[1].wins == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -22,16 +22,50 @@ const History = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [expandedId, setExpandedId] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // El listado solo trae un extracto: el detalle (texto íntegro + SOAP) se pide al expandir
+  const loadDetail = async (item) => {
+    if (item.detailLoaded || (!item.has_soap_report && !item.raw_text_truncated)) return;
+    try {
+      const detail = await api.getSessionDetail(item.id);
+      setHistory(prev => prev.map(h => h.id === item.id ? { ...h, ...detail, detailLoaded: true } : h));
+    } catch (err) {
+      console.error("Error cargando detalle de sesión:", err);
+    }
+  };
 
   const toggleExpand = (id) => {
-    setExpandedId(expandedId === id ? null : id);
+    const willExpand = expandedId !== id;
+    setExpandedId(willExpand ? id : null);
+    if (willExpand) {
+      const item = history.find(h => h.id === id);
+      if (item) loadDetail(item);
+    }
+  };
+
+  const fetchPage = async (cursor) => {
+    const data = await api.getHistory({ cursor });
+    setHistory(prev => cursor ? [...prev, ...data.items] : data.items);
+    setNextCursor(data.has_more ? data.next_cursor : null);
+  };
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      await fetchPage(nextCursor);
+    } catch (err) {
+      setError("No se pudo cargar el historial.");
+    } finally {
+      setLoadingMore(false);
+    }
   };
 
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const data = await api.getHistory();
-        setHistory(data);
+        await fetchPage(null);
       } catch (err) {
         setError("No se pudo cargar el historial.");
       } finally {
@@ -154,7 +188,7 @@ Generado automáticamente por PsychoWebAI Expert Model.`;
                       {item.risk_flag ? <AlertTriangle size={14} /> : <CheckCircle2 size={14} />}
                       <span>{item.risk_flag ? 'Riesgo' : 'Seguro'}</span>
                     </div>
-                    {item.soap_report && <div className="status-chip-compact primary"><Brain size={14} /><span>IA</span></div>}
+                    {(item.has_soap_report || item.soap_report) && <div className="status-chip-compact primary"><Brain size={14} /><span>IA</span></div>}
                     <div className="expand-icon">{isExpanded ? <ChevronUp size={18} /> : <ChevronDown size={18} />}</div>
                   </div>
                 </div>
@@ -240,6 +274,12 @@ Generado automáticamente por PsychoWebAI Expert Model.`;
               </div>
             );
           })}
+          {nextCursor && (
+            <button className="icon-btn-secondary no-print" onClick={loadMore} disabled={loadingMore}>
+              {loadingMore ? <Loader2 className="spin" size={18} /> : <ChevronDown size={18} />}
+              <span>Cargar más</span>
+            </button>
+          )}
         </div>
       )}
       
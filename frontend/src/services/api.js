@@ -117,11 +117,31 @@ export const contributeToDeSci = async (analysisId, patientDid) => {
 };
 
 /**
- * Obtiene el historial de análisis realizados.
- * @returns {Promise<Array>} Lista de análisis previos.
+ * Obtiene una página del historial de análisis realizados.
+ * @param {object} [options] - Paginación y filtros.
+ * @param {string} [options.cursor] - Cursor devuelto por la página anterior (next_cursor).
+ * @param {number} [options.limit] - Tamaño de página.
+ * @param {string} [options.patientId] - Filtrar por paciente.
+ * @param {boolean} [options.riskFlag] - Filtrar por bandera de riesgo.
+ * @returns {Promise<object>} { items, next_cursor, has_more }.
  */
-export const getHistory = async () => {
-    const { data } = await apiClient.get('/history');
+export const getHistory = async ({ cursor, limit, patientId, riskFlag } = {}) => {
+    const params = {};
+    if (cursor) params.cursor = cursor;
+    if (limit) params.limit = limit;
+    if (patientId) params.patient_id = patientId;
+    if (riskFlag !== undefined) params.risk_flag = riskFlag;
+    const { data } = await apiClient.get('/history', { params });
+    return data;
+};
+
+/**
+ * Obtiene el detalle completo de una sesión (texto íntegro e informe SOAP).
+ * @param {string} sessionId - El ID de la sesión.
+ * @returns {Promise<object>} La sesión completa.
+ */
+export const getSessionDetail = async (sessionId) => {
+    const { data } = await apiClient.get(`/session/${encodeURIComponent(sessionId)}`);
     return data;
 };
 